@@ -0,0 +1,143 @@
+#Generated corpus of Play Store-sized app pages for the benchmarks
+
+import json
+import random
+from datetime import datetime, timezone
+from play_store_fetcher import (DEFAULT_EXTRACTION_SPEC, format_blob_count, format_blob_installs, format_blob_rating,
+                                format_blob_timestamp)
+
+DEFAULT_PAGE_SIZE = 600_000
+DEFAULT_CORPUS_SEED = 2025
+INSTALL_TIERS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000, 1_000_000_000, 5_000_000_000)
+FILLER_WORDS = ("play", "store", "app", "games", "install", "free", "offers", "purchases", "rated", "everyone",
+                "about", "this", "data", "safety", "ratings", "reviews", "phone", "tablet", "chromebook", "similar")
+FILLER_CLASSES = ("VfPpkd-RLmnJb", "Qy5cde", "hnnXjf", "ULeU3b", "Si6A0c", "nIK8Pd", "kuvzJc", "bARER", "UIuSk", "ubGTjb")
+
+def set_data_blob_value(app_data: list, path: list[int], value: any) -> None:
+    """
+    Sets a value in the embedded app data at the given path of list indexes, creating the lists on the way.
+
+    Args:
+        app_data (list): The app data.
+        path (list[int]): The indexes leading to the value.
+        value (any): The value.
+
+    Returns:
+        None
+    """
+    node = app_data
+    for depth, index in enumerate(path):
+        while len(node) <= index:
+            node.append(None)
+        if depth == len(path) - 1:
+            node[index] = value
+        elif node[index] is None:
+            node[index] = []
+        node = node[index]
+
+def generate_filler_markup(rng: random.Random, package: str) -> str:
+    """
+    Generates a block of nested markup like the lists of similar apps and the data safety sections of a store page.
+
+    Args:
+        rng (random.Random): Random number generator of the page.
+        package (str): The package of the page.
+
+    Returns:
+        str: The markup.
+    """
+    words = " ".join(rng.choice(FILLER_WORDS) for _ in range(rng.randint(4, 16)))
+    return (f'<div class="{rng.choice(FILLER_CLASSES)}"><div class="{rng.choice(FILLER_CLASSES)} {rng.choice(FILLER_CLASSES)}">'
+            f'<span jsname="{rng.randrange(10 ** 6):06d}">{words}</span>'
+            f'<a href="/store/apps/details?id={package}.similar{rng.randrange(1000)}" aria-label="{words}">{words.title()}</a>'
+            f'<img src="https://play-lh.googleusercontent.com/{rng.randrange(10 ** 12):x}=w240-h480" alt="" loading="lazy"></div></div>')
+
+def generate_filler_script(rng: random.Random, blob_number: int) -> str:
+    """
+    Generates an `AF_initDataCallback` payload of another data key, like the payloads preceding the app data.
+
+    Args:
+        rng (random.Random): Random number generator of the page.
+        blob_number (int): Number of the data key, e.g. 4 for 'ds:4'.
+
+    Returns:
+        str: The script element.
+    """
+    data = [[rng.choice(FILLER_WORDS), rng.random(), [rng.randrange(10 ** 9), None, [rng.choice(FILLER_WORDS)] * rng.randint(1, 8)]]
+            for _ in range(rng.randint(20, 80))]
+    return f"<script nonce=\"bench\">AF_initDataCallback({{key: 'ds:{blob_number}', hash: '{rng.randrange(100)}', data:{json.dumps(data)}, sideChannel: {{}}}});</script>"
+
+def generate_app_page(package: str, rng: random.Random, page_size: int = DEFAULT_PAGE_SIZE) -> tuple[str, tuple[str, str, str, str]]:
+    """
+    Generates a synthetic app page in the layout of the store page, with the data points both rendered in the html
+    and embedded in the 'ds:5' app data, padded with filler markup and payloads to about `page_size` characters.
+
+    Args:
+        package (str): The package of the page.
+        rng (random.Random): Random number generator, seeded for a reproducible page.
+        page_size (int): Approximate size of the page in characters.
+
+    Returns:
+        tuple[str, tuple[str, str, str, str]]: The page, and the rating, downloads, reviews and last update
+        `get_app_info_from_html` extracts from it.
+    """
+    rating = round(rng.uniform(1.0, 5.0), 1)
+    installs = rng.choice(INSTALL_TIERS)
+    reviews = int(10 ** rng.uniform(1, 8))
+    updated = int(datetime(rng.randint(2015, 2025), rng.randint(1, 12), rng.randint(1, 28), tzinfo=timezone.utc).timestamp())
+    expected = (format_blob_rating(rating), format_blob_installs(installs), format_blob_count(reviews), format_blob_timestamp(updated))
+
+    app_data = []
+    for data_key, value in (("star_rating", rating), ("download_count", installs), ("review_count", reviews), ("last_updated_time", updated)):
+        set_data_blob_value(app_data, DEFAULT_EXTRACTION_SPEC[data_key]["data_blob_path"], value)
+    rendered_data = f'''
+    <div class="l8YSdd">
+        <div class="w7Iutd">
+            <div class="wVqUob">
+                <div class="ClM7O"><div itemprop="starRating"><div class="TT9eCd">{expected[0]}<i>star</i></div></div></div>
+                <div class="g1rdde">{expected[2]} reviews</div>
+            </div>
+            <div class="wVqUob">
+                <div class="ClM7O">{expected[1]}</div>
+                <div class="g1rdde">Downloads</div>
+            </div>
+        </div>
+    </div>
+    <div class="xg1aie">{expected[3]}</div>
+'''
+    #The app data sits between other payloads, and the rendered data between other sections, like on the store page
+    head_scripts, body_blocks = [], []
+    head_size = body_size = 0
+    blob_number = 1
+    while head_size < page_size // 2:
+        head_scripts.append(generate_filler_script(rng, blob_number if blob_number != 5 else 99))
+        head_size += len(head_scripts[-1])
+        blob_number += 1
+    while body_size < page_size // 2:
+        body_blocks.append(generate_filler_markup(rng, package))
+        body_size += len(body_blocks[-1])
+    head_scripts.insert(len(head_scripts) // 2, f"<script nonce=\"bench\">AF_initDataCallback({{key: 'ds:5', hash: '7', data:{json.dumps(app_data)}, sideChannel: {{}}}});</script>")
+    body_blocks.insert(len(body_blocks) // 3, rendered_data)
+    page = (f'<!doctype html><html lang="en"><head><meta charset="utf-8"><title>{package} - Apps on Google Play</title>'
+            f'{"".join(head_scripts)}</head><body>{"".join(body_blocks)}</body></html>')
+    return page, expected
+
+def generate_corpus(pages: int, page_size: int = DEFAULT_PAGE_SIZE, seed: int = DEFAULT_CORPUS_SEED) -> list[tuple[str, str, tuple[str, str, str, str]]]:
+    """
+    Generates a reproducible corpus of app pages.
+
+    Args:
+        pages (int): Number of pages.
+        page_size (int): Approximate size of each page in characters.
+        seed (int): Seed of the corpus. The same seed gives the same pages.
+
+    Returns:
+        list[tuple[str, str, tuple[str, str, str, str]]]: The package, the page and the expected data points of each page.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for page_number in range(pages):
+        package = f"com.benchmark.app{page_number}"
+        page, expected = generate_app_page(package, rng, page_size)
+        corpus.append((package, page, expected))
+    return corpus
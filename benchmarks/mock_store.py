@@ -0,0 +1,383 @@
+#Local stand-in for the Play Store, serving synthetic app pages for load and throughput tests
+#
+#Run from the repository root, then point the fetcher at it with --base_url:
+#   python -m benchmarks.mock_store --port 8080 --not_found_rate 0.1 --rate_limit 50 --latency lognormal:0.15,0.5
+#   python play_store_fetcher.py --package_listing packages.csv --base_url http://127.0.0.1:8080 --workers 16
+
+import argparse
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from play_store_fetcher import parse_compact_count
+from benchmarks.corpus import DEFAULT_CORPUS_SEED, DEFAULT_PAGE_SIZE, generate_corpus
+
+DEFAULT_PAGES = 32
+DEFAULT_RETRY_AFTER = 1.0
+ERROR_STATUS_CODES = (500, 502, 503)
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+#Chunk size of the bandwidth capped response bodies
+BANDWIDTH_CHUNK_SIZE = 16 * 1024
+
+class LatencyDistribution:
+    """
+    Distribution of the time the stand-in server waits before it answers a request, given as `kind:parameters`:
+    - `fixed:seconds`, or just the seconds, e.g. "0.05".
+    - `uniform:low,high`, e.g. "uniform:0.05,0.3".
+    - `exponential:mean`, e.g. "exponential:0.1".
+    - `lognormal:median,sigma`, e.g. "lognormal:0.15,0.5". Mostly close to the median with a long tail, like the
+      response times of a real server.
+
+    Attributes:
+        kind (str): The kind of distribution.
+        parameters (tuple[float, ...]): The parameters of the distribution.
+    """
+
+    def __init__(self, spec: str = "0"):
+        """
+        Parses the distribution.
+
+        Args:
+            spec (str): The distribution, see the class description. Defaults to no latency.
+
+        Raises:
+            ValueError: If the spec is not a latency distribution.
+        """
+        kind, _, parameters = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+        self.kind = kind.strip().lower()
+        self.parameters = tuple(float(parameter) for parameter in parameters.split(","))
+        parameter_counts = {"fixed": 1, "uniform": 2, "exponential": 1, "lognormal": 2}
+        if parameter_counts.get(self.kind) != len(self.parameters) or min(self.parameters) < 0:
+            raise ValueError(f"Invalid latency, expected one of {', '.join(LATENCY_DISTRIBUTIONS)} with non-negative parameters: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        """
+        Draws a latency from the distribution.
+
+        Args:
+            rng (random.Random): The random number generator.
+
+        Returns:
+            float: The latency in seconds.
+        """
+        if self.kind == "uniform":
+            return rng.uniform(*self.parameters)
+        if self.kind == "exponential":
+            return rng.expovariate(1 / self.parameters[0]) if self.parameters[0] > 0 else 0.0
+        if self.kind == "lognormal":
+            median, sigma = self.parameters
+            return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return self.parameters[0]
+
+def parse_bandwidth(value: str) -> float:
+    """
+    Parses a bandwidth in bytes per second, e.g. "500K" or "2M".
+
+    Args:
+        value (str): The bandwidth. 0 is unlimited.
+
+    Returns:
+        float: Bytes per second.
+
+    Raises:
+        ValueError: If the value is not a bandwidth.
+    """
+    bandwidth = parse_compact_count(value)
+    if bandwidth is None or bandwidth < 0:
+        raise ValueError(f"Invalid bandwidth, expected bytes per second like 500K or 2M: {value}")
+    return bandwidth
+
+class MockPlayStore:
+    """
+    Local HTTP server standing in for the Play Store, serving synthetic app pages at `/store/apps/details?id=<package>`.
+
+    The pages are generated by `generate_corpus` in the layout `get_app_info_from_html` expects. A package of the corpus
+    gets its own page, any other package one of the corpus pages picked by a hash of the package, so every package has
+    a page and always the same one. Requests are answered, in this order:
+    - 429 with `Retry-After` if the `rate_limit` of requests per second of all clients is exceeded. The `Retry-After`
+      time is the time until the next request is allowed, rounded up to whole seconds.
+    - 429 with `Retry-After: retry_after` for a `throttle_rate` share of the requests.
+    - 500, 502 or 503 for an `error_rate` share of the requests. A 503 also has a `Retry-After`.
+    - 404 for a `not_found_rate` share of the packages. The same packages are missing in every request.
+    - 304 if the `If-None-Match` header holds the `ETag` of the page, otherwise 200 with the page.
+
+    Every answer is delayed by a latency drawn from `latency`, and the bodies are sent at no more than `bandwidth`
+    bytes per second per response. The random decisions are seeded, so a run with one client is reproducible.
+
+    Attributes:
+        base_url (str): Base url of the server, for `--base_url` or `configure_base_url`.
+        status_counts (Counter): Number of responses by HTTP status.
+    """
+
+    def __init__(self, pages: int = DEFAULT_PAGES, page_size: int = DEFAULT_PAGE_SIZE, seed: int = DEFAULT_CORPUS_SEED,
+                 not_found_rate: float = 0.0, throttle_rate: float = 0.0, error_rate: float = 0.0, rate_limit: float = 0.0,
+                 retry_after: float = DEFAULT_RETRY_AFTER, latency: LatencyDistribution = None, bandwidth: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, corpus: list = None):
+        """
+        Generates the pages and binds the server. The server answers requests once it is started.
+
+        Args:
+            pages (int): Number of pages generated. Defaults to 32.
+            page_size (int): Approximate size of a page in characters. Defaults to the size of a store page.
+            seed (int): Seed of the pages and of the random decisions.
+            not_found_rate (float): Share of the packages answered with 404.
+            throttle_rate (float): Share of the requests answered with 429.
+            error_rate (float): Share of the requests answered with a 5xx error.
+            rate_limit (float): Requests per second allowed before requests are answered with 429. 0 is unlimited.
+            retry_after (float): Seconds of the `Retry-After` header of the throttled and 503 responses.
+            latency (LatencyDistribution): Distribution of the time before a request is answered. Defaults to none.
+            bandwidth (float): Bytes per second a response body is sent with. 0 is unlimited.
+            host (str): Address the server listens on. Defaults to the loopback address.
+            port (int): Port the server listens on. Defaults to 0, a free port.
+            corpus (list): Pages from `generate_corpus` to serve instead of generating `pages` pages.
+        """
+        self.corpus = corpus if corpus is not None else generate_corpus(pages, page_size, seed)
+        self.bodies = [page.encode("utf-8") for _, page, _ in self.corpus]
+        self.etags = [f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"' for body in self.bodies]
+        self.page_numbers = {package: page_number for page_number, (package, _, _) in enumerate(self.corpus)}
+        self.not_found_rate = not_found_rate
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.latency = latency or LatencyDistribution()
+        self.bandwidth = bandwidth
+        self.status_counts = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        #Token bucket of the rate limit, allowing bursts of a second of requests
+        self._tokens = max(1.0, rate_limit)
+        self._token_time = time.monotonic()
+        self._server = ThreadingHTTPServer((host, port), MockStoreHandler)
+        self._server.daemon_threads = True
+        self._server.store = self
+        self._thread = None
+        self.base_url = f"http://{host}:{self._server.server_address[1]}"
+
+    def get_hash_share(self, package: str) -> float:
+        """
+        Maps a package to a number between 0 and 1, the same for the package in every run.
+
+        Args:
+            package (str): The package.
+
+        Returns:
+            float: The number.
+        """
+        return int.from_bytes(hashlib.blake2b(package.encode("utf-8"), digest_size=8).digest(), "big") / 2 ** 64
+
+    def get_page_number(self, package: str) -> int:
+        """
+        Returns the number of the corpus page served for a package.
+
+        Args:
+            package (str): The package.
+
+        Returns:
+            int: The page number.
+        """
+        page_number = self.page_numbers.get(package)
+        return page_number if page_number is not None else int(self.get_hash_share(package + ":page") * len(self.bodies))
+
+    def is_missing(self, package: str) -> bool:
+        """
+        Returns True if the package is answered with 404.
+
+        Args:
+            package (str): The package.
+
+        Returns:
+            bool: True if the package is missing.
+        """
+        return self.get_hash_share(package) < self.not_found_rate
+
+    def get_expected(self, package: str) -> tuple[str, str, str, str]:
+        """
+        Returns the data points `get_app_info_from_html` extracts from the page of a package.
+
+        Args:
+            package (str): The package.
+
+        Returns:
+            tuple[str, str, str, str]: The rating, downloads, reviews and last update.
+        """
+        return self.corpus[self.get_page_number(package)][2]
+
+    def take_token(self) -> float:
+        """
+        Takes a token from the rate limit bucket.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until the next token.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(max(1.0, self.rate_limit), self._tokens + (now - self._token_time) * self.rate_limit)
+            self._token_time = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_limit
+
+    def answer(self, path: str, if_none_match: str = None) -> tuple[int, dict[str, str], bytes, float]:
+        """
+        Decides the answer to a request.
+
+        Args:
+            path (str): The path and query of the request.
+            if_none_match (str): The `If-None-Match` header of the request, if any.
+
+        Returns:
+            tuple[int, dict[str, str], bytes, float]: The HTTP status, the headers, the body and the latency in seconds.
+        """
+        url = urlsplit(path)
+        package = parse_qs(url.query).get("id", [""])[0]
+        with self._lock:
+            latency = self.latency.sample(self._rng)
+            throttled = self._rng.random() < self.throttle_rate
+            error_status = self._rng.choice(ERROR_STATUS_CODES) if self._rng.random() < self.error_rate else None
+        headers = {"Content-Type": "text/html; charset=utf-8"}
+        token_wait = self.take_token() if self.rate_limit > 0 else 0.0
+        if token_wait > 0 or throttled:
+            status, body = 429, b"Too Many Requests"
+            headers["Retry-After"] = str(math.ceil(token_wait) if token_wait > 0 else math.ceil(self.retry_after))
+        elif error_status is not None:
+            status, body = error_status, b"Server Error"
+            if error_status == 503:
+                headers["Retry-After"] = str(math.ceil(self.retry_after))
+        elif url.path != "/store/apps/details" or not package or self.is_missing(package):
+            status, body = 404, b"Not Found"
+        else:
+            page_number = self.get_page_number(package)
+            headers["ETag"] = self.etags[page_number]
+            if if_none_match == self.etags[page_number]:
+                status, body = 304, b""
+            else:
+                status, body = 200, self.bodies[page_number]
+        with self._lock:
+            self.status_counts[status] += 1
+        return status, headers, body, latency
+
+    def start(self) -> "MockPlayStore":
+        """
+        Starts answering requests on a background thread.
+
+        Returns:
+            MockPlayStore: The server.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """
+        Answers requests on the calling thread until the process is interrupted.
+
+        Returns:
+            None
+        """
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        """
+        Stops the server started with `start`.
+
+        Returns:
+            None
+        """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> "MockPlayStore":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+class MockStoreHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of a `MockPlayStore`, keeping connections alive like the store does.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        store = self.server.store
+        status, headers, body, latency = store.answer(self.path, self.headers.get("If-None-Match"))
+        if latency > 0:
+            time.sleep(latency)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if store.bandwidth <= 0:
+            self.wfile.write(body)
+            return
+        #Send the body in chunks, each no earlier than the bandwidth allows
+        send_start = time.monotonic()
+        for chunk_start in range(0, len(body), BANDWIDTH_CHUNK_SIZE):
+            self.wfile.write(body[chunk_start:chunk_start + BANDWIDTH_CHUNK_SIZE])
+            ahead = (chunk_start + BANDWIDTH_CHUNK_SIZE) / store.bandwidth - (time.monotonic() - send_start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    def log_message(self, *args) -> None:
+        pass
+
+def parse_mock_store_arguments(argv: list[str] = None) -> argparse.Namespace:
+    """
+    Parses command-line arguments of the stand-in server.
+
+    Args:
+        argv (list[str]): The command-line arguments. Defaults to `sys.argv`.
+
+    Returns:
+        argparse.Namespace: A namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.mock_store", description="Local stand-in for the Play Store serving synthetic app pages, for load tests with --base_url")
+    parser.add_argument('--host', default="127.0.0.1", help="Optional address to listen on. Defaults to 127.0.0.1.")
+    parser.add_argument('--port', type=int, default=8080, help="Optional port to listen on. Defaults to 8080.")
+    parser.add_argument('--pages', type=int, default=DEFAULT_PAGES, help="Optional number of distinct pages generated. Every package is served one of them. Defaults to 32.")
+    parser.add_argument('--page_size', type=int, default=DEFAULT_PAGE_SIZE, help="Optional approximate size of a page in characters. Defaults to 600000, about the size of a store page.")
+    parser.add_argument('--seed', type=int, default=DEFAULT_CORPUS_SEED, help="Optional seed of the pages and of the random answers.")
+    parser.add_argument('--not_found_rate', type=float, default=0.0, help="Optional share of the packages answered with 404, e.g. 0.1. Defaults to 0.")
+    parser.add_argument('--throttle_rate', type=float, default=0.0, help="Optional share of the requests answered with 429 and a Retry-After header. Defaults to 0.")
+    parser.add_argument('--error_rate', type=float, default=0.0, help="Optional share of the requests answered with 500, 502 or 503. Defaults to 0.")
+    parser.add_argument('--rate_limit', type=float, default=0.0, help="Optional requests per second of all clients above which requests are answered with 429 and the time until the next allowed request as Retry-After. 0 is unlimited. Defaults to 0.")
+    parser.add_argument('--retry_after', type=float, default=DEFAULT_RETRY_AFTER, help="Optional seconds of the Retry-After header of --throttle_rate and 503 responses. Defaults to 1.")
+    parser.add_argument('--latency', type=LatencyDistribution, default=LatencyDistribution(), help="Optional delay before each answer: seconds, uniform:low,high, exponential:mean or lognormal:median,sigma. Defaults to 0.")
+    parser.add_argument('--bandwidth', type=parse_bandwidth, default=0.0, help="Optional bytes per second each response body is sent with, e.g. 500K or 2M. 0 is unlimited. Defaults to 0.")
+    return parser.parse_args(argv)
+
+def main(argv: list[str] = None) -> None:
+    """
+    Runs the stand-in server until it is interrupted, then prints the number of responses by HTTP status.
+
+    Args:
+        argv (list[str]): The command-line arguments. Defaults to `sys.argv`.
+
+    Returns:
+        None
+    """
+    args = parse_mock_store_arguments(argv)
+    store = MockPlayStore(args.pages, args.page_size, args.seed, args.not_found_rate, args.throttle_rate, args.error_rate,
+                          args.rate_limit, args.retry_after, args.latency, args.bandwidth, args.host, args.port)
+    print(f"Serving {len(store.bodies)} synthetic store pages at {store.base_url}, stop with Ctrl+C")
+    store.serve_forever()
+    print(f"Responses: {', '.join(f'{status}: {count}' for status, count in sorted(store.status_counts.items())) or 'none'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+#Benchmarks of the extraction, cache, output and fetch paths of play_store_fetcher
+#
+#Run from the repository root:
+#   python -m benchmarks.run_benchmarks --output benchmarks/results/baseline.json
+#   python -m benchmarks.run_benchmarks --compare benchmarks/results/baseline.json
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+import play_store_fetcher
+from benchmarks.corpus import DEFAULT_CORPUS_SEED, DEFAULT_PAGE_SIZE, generate_corpus
+from benchmarks.mock_store import MockPlayStore
+
+BENCHMARKS = ("extraction", "cache_read", "cache_lookup", "append_to_csv", "end_to_end", "import_time")
+DEFAULT_CACHE_SIZES = (1_000_000, 10_000_000)
+DEFAULT_MIN_TIME = 1.0
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.10
+#Modules only imported on first use, a fresh import of play_store_fetcher must not load them
+LAZY_MODULES = ("requests", "urllib3", "bs4", "lxml", "dateutil", "asyncio", "concurrent.futures", "email.utils")
+BENCHMARK_REGIONS = ("US", "FI", "JP", "DE", "GB", "FR", "BR", "IN", "KR", "SE")
+#Module state of play_store_fetcher set by its configure_* functions, which the end to end benchmark sets for its runs
+FETCHER_STATE = ("_OUTPUT_SINK", "_COLUMNAR_SINK", "_SESSION", "_SESSION_TIMEOUT", "_BASE_URL", "_RATE_LIMITER", "_HTML_ARCHIVE", "_SCHEDULER",
+                 "_SHARD", "_METRICS", "_REFRESH_CACHED", "_PAGE_VALIDATORS", "_STALENESS_POLICY", "_MAX_ATTEMPTS", "_MAX_THROTTLED_ATTEMPTS", "_BACKOFF_BASE",
+                 "_BACKOFF_CAP")
+#Parts of the state the configure_* functions close when they are replaced
+FETCHER_RESOURCES = ("_OUTPUT_SINK", "_COLUMNAR_SINK", "_SESSION", "_HTML_ARCHIVE", "_METRICS")
+
+def measure_rate(operation: Callable[[], int], min_time: float = DEFAULT_MIN_TIME, repeat: int = DEFAULT_REPEAT) -> float:
+    """
+    Measures how many operations per second a function runs, as the best of `repeat` rounds.
+
+    Each round calls `operation` until at least `min_time` seconds have passed. Taking the best round leaves out
+    rounds slowed down by other processes.
+
+    Args:
+        operation (Callable[[], int]): Function running a batch of operations and returning their number.
+        min_time (float): Minimum seconds of a round.
+        repeat (int): Number of rounds.
+
+    Returns:
+        float: Operations per second of the best round.
+    """
+    best_rate = 0.0
+    for _ in range(repeat):
+        operations = 0
+        round_start = time.perf_counter()
+        while (elapsed := time.perf_counter() - round_start) < min_time:
+            operations += operation()
+        best_rate = max(best_rate, operations / elapsed)
+    return best_rate
+
+def result(value: float, unit: str, higher_is_better: bool = True, **details) -> dict:
+    """
+    Forms the result of a benchmark.
+
+    Args:
+        value (float): The measured value.
+        unit (str): Unit of the value, e.g. "pages/s".
+        higher_is_better (bool): True if a higher value is an improvement.
+        **details: Further details of the measurement, kept in the results file.
+
+    Returns:
+        dict: The result.
+    """
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better, **details}
+
+def write_cache_csv(cache_csv_path: str, entries: int, regions: int = len(BENCHMARK_REGIONS)) -> None:
+    """
+    Writes a cache csv file of `entries` package/region pairs, each package in `regions` regions.
+
+    Args:
+        cache_csv_path (str): Path to the cache csv file.
+        entries (int): Number of pairs.
+        regions (int): Number of regions of each package.
+
+    Returns:
+        None
+    """
+    fetched_at = int(time.time())
+    with open(cache_csv_path, "w", newline='', encoding="utf-8") as cache_file:
+        for entry in range(entries):
+            cache_file.write(f"com.benchmark.app{entry // regions};{BENCHMARK_REGIONS[entry % regions]};{fetched_at}\n")
+
+def benchmark_extraction(corpus: list, min_time: float, repeat: int) -> dict[str, dict]:
+    """
+    Measures the pages per second `get_app_info_from_html` extracts with each parser backend.
+
+    Args:
+        corpus (list): Pages from `generate_corpus`.
+        min_time (float): Minimum seconds of a round.
+        repeat (int): Number of rounds.
+
+    Returns:
+        dict[str, dict]: A result per parser backend.
+    """
+    results = {}
+    pages = [page for _, page, _ in corpus]
+    page_bytes = sum(len(page.encode("utf-8")) for page in pages) / len(pages)
+    for parser_backend in play_store_fetcher.PARSER_BACKENDS:
+        play_store_fetcher.configure_parser_backend(parser_backend)
+        try:
+            #A backend returning wrong data points would make the numbers meaningless
+            for _, page, expected in corpus:
+                if play_store_fetcher.get_app_info_from_html(page) != expected:
+                    raise AssertionError(f"The {parser_backend} backend extracted wrong data points from the corpus")
+            rate = measure_rate(lambda: sum(1 for page in pages if play_store_fetcher.get_app_info_from_html(page)), min_time, repeat)
+        finally:
+            play_store_fetcher.configure_parser_backend(play_store_fetcher.DEFAULT_PARSER_BACKEND)
+        results[f"extraction.{parser_backend}"] = result(rate, "pages/s", page_bytes=int(page_bytes), mb_per_second=rate * page_bytes / 1e6)
+    return results
+
+def benchmark_cache(cache_sizes: list[int], work_folder: str, min_time: float, repeat: int) -> dict[str, dict]:
+    """
+    Measures how long `read_cached_packages` takes to load cache files of the given sizes, and the lookups per second
+    of `package_is_cached` on the loaded index, half of them hits and half misses.
+
+    Args:
+        cache_sizes (list[int]): Numbers of package/region pairs in the cache file.
+        work_folder (str): Folder the cache files are written to.
+        min_time (float): Minimum seconds of a lookup round.
+        repeat (int): Number of rounds.
+
+    Returns:
+        dict[str, dict]: A load time and a lookup rate result per cache size.
+    """
+    results = {}
+    rng = random.Random(DEFAULT_CORPUS_SEED)
+    for cache_size in cache_sizes:
+        output_prefix = f"{work_folder}/cache_{cache_size}_"
+        write_cache_csv(f"{output_prefix}{play_store_fetcher.CACHE_FILE}", cache_size)
+        load_seconds = float("inf")
+        for _ in range(repeat):
+            load_start = time.perf_counter()
+            cache = play_store_fetcher.read_cached_packages(output_prefix)
+            load_seconds = min(load_seconds, time.perf_counter() - load_start)
+        os.remove(f"{output_prefix}{play_store_fetcher.CACHE_FILE}")
+        results[f"cache_read.{cache_size}"] = result(load_seconds, "s", higher_is_better=False, pairs=len(cache), pairs_per_second=len(cache) / load_seconds)
+
+        packages = cache_size // len(BENCHMARK_REGIONS)
+        lookups = [(f"com.benchmark.app{rng.randrange(packages * 2)}", rng.choice(BENCHMARK_REGIONS)) for _ in range(100_000)]
+        rate = measure_rate(lambda: sum(1 for package, region in lookups if play_store_fetcher.package_is_cached(cache, package, region) or True), min_time, repeat)
+        results[f"cache_lookup.{cache_size}"] = result(rate, "lookups/s")
+        del cache
+    return results
+
+def benchmark_append_to_csv(work_folder: str, min_time: float, repeat: int) -> dict[str, dict]:
+    """
+    Measures the rows per second `append_to_csv` writes, opening the file for each row and through a `BufferedCsvSink`.
+
+    Args:
+        work_folder (str): Folder the csv files are written to.
+        min_time (float): Minimum seconds of a round.
+        repeat (int): Number of rounds.
+
+    Returns:
+        dict[str, dict]: A result per output mode.
+    """
+    results = {}
+    row = ["com.benchmark.app", "US", "4.5", "2.64M", "100M+", "Jan 01, 2025"]
+    csv_path = f"{work_folder}/{play_store_fetcher.OUTPUT_FOUND_CSV_FILE}"
+
+    def append_rows() -> int:
+        for _ in range(1000):
+            play_store_fetcher.append_to_csv(csv_path, row)
+        return 1000
+
+    results["append_to_csv.unbuffered"] = result(measure_rate(append_rows, min_time, repeat), "rows/s")
+    play_store_fetcher.configure_output_sink(play_store_fetcher.BufferedCsvSink())
+    try:
+        results["append_to_csv.buffered"] = result(measure_rate(append_rows, min_time, repeat), "rows/s")
+    finally:
+        play_store_fetcher.configure_output_sink(None)
+    os.remove(csv_path)
+    return results
+
+@contextlib.contextmanager
+def isolated_fetcher_state() -> Iterator[None]:
+    """
+    Restores the module state of play_store_fetcher after the `with` block, whatever the block configured.
+
+    The sessions, sinks, archive and metrics configured before the block are set aside rather than closed, and the
+    session configured in the block is closed when it ends.
+
+    Returns:
+        Iterator[None]: The context of the block.
+    """
+    saved_state = {name: getattr(play_store_fetcher, name) for name in FETCHER_STATE}
+    for name in FETCHER_RESOURCES:
+        setattr(play_store_fetcher, name, None)
+    try:
+        yield
+    finally:
+        if play_store_fetcher._SESSION is not None:
+            play_store_fetcher._SESSION.close()
+        for name, value in saved_state.items():
+            setattr(play_store_fetcher, name, value)
+
+def benchmark_end_to_end(corpus: list, work_folder: str, workers: int) -> dict[str, dict]:
+    """
+    Measures the package/region pairs per second a full fetch run writes, against a `MockPlayStore` serving the corpus.
+
+    Every backend fetches each page of the corpus in two regions into a fresh output folder, with the packages read from
+    a listing file written to the work folder. The runs use no rate limit, sinks, metrics, shard or scheduler, and the
+    module state configured before the benchmark is restored afterwards. The console status lines are discarded, so the
+    terminal does not slow the run down.
+
+    Args:
+        corpus (list): Pages from `generate_corpus`.
+        work_folder (str): Folder of the output files.
+        workers (int): Number of worker threads of the threads backend, and requests in flight of the asyncio backend.
+
+    Returns:
+        dict[str, dict]: A result per fetch backend.
+    """
+    results = {}
+    listing_path = os.path.join(work_folder, "end_to_end_packages.csv")
+    with open(listing_path, "w", encoding="utf-8") as listing_file:
+        listing_file.write("package_name\n")
+        listing_file.writelines(f"{package}\n" for package, _, _ in corpus)
+    packages = play_store_fetcher.read_package_names(listing_path, header=True)
+    regions = ["US", "FI"]
+    backends = ["threads", "asyncio"] if play_store_fetcher.import_aiohttp() is not None else ["threads"]
+    with MockPlayStore(corpus=corpus) as store, isolated_fetcher_state():
+        play_store_fetcher.configure_base_url(store.base_url)
+        play_store_fetcher.configure_rate_limiter(None)
+        play_store_fetcher.configure_retries()
+        play_store_fetcher.configure_revalidation(False)
+        play_store_fetcher.configure_staleness(None)
+        play_store_fetcher.configure_shard(None)
+        play_store_fetcher.configure_scheduler(None)
+        for backend in backends:
+            output_prefix = f"{work_folder}/end_to_end_{backend}/"
+            success, error_message = play_store_fetcher.init_checks(listing_path, output_prefix)
+            if not success:
+                raise RuntimeError(error_message)
+            play_store_fetcher.configure_session(workers)
+            cache = play_store_fetcher.read_cached_packages(output_prefix)
+            run_start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                if backend == "asyncio":
+                    asyncio.run(play_store_fetcher.fetch_playstore_data_async(output_prefix, cache, packages, regions, False, workers))
+                else:
+                    play_store_fetcher.fetch_playstore_data_concurrently(output_prefix, cache, packages, regions, False, workers)
+            run_seconds = time.perf_counter() - run_start
+            pairs = len(play_store_fetcher.read_cached_packages(output_prefix))
+            if pairs != len(packages) * len(regions):
+                raise AssertionError(f"The {backend} backend fetched {pairs} of {len(packages) * len(regions)} pairs")
+            results[f"end_to_end.{backend}"] = result(pairs / run_seconds, "pairs/s", workers=workers, pairs=pairs)
+    return results
+
+def benchmark_import_time(repeat: int) -> dict[str, dict]:
+    """
+    Measures the milliseconds fresh interpreters take to import play_store_fetcher and to print the `--help` of the
+    command line, as the best of `repeat` runs, and the interpreter startup they include.
+
+    The module is imported from its bytecode cache, which a first run writes. The command line is run with
+    `python -m play_store_fetcher`, which also uses the cache, unlike running the file as a script.
+
+    Args:
+        repeat (int): Number of runs.
+
+    Returns:
+        dict[str, dict]: A result for the interpreter startup, the import and the help.
+
+    Raises:
+        AssertionError: If the import loads a module that should only be imported on first use.
+    """
+    repository_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = {name: value for name, value in os.environ.items() if name != "PYTHONDONTWRITEBYTECODE"}
+    check_script = f"import sys, play_store_fetcher; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    loaded_modules = subprocess.run([sys.executable, "-c", check_script], cwd=repository_folder, env=environment,
+                                    capture_output=True, text=True, check=True).stdout.strip()
+    if loaded_modules:
+        raise AssertionError(f"Importing play_store_fetcher loads {loaded_modules}")
+    results = {}
+    commands = {"startup": ["-c", "pass"], "module": ["-c", "import play_store_fetcher"], "help": ["-m", "play_store_fetcher", "--help"]}
+    for name, command in commands.items():
+        best_seconds = float("inf")
+        for _ in range(repeat):
+            run_start = time.perf_counter()
+            subprocess.run([sys.executable, *command], cwd=repository_folder, env=environment, stdout=subprocess.DEVNULL, check=True)
+            best_seconds = min(best_seconds, time.perf_counter() - run_start)
+        results[f"import_time.{name}"] = result(best_seconds * 1000, "ms", higher_is_better=False)
+    return results
+
+def compare_results(results: dict[str, dict], baseline: dict[str, dict], threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """
+    Compares benchmark results with the results of a baseline run, e.g. of the previous commit.
+
+    Args:
+        results (dict[str, dict]): Results of this run.
+        baseline (dict[str, dict]): Results of the baseline run.
+        threshold (float): Relative change counted as a regression, e.g. 0.1 for 10%.
+
+    Returns:
+        list[str]: The benchmarks that got slower by more than the threshold.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None or not previous["value"]:
+            continue
+        change = (current["value"] - previous["value"]) / previous["value"]
+        #A positive speedup is an improvement whichever way the unit goes
+        speedup = change if current["higher_is_better"] else -change
+        status = "REGRESSION" if speedup < -threshold else "ok"
+        print(f"{name}: {previous['value']:.4g} => {current['value']:.4g} {current['unit']} ({change:+.1%}) {status}")
+        if speedup < -threshold:
+            regressions.append(name)
+    return regressions
+
+def get_commit() -> str:
+    """
+    Returns the commit the benchmarks are run on.
+
+    Returns:
+        str: The abbreviated commit hash, or None if it is not known.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(benchmarks: list[str], pages: int, page_size: int, cache_sizes: list[int], workers: int,
+                   min_time: float = DEFAULT_MIN_TIME, repeat: int = DEFAULT_REPEAT) -> dict[str, dict]:
+    """
+    Runs the given benchmarks in a temporary work folder.
+
+    Args:
+        benchmarks (list[str]): Names of the benchmarks from `BENCHMARKS`.
+        pages (int): Number of pages of the corpus.
+        page_size (int): Approximate size of each page in characters.
+        cache_sizes (list[int]): Numbers of package/region pairs of the cache benchmarks.
+        workers (int): Concurrency of the end-to-end benchmark.
+        min_time (float): Minimum seconds of a measuring round.
+        repeat (int): Number of measuring rounds.
+
+    Returns:
+        dict[str, dict]: The results, keyed by benchmark name.
+    """
+    results = {}
+    corpus = generate_corpus(pages, page_size) if {"extraction", "end_to_end"} & set(benchmarks) else []
+    with tempfile.TemporaryDirectory(prefix="play_store_benchmarks_") as work_folder:
+        if "extraction" in benchmarks:
+            results.update(benchmark_extraction(corpus, min_time, repeat))
+        if "cache_read" in benchmarks or "cache_lookup" in benchmarks:
+            cache_results = benchmark_cache(cache_sizes, work_folder, min_time, repeat)
+            results.update({name: cache_result for name, cache_result in cache_results.items() if name.split(".")[0] in benchmarks})
+        if "append_to_csv" in benchmarks:
+            results.update(benchmark_append_to_csv(work_folder, min_time, repeat))
+        if "end_to_end" in benchmarks:
+            results.update(benchmark_end_to_end(corpus, work_folder, workers))
+    if "import_time" in benchmarks:
+        #More runs than the other benchmarks, a single process start is noisy
+        results.update(benchmark_import_time(max(repeat, 10)))
+    return results
+
+def parse_benchmark_arguments(argv: list[str] = None) -> argparse.Namespace:
+    """
+    Parses command-line arguments of the benchmark runner.
+
+    Args:
+        argv (list[str]): The command-line arguments. Defaults to `sys.argv`.
+
+    Returns:
+        argparse.Namespace: A namespace containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run_benchmarks", description="Benchmarks the extraction, cache, output and fetch paths of play_store_fetcher")
+    parser.add_argument('--benchmarks', type=lambda value: value.split(','), default=list(BENCHMARKS), help=f"Optional ',' separated benchmarks to run, of {', '.join(BENCHMARKS)}. Defaults to all.")
+    parser.add_argument('--pages', type=int, default=100, help="Optional number of pages of the generated corpus. Defaults to 100.")
+    parser.add_argument('--page_size', type=int, default=DEFAULT_PAGE_SIZE, help="Optional approximate size of a page in characters. Defaults to 600000, about the size of a store page.")
+    parser.add_argument('--cache_sizes', type=lambda value: [int(size) for size in value.split(',')], default=list(DEFAULT_CACHE_SIZES), help="Optional ',' separated numbers of package/region pairs of the cache benchmarks. Defaults to 1000000,10000000.")
+    parser.add_argument('--workers', type=int, default=16, help="Optional concurrency of the end-to-end benchmark. Defaults to 16.")
+    parser.add_argument('--min_time', type=float, default=DEFAULT_MIN_TIME, help="Optional minimum seconds of a measuring round. Defaults to 1.")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Optional number of measuring rounds, the best one is reported. Defaults to 3.")
+    parser.add_argument('--quick', action='store_true', help="Optional flag for a fast smoke run: 20 pages, a 100000 pair cache and single short rounds.")
+    parser.add_argument('--output', default=None, help="Optional path of the JSON results file. Defaults to benchmarks/results/<commit>.json.")
+    parser.add_argument('--compare', default=None, help="Optional path of a JSON results file to compare the results with.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="Optional relative slowdown counted as a regression by --compare. Defaults to 0.1.")
+    args = parser.parse_args(argv)
+    unknown_benchmarks = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown_benchmarks:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown_benchmarks))}")
+    if args.quick:
+        args.pages, args.cache_sizes, args.min_time, args.repeat = 20, [100_000], 0.2, 1
+    return args
+
+def main(argv: list[str] = None) -> int:
+    """
+    Runs the benchmarks, writes the JSON results file and compares the results with a baseline.
+
+    Args:
+        argv (list[str]): The command-line arguments. Defaults to `sys.argv`.
+
+    Returns:
+        int: Exit status, 1 if --compare found a regression.
+    """
+    args = parse_benchmark_arguments(argv)
+    commit = get_commit()
+    results = run_benchmarks(args.benchmarks, args.pages, args.page_size, args.cache_sizes, args.workers, args.min_time, args.repeat)
+    for name, benchmark_result in results.items():
+        print(f"{name}: {benchmark_result['value']:.4g} {benchmark_result['unit']}")
+    output_path = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        json.dump({
+            "meta": {
+                "commit": commit, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+                "platform": platform.platform(), "cpus": os.cpu_count(),
+                "arguments": {"pages": args.pages, "page_size": args.page_size, "cache_sizes": args.cache_sizes, "workers": args.workers,
+                              "min_time": args.min_time, "repeat": args.repeat},
+            },
+            "results": results,
+        }, output_file, indent=2)
+    print(f"Results written to {output_path}")
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file)["results"], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
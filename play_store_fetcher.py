@@ -1,338 +1,4435 @@
-from requests.exceptions import RequestException
-from collections.abc import Iterable
-from collections import defaultdict
-from bs4 import BeautifulSoup
-from dateutil import parser
-from typing import Union
-import requests
+from __future__ import annotations
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from collections import deque
+from urllib.parse import urlsplit
+from datetime import date, datetime, timezone
+from typing import TYPE_CHECKING, Union
+import contextlib
+import warnings
+import multiprocessing
+import threading
+import sqlite3
+import hashlib
+import shutil
+import glob
+import mmap
+import json
+import gzip
+import io
 import argparse
+import tempfile
+import random
+import heapq
 import time
 import csv
+import sys
 import re
 import os
 
+#requests, bs4, lxml, dateutil, asyncio, concurrent.futures and email.utils are imported where they are first used,
+#so --help, the subcommands and the worker processes of reparse start without them. The parser backends only import
+#the parser they use.
+if TYPE_CHECKING:
+    import requests
+
 CACHE_FILE = "cached_pkgs.csv"
 OUTPUT_FOUND_CSV_FILE = "pkg_data_found.csv"
 OUTPUT_MISSING_CSV_FILE = "pkg_missing.csv"
 OUTPUT_ERROR_CSV_FILE = "pkg_error.csv"
 OUTPUT_HTML_FOLDER = "raw_html_output"
+OUTPUT_VALIDATORS_CSV_FILE = "pkg_validators.csv"
+FOUND_CSV_HEADER = ['Package Name', 'Data Region', 'Rating', 'Reviews', 'Downloads', 'Last Updated']
+MISSING_CSV_HEADER = ['Package Name', 'Data Region', 'Http Status', 'Url']
+ERROR_CSV_HEADER = ['Package Name', 'Data Region', 'Http Status', 'Url', 'Exception Message']
+
+#Serializes cache and csv writes when packages are fetched by several worker threads
+OUTPUT_LOCK = threading.RLock()
+
+#Buffered writing of the output csv files, see BufferedCsvSink
+DEFAULT_FLUSH_ROWS = 1000
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_CHECKPOINT_INTERVAL = 60.0
+_OUTPUT_SINK = None
+
+#Columnar output of the found data
+COLUMNAR_FORMATS = ("parquet", "arrow")
+COLUMNAR_FILE_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+OUTPUT_COLUMNAR_FOLDER = "pkg_data_found_columnar"
+DEFAULT_COLUMNAR_BATCH_ROWS = 65536
+_COLUMNAR_SINK = None
+
+#Shared HTTP session settings, see configure_session
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 30.0
+_SESSION = None
+_SESSION_TIMEOUT = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+_SESSION_LOCK = threading.Lock()
+
+#Store the pages are requested from, see configure_base_url
+DEFAULT_BASE_URL = "https://play.google.com"
+_BASE_URL = DEFAULT_BASE_URL
+
+#Adaptive rate limiting, see AdaptiveRateLimiter
+DEFAULT_RATE = 5.0
+DEFAULT_MAX_RATE = 50.0
+DEFAULT_MIN_RATE = 0.05
+THROTTLE_STATUS_CODES = (429, 503)
+_RATE_LIMITER = None
+
+#Offline reprocessing of the cached html files, see reparse_cached_html
+DEFAULT_REPARSE_CHUNKSIZE = 64
+REPARSE_MANIFEST_FILE = "reparse_manifest.json"
+#Bump when a code change alters the extracted values, so the next reparse extracts every file again
+EXTRACTOR_VERSION = 1
+
+#Fetch state store replacing the cache csv file, see FetchStateStore
+STATE_STORES = ("csv", "sqlite")
+STATE_STORE_FILE = "fetch_state.sqlite3"
+DEFAULT_STATE_COMMIT_EVERY = 500
+DEFAULT_STATE_COMMIT_INTERVAL = 2.0
+FETCH_STATUS_FOUND = "found"
+FETCH_STATUS_MISSING = "missing"
+FETCH_STATUS_CACHED = "cached"
+FETCH_STATUS_RETRYING = "retrying"
+FETCH_STATUS_ERROR = "error"
+FETCHED_STATUSES = (FETCH_STATUS_FOUND, FETCH_STATUS_MISSING, FETCH_STATUS_CACHED)
+
+#Compressed html archive replacing the html output folder, see HtmlArchive
+HTML_ARCHIVES = ("files", "segments")
+HTML_ARCHIVE_COMPRESSIONS = ("zstd", "gzip")
+OUTPUT_HTML_ARCHIVE_FOLDER = "raw_html_archive"
+HTML_ARCHIVE_INDEX_FILE = "index.sqlite3"
+DEFAULT_SEGMENT_SIZE = 1 << 30
+DEFAULT_ZSTD_LEVEL = 3
+DEFAULT_GZIP_LEVEL = 6
+_HTML_ARCHIVE = None
+
+#Package listing
+PACKAGE_DEDUPS = ("memory", "disk")
+DEFAULT_DEDUP_CHUNK_NAMES = 1_000_000
+GZIP_MAGIC = b"\x1f\x8b"
+
+#Scheduling of package/region pairs
+SCHEDULE_ORDERS = ("stream", "input", "staleness", "downloads")
+_SCHEDULER = None
+
+#Sharding of package/region pairs over several machines
+SHARD_FOLDER = "shard_{index}_of_{count}/"
+SHARD_FOLDER_PATTERN = re.compile(r"shard_(\d+)_of_(\d+)/$")
+_SHARD = None
+
+#Metrics of the fetch loop
+METRIC_STAGES = ("cache_lookup", "cache_read", "rate_limit", "network_dns", "network_connect", "network_ttfb", "network_body", "parse", "write")
+DEFAULT_PROGRESS_INTERVAL = 30.0
+_METRICS = None
+
+#Revalidation of cached pages
+_REFRESH_CACHED = False
+_PAGE_VALIDATORS = {}
+
+#Staleness of fetched pairs
+#Column of each tier field in the found csv file
+STALENESS_TIER_FIELDS = {"rating": 2, "reviews": 3, "downloads": 4, "last_updated": 5}
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+COMPACT_COUNT_SUFFIXES = {"K": 10 ** 3, "M": 10 ** 6, "B": 10 ** 9}
+_STALENESS_POLICY = None
+
+#Retries of transient failures, see configure_retries
+DEFAULT_MAX_ATTEMPTS = 5
+#Throttle responses only tell to slow down, so they have a separate and much larger budget
+DEFAULT_MAX_THROTTLED_ATTEMPTS = 50
+DEFAULT_BACKOFF_BASE = 2.0
+DEFAULT_BACKOFF_CAP = 300.0
+_MAX_ATTEMPTS = DEFAULT_MAX_ATTEMPTS
+_MAX_THROTTLED_ATTEMPTS = DEFAULT_MAX_THROTTLED_ATTEMPTS
+_BACKOFF_BASE = DEFAULT_BACKOFF_BASE
+_BACKOFF_CAP = DEFAULT_BACKOFF_CAP
+
+def append_to_csv(output_path: str, data: Iterable[any]) -> None:
+    """
+    Appends the given data to the given csv file.
+
+    If the given path does not exist, creates the csv file. Proceeds to append the given data to the
+    given csv file. Writes are serialized with `OUTPUT_LOCK` so rows from concurrent workers are not interleaved.
+    If an output sink is configured with `configure_output_sink`, the row is buffered in the sink instead.
+
+    Args:
+        output_path (str): Path to the csv file.
+        data (Iterable[any]): Data to output to the csv file.
+    
+    Returns:
+        None
+    """
+    with OUTPUT_LOCK:
+        if _OUTPUT_SINK is not None:
+            _OUTPUT_SINK.write(output_path, data)
+            return
+        with open(output_path, mode='a', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file, delimiter=";")
+            writer.writerow(data)
+
+class BufferedCsvSink:
+    """
+    Long-lived writer of the output csv files that buffers rows and writes them in batches.
+
+    Rows are kept in memory and written to the files, which stay open for the whole run, once `flush_rows` rows are
+    buffered or every `flush_interval` seconds. At checkpoints, every `checkpoint_interval` seconds and when the sink
+    is closed, the files are also fsynced to disk. Data files are always written before the cache file, so a pair
+    is never in the cache without its data row. An interrupted run loses at most the rows since the last flush,
+    whose pairs are then not in the cache either and are fetched again on resume.
+    """
+
+    def __init__(self, flush_rows: int = DEFAULT_FLUSH_ROWS, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL) -> None:
+        self._lock = threading.Lock()
+        self._flush_rows = flush_rows
+        self._checkpoint_interval = checkpoint_interval
+        self._last_checkpoint = time.monotonic()
+        self._pending = 0
+        self._buffers = {}
+        self._writers = {}
+        self._files = {}
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,), name="csv-sink-flusher", daemon=True)
+        self._flusher.start()
+
+    def write(self, output_path: str, data: Iterable[any]) -> None:
+        """
+        Buffers a row for the given csv file.
+
+        Args:
+            output_path (str): Path to the csv file.
+            data (Iterable[any]): Data to output to the csv file.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            writer = self._writers.get(output_path)
+            if writer is None:
+                self._buffers[output_path] = io.StringIO()
+                writer = self._writers[output_path] = csv.writer(self._buffers[output_path], delimiter=";")
+            writer.writerow(data)
+            self._pending += 1
+            if self._pending >= self._flush_rows:
+                self._flush()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered rows to the files.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._flush()
+
+    def checkpoint(self) -> None:
+        """
+        Writes the buffered rows to the files and fsyncs the files to disk.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._flush()
+            self._sync()
+
+    def close(self) -> None:
+        """
+        Stops the periodic flushing, checkpoints and closes the files.
+
+        Returns:
+            None
+        """
+        self._closed.set()
+        self._flusher.join()
+        with self._lock:
+            self._flush()
+            self._sync()
+            for file in self._files.values():
+                file.close()
+            self._files.clear()
+
+    def _flush_periodically(self, flush_interval: float) -> None:
+        while not self._closed.wait(flush_interval):
+            self.flush()
+
+    def _ordered_paths(self) -> list[str]:
+        #The cache file is written last, so a pair is never in the cache without its data row
+        return sorted(self._buffers, key=lambda output_path: output_path.endswith(CACHE_FILE))
+
+    def _flush(self) -> None:
+        for output_path in self._ordered_paths():
+            buffer = self._buffers[output_path]
+            if not buffer.tell():
+                continue
+            file = self._files.get(output_path)
+            if file is None:
+                file = self._files[output_path] = open(output_path, mode='a', newline='', encoding='utf-8')
+            file.write(buffer.getvalue())
+            file.flush()
+            buffer.seek(0)
+            buffer.truncate()
+        self._pending = 0
+        if time.monotonic() - self._last_checkpoint >= self._checkpoint_interval:
+            self._sync()
+
+    def _sync(self) -> None:
+        for output_path in self._ordered_paths():
+            if output_path in self._files:
+                os.fsync(self._files[output_path].fileno())
+        self._last_checkpoint = time.monotonic()
+
+def configure_output_sink(sink: Union[None, BufferedCsvSink]) -> None:
+    """
+    Sets the sink `append_to_csv` writes rows to. `None` writes every row to its file right away. The previous
+    sink is closed, writing its buffered rows.
+
+    Args:
+        sink (Union[None, BufferedCsvSink]): The sink, or None.
+
+    Returns:
+        None
+    """
+    global _OUTPUT_SINK
+    with OUTPUT_LOCK:
+        previous_sink, _OUTPUT_SINK = _OUTPUT_SINK, sink
+    if previous_sink is not None:
+        previous_sink.close()
+
+def flush_output_sink() -> None:
+    """
+    Writes the rows buffered in the output sink to the files, if a sink is used.
+
+    Returns:
+        None
+    """
+    sink = _OUTPUT_SINK
+    if sink is not None:
+        sink.flush()
+
+def import_pyarrow():
+    """
+    Imports the optional `pyarrow` package used to write the columnar output.
+
+    Returns:
+        module: The `pyarrow` module with its `parquet` and `ipc` modules loaded, or `None` if it is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        return None
+
+def normalize_rating(value: str) -> Union[None, float]:
+    """
+    Converts an extracted rating, e.g. "4.5", into a number.
+
+    Args:
+        value (str): The extracted rating.
+
+    Returns:
+        Union[None, float]: The rating, or None if the value is not a rating, e.g. 'Not Found'.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def normalize_count(value: str) -> Union[None, int]:
+    """
+    Converts a displayed count into its integer lower bound, e.g. "2.64M" => 2640000 and "5B+" => 5000000000.
+
+    Args:
+        value (str): The displayed count.
+
+    Returns:
+        Union[None, int]: The count, or None if the value is not a count, e.g. 'Not Found'.
+    """
+    count = parse_compact_count(value) if value else None
+    #Rounded, as e.g. 4.35 * 10**6 is slightly below 4350000 in floating point
+    return None if count is None else int(round(count))
+
+def normalize_date(value: str) -> Union[None, date]:
+    """
+    Converts an extracted date in the format 'Dec 01, 2024' into a date.
+
+    Args:
+        value (str): The extracted date.
+
+    Returns:
+        Union[None, date]: The date, or None if the value is not a date, e.g. 'Not Found'.
+    """
+    try:
+        return datetime.strptime(value, "%b %d, %Y").date()
+    except (TypeError, ValueError):
+        return None
+
+def get_columnar_path(output_prefix: str, columnar_format: str, part_name: str) -> str:
+    """
+    Returns the path of a part file of the columnar output.
+
+    Args:
+        output_prefix (str): Output file name prefix.
+        columnar_format (str): The columnar format, "parquet" or "arrow".
+        part_name (str): Name of the part file without the extension.
+
+    Returns:
+        str: Path to the part file in the columnar output folder.
+    """
+    return f"{output_prefix}{OUTPUT_COLUMNAR_FOLDER}/{part_name}{COLUMNAR_FILE_EXTENSIONS[columnar_format]}"
+
+class ColumnarFoundSink:
+    """
+    Writer of the found data to a Parquet or Arrow IPC file with typed columns.
+
+    Rows are normalized as they are written: the rating is a float, the review and download counts are the integer
+    lower bounds of the displayed counts, the last update is a date and data points that were not found are null
+    instead of 'Not Found'. Rows are buffered column by column and written as a row group (Parquet) or a record batch
+    (Arrow) once `batch_rows` rows are buffered. The file is written under a temporary name and only appears under
+    its own name once the sink is closed, so a reader never sees a file without its footer.
+
+    Columns:
+        package (string), region (string), rating (float64), reviews (int64), downloads (int64),
+        last_updated (date32), fetched_at (timestamp[s, UTC], null for rows exported from the found csv file)
+    """
+
+    COLUMNS = ("package", "region", "rating", "reviews", "downloads", "last_updated", "fetched_at")
+
+    def __init__(self, file_path: str, columnar_format: str = "parquet", batch_rows: int = DEFAULT_COLUMNAR_BATCH_ROWS) -> None:
+        if columnar_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unknown columnar format: {columnar_format}")
+        pyarrow = import_pyarrow()
+        if pyarrow is None:
+            raise ImportError("The columnar output requires the pyarrow package")
+        self._pyarrow = pyarrow
+        self._lock = threading.Lock()
+        self._file_path = file_path
+        self._batch_rows = batch_rows
+        self._columns = {column: [] for column in self.COLUMNS}
+        self.rows = 0
+        self._schema = pyarrow.schema([
+            ("package", pyarrow.string()), ("region", pyarrow.string()), ("rating", pyarrow.float64()),
+            ("reviews", pyarrow.int64()), ("downloads", pyarrow.int64()), ("last_updated", pyarrow.date32()),
+            ("fetched_at", pyarrow.timestamp("s", tz="UTC")),
+        ])
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        if columnar_format == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(f"{file_path}.tmp", self._schema, compression="zstd")
+        else:
+            self._writer = pyarrow.ipc.new_file(f"{file_path}.tmp", self._schema)
+
+    def __enter__(self) -> "ColumnarFoundSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, found_row: list[str], fetched_at: Union[None, float] = None) -> None:
+        """
+        Normalizes a row of the found csv file and buffers it.
+
+        Args:
+            found_row (list[str]): The package, region, rating, reviews, downloads and last update of the pair.
+            fetched_at (Union[None, float]): Unix time the page was fetched, or None if unknown.
+
+        Returns:
+            None
+        """
+        package, region, rating, reviews, downloads, last_updated = found_row[:6]
+        with self._lock:
+            self._columns["package"].append(package)
+            self._columns["region"].append(region)
+            self._columns["rating"].append(normalize_rating(rating))
+            self._columns["reviews"].append(normalize_count(reviews))
+            self._columns["downloads"].append(normalize_count(downloads))
+            self._columns["last_updated"].append(normalize_date(last_updated))
+            self._columns["fetched_at"].append(None if fetched_at is None else int(fetched_at))
+            self.rows += 1
+            if len(self._columns["package"]) >= self._batch_rows:
+                self._write_batch()
+
+    def close(self) -> None:
+        """
+        Writes the buffered rows, closes the file and moves it to its own name.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._writer is None:
+                return
+            self._write_batch()
+            self._writer.close()
+            self._writer = None
+            os.replace(f"{self._file_path}.tmp", self._file_path)
+
+    def _write_batch(self) -> None:
+        if not self._columns["package"]:
+            return
+        self._writer.write_table(self._pyarrow.Table.from_pydict(self._columns, schema=self._schema))
+        self._columns = {column: [] for column in self.COLUMNS}
+
+def configure_columnar_sink(sink: Union[None, ColumnarFoundSink]) -> None:
+    """
+    Sets the sink `save_pkg_data` writes the found data to in columnar form, next to the found csv file. The previous
+    sink is closed, completing its file.
+
+    Args:
+        sink (Union[None, ColumnarFoundSink]): The sink, or None to only write the found csv file.
+
+    Returns:
+        None
+    """
+    global _COLUMNAR_SINK
+    with OUTPUT_LOCK:
+        previous_sink, _COLUMNAR_SINK = _COLUMNAR_SINK, sink
+    if previous_sink is not None:
+        previous_sink.close()
+
+def export_found_csv(output_prefix: str, columnar_format: str = "parquet", batch_rows: int = DEFAULT_COLUMNAR_BATCH_ROWS) -> int:
+    """
+    Writes the found csv file to the columnar output, e.g. for data fetched before the columnar output was used.
+
+    The latest row of each package/region pair is written to the part file `export` of the columnar output folder.
+    As the export holds all found data, the other part files of the format are removed once it is complete.
+
+    Args:
+        output_prefix (str): Output file name prefix.
+        columnar_format (str): The columnar format, "parquet" or "arrow". Defaults to "parquet".
+        batch_rows (int): Number of rows per row group or record batch.
+
+    Returns:
+        int: Number of rows written.
+    """
+    export_path = get_columnar_path(output_prefix, columnar_format, "export")
+    found_path = f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}"
+    with OutputRowMerger(os.path.dirname(os.path.abspath(found_path))) as merger, ColumnarFoundSink(export_path, columnar_format, batch_rows) as sink:
+        merger.add_rows("found", [found_path], FOUND_CSV_HEADER)
+        for found_row in merger.iter_rows("found"):
+            sink.write(found_row)
+    part_extension = COLUMNAR_FILE_EXTENSIONS[columnar_format]
+    for part_path in glob.glob(f"{glob.escape(output_prefix)}{OUTPUT_COLUMNAR_FOLDER}/*{part_extension}"):
+        if not os.path.samefile(part_path, export_path):
+            os.remove(part_path)
+    return sink.rows
+
+def xpath_has_class(class_name: str) -> str:
+    """
+    Returns an XPath predicate matching elements that have the given css class.
+
+    Args:
+        class_name (str): The css class.
+
+    Returns:
+        str: The XPath predicate, e.g. "[contains(concat(' ', normalize-space(@class), ' '), ' ClM7O ')]".
+    """
+    return f"[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+#Extraction spec of the data points, in the order get_app_info_from_html returns them. For each data point:
+#css_selector: Selector of the element holding the data point, used by the bs4 parser backend
+#xpath: XPath equivalent of the css selector, used by the lxml parser backend
+#filter: Regex picking the value from the text of the element
+#value: How the value is formed from the regex matches, a key of EXTRACTION_VALUE_FUNCS
+#data_blob_path: Index path of the data point in the embedded app data, used by the json parser backend
+#data_blob_format: How the embedded value is formatted, a key of DATA_BLOB_FORMATTERS
+DEFAULT_EXTRACTION_SPEC = {
+    "star_rating": {
+        "css_selector": "div.l8YSdd div.w7Iutd div.wVqUob div.ClM7O div div.TT9eCd",
+        "xpath": f"//div{xpath_has_class('l8YSdd')}//div{xpath_has_class('w7Iutd')}//div{xpath_has_class('wVqUob')}//div{xpath_has_class('ClM7O')}//div//div{xpath_has_class('TT9eCd')}",
+        "filter": r"(?:[^\w\d]*)(\d+\.\d+|\d+)(?=[A-Za-z]+)",
+        "value": "first_match",
+        "data_blob_path": [1, 2, 51, 0, 1],
+        "data_blob_format": "rating",
+    },
+    "download_count": { #Tricky to select
+        "css_selector": "div.l8YSdd div.w7Iutd div div.ClM7O:not(:has(> img)):not(:has(> div)):not(:has(> span))",
+        "xpath": f"//div{xpath_has_class('l8YSdd')}//div{xpath_has_class('w7Iutd')}//div//div{xpath_has_class('ClM7O')}[not(img)][not(div)][not(span)]",
+        "filter": r"(\d+(\.\d+)?[KMB]?\+?)",
+        "value": "first_match",
+        "data_blob_path": [1, 2, 13, 1],
+        "data_blob_format": "installs",
+    },
+    "review_count": { #If rating data is not available, will match to "downloads" text. Filter handles it.
+        "css_selector": "div.l8YSdd div.w7Iutd div.wVqUob div.g1rdde",
+        "xpath": f"//div{xpath_has_class('l8YSdd')}//div{xpath_has_class('w7Iutd')}//div{xpath_has_class('wVqUob')}//div{xpath_has_class('g1rdde')}",
+        "filter": r"(\d+(\.\d+)?[KMB]?\+?)",
+        "value": "first_match",
+        "data_blob_path": [1, 2, 51, 2, 1],
+        "data_blob_format": "count",
+    },
+    "last_updated_time": {
+        "css_selector": "div.xg1aie",
+        "xpath": f"//div{xpath_has_class('xg1aie')}",
+        "filter": r"\b(?:[A-Za-z]{3} \d{1,2},? \d{4}|\d{1,2} [A-Za-z]{3} \d{4}|\d{1,2} [A-Za-z]{3},? \d{4})\b",
+        "value": "date",
+        "data_blob_path": [1, 2, 145, 0, 1, 0],
+        "data_blob_format": "timestamp",
+    },
+}
+PARSER_BACKENDS = ("lxml", "bs4", "json")
+DEFAULT_PARSER_BACKEND = "lxml"
+_PARSER_BACKEND = DEFAULT_PARSER_BACKEND
+#lxml parsers and compiled XPath expressions are kept per thread
+_LXML_TOOLS = threading.local()
+#Key of the app details payload of a Play Store page, used by the json parser backend
+APP_DATA_BLOB_KEY = "ds:5"
+_JSON_DECODER = json.JSONDecoder()
+#Dates in the formats matched by the last_updated_time filter, e.g. "Jan 1, 2025" and "1 Jan 2025"
+_FAST_DATE_PATTERN = re.compile(r"(?:([A-Za-z]{3}) (\d{1,2}),? (\d{4})|(\d{1,2}) ([A-Za-z]{3}),? (\d{4}))")
+_MONTH_NUMBERS = {month: number for number, month in enumerate(("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+
+def first_filter_match(filter_matches: list) -> str:
+    """
+    Returns the first regex match, or its first group if the filter has several groups.
+
+    Args:
+        filter_matches (list): Result of `findall` of the filter regex.
+
+    Returns:
+        str: The first match.
+    """
+    return filter_matches[0] if isinstance(filter_matches[0], str) else filter_matches[0][0]
+
+def parse_update_date(filter_matches: list) -> str:
+    """
+    Normalizes the matched date of the last update to the format 'Dec 01, 2024'.
+
+    Dates in the known formats of the store page are converted directly. Anything else, such as several matches
+    or a month name that is not an English abbreviation, is parsed with dateutil.
+
+    Args:
+        filter_matches (list): Result of `findall` of the filter regex.
+
+    Returns:
+        str: The date in the format 'Dec 01, 2024'.
+    """
+    date_text = ' '.join([v for v in filter_matches if v])
+    date_match = _FAST_DATE_PATTERN.fullmatch(date_text)
+    if date_match:
+        month, day, year = date_match.group(1, 2, 3) if date_match.group(1) else date_match.group(5, 4, 6)
+        month_number = _MONTH_NUMBERS.get(month.lower())
+        if month_number:
+            try:
+                return date(int(year), month_number, int(day)).strftime("%b %d, %Y")
+            except ValueError:
+                pass
+    from dateutil import parser
+    return parser.parse(date_text).strftime("%b %d, %Y")
+
+EXTRACTION_VALUE_FUNCS = {
+    "first_match": first_filter_match,
+    "date": parse_update_date,
+}
+
+def compile_extraction_spec(extraction_spec: dict[str, dict]) -> dict[str, dict]:
+    """
+    Compiles an extraction spec into the rules used by `get_app_info_from_html`.
+
+    The filter regexes are compiled and the value names are resolved to functions once, so extracting a page
+    does no per-call setup.
+
+    Args:
+        extraction_spec (dict[str, dict]): Extraction spec in the format of `DEFAULT_EXTRACTION_SPEC`.
+
+    Returns:
+        dict[str, dict]: The compiled rules keyed by data point.
+
+    Raises:
+        ValueError: If a rule has an unknown value or data blob format.
+    """
+    extraction_rules = {}
+    for data_key, spec in extraction_spec.items():
+        if spec["value"] not in EXTRACTION_VALUE_FUNCS:
+            raise ValueError(f"Unknown value '{spec['value']}' for {data_key}")
+        if spec["data_blob_format"] not in DATA_BLOB_FORMATTERS:
+            raise ValueError(f"Unknown data blob format '{spec['data_blob_format']}' for {data_key}")
+        extraction_rules[data_key] = {
+            "css_selector": spec["css_selector"],
+            "xpath": spec["xpath"],
+            "filter": re.compile(spec["filter"]),
+            "value_func": EXTRACTION_VALUE_FUNCS[spec["value"]],
+            "data_blob_path": list(spec["data_blob_path"]),
+            "data_blob_format": DATA_BLOB_FORMATTERS[spec["data_blob_format"]],
+        }
+    return extraction_rules
+
+def configure_extraction_spec(config_path: str = None) -> None:
+    """
+    Sets the extraction spec used by `get_app_info_from_html`, optionally overriding parts of it from a config file.
+
+    The config file is a JSON object with the data points as keys. Each data point can override any of the fields
+    of `DEFAULT_EXTRACTION_SPEC`, e.g. `{"star_rating": {"css_selector": "div.newClass", "xpath": "//div[@class='newClass']"}}`.
+    Fields that are not given keep their default value. Note that the css selector is only used by the bs4 parser
+    backend and the XPath only by the lxml backend, so a changed selector should be given for both.
+
+    Args:
+        config_path (str): Path to the JSON config file. Without it, the default spec is used.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the config file contains unknown data points or fields.
+    """
+    global _EXTRACTION_RULES, _EXTRACTION_SPEC_DIGEST
+    extraction_spec = {data_key: dict(spec) for data_key, spec in DEFAULT_EXTRACTION_SPEC.items()}
+    if config_path:
+        with open(config_path, "r", encoding="utf-8") as file:
+            spec_overrides = json.load(file)
+        for data_key, overrides in spec_overrides.items():
+            if data_key not in extraction_spec:
+                raise ValueError(f"Unknown data point in extraction config: {data_key}")
+            unknown_fields = set(overrides) - set(extraction_spec[data_key])
+            if unknown_fields:
+                raise ValueError(f"Unknown fields in extraction config for {data_key}: {', '.join(sorted(unknown_fields))}")
+            extraction_spec[data_key].update(overrides)
+    _EXTRACTION_RULES = compile_extraction_spec(extraction_spec)
+    _EXTRACTION_SPEC_DIGEST = digest_extraction_spec(extraction_spec)
+
+def digest_extraction_spec(extraction_spec: dict[str, dict]) -> str:
+    """
+    Computes a digest identifying an extraction spec, used to notice when the spec of a reparse has changed.
+
+    Args:
+        extraction_spec (dict[str, dict]): Extraction spec in the format of `DEFAULT_EXTRACTION_SPEC`.
+
+    Returns:
+        str: Hex digest of the spec.
+    """
+    return hashlib.sha256(json.dumps(extraction_spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def get_extractor_version() -> str:
+    """
+    Returns the version of the current extractor: the extraction code version, the parser backend and the extraction
+    spec. Values extracted with the same extractor version from the same html are the same.
+
+    Returns:
+        str: The extractor version.
+    """
+    return f"{EXTRACTOR_VERSION}:{_PARSER_BACKEND}:{_EXTRACTION_SPEC_DIGEST}"
+
+def configure_parser_backend(backend: str) -> None:
+    """
+    Sets the parser backend used by `get_app_info_from_html`.
+
+    Args:
+        backend (str): "lxml" to select the data points with precompiled lxml XPath expressions,
+            "bs4" to select them with BeautifulSoup css selectors, or "json" to read them from the app data
+            embedded in the page (see `get_app_info_from_data_blobs`).
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    global _PARSER_BACKEND
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    _PARSER_BACKEND = backend
+
+def select_element_texts_bs4(raw_html: str, css_selectors: dict[str, str]) -> dict[str, Union[None, str]]:
+    """
+    Returns the stripped text of the first element matching each css selector, using BeautifulSoup.
+
+    Args:
+        raw_html (str): HTML containing the data points.
+        css_selectors (dict[str, str]): Css selectors keyed by data point.
+
+    Returns:
+        dict[str, Union[None, str]]: The element texts keyed by data point, None if no element matched.
+    """
+    from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+    #Store pages are html even if they start with an XML declaration
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", XMLParsedAsHTMLWarning)
+        soup = BeautifulSoup(raw_html, 'lxml')
+    element_texts = {}
+    for data_key, css_selector in css_selectors.items():
+        html_element = soup.select_one(css_selector)
+        element_texts[data_key] = html_element.get_text(strip=True) if html_element else None
+    return element_texts
+
+def select_element_texts_lxml(raw_html: Union[str, bytes], extraction_rules: dict[str, dict]) -> dict[str, Union[None, str]]:
+    """
+    Returns the stripped text of the first element matching the XPath of each extraction rule, using lxml.
+
+    The html is parsed directly into an lxml tree and the data points are selected with precompiled XPath
+    expressions, which avoids building the BeautifulSoup tree and evaluating css selectors on every page.
+    The expressions are compiled once per thread and extraction spec.
+    The texts are formed like BeautifulSoup's `get_text(strip=True)`. Utf-8 encoded bytes-like html, e.g. a memory-mapped
+    file, is parsed without decoding it into a str first. Str html is encoded to utf-8 before it is parsed, as lxml
+    rejects str input that starts with an XML declaration naming an encoding.
+
+    Args:
+        raw_html (Union[str, bytes]): HTML containing the data points.
+        extraction_rules (dict[str, dict]): Compiled extraction rules keyed by data point.
+
+    Returns:
+        dict[str, Union[None, str]]: The element texts keyed by data point, None if no element matched.
+    """
+    from lxml import etree
+    if getattr(_LXML_TOOLS, "extraction_rules", None) is not extraction_rules:
+        #The parser reads utf-8 whatever encoding an XML declaration of the page names
+        _LXML_TOOLS.parser = etree.HTMLParser(encoding="utf-8", remove_comments=True, remove_pis=True, huge_tree=True)
+        _LXML_TOOLS.xpaths = {data_key: etree.XPath(rule["xpath"]) for data_key, rule in extraction_rules.items()}
+        _LXML_TOOLS.extraction_rules = extraction_rules
+    if isinstance(raw_html, str):
+        raw_html = raw_html.encode("utf-8", errors="replace")
+    root = etree.fromstring(raw_html, _LXML_TOOLS.parser) if raw_html else None
+    element_texts = {}
+    for data_key, xpath in _LXML_TOOLS.xpaths.items():
+        html_elements = xpath(root) if root is not None else None
+        if html_elements:
+            element_texts[data_key] = "".join(text.strip() for text in html_elements[0].itertext())
+        else:
+            element_texts[data_key] = None
+    return element_texts
+
+def find_data_blob(raw_html: str, blob_key: str) -> Union[None, list]:
+    """
+    Finds and decodes the data of an `AF_initDataCallback` payload embedded in a Play Store page.
+
+    The payloads look like `AF_initDataCallback({key: 'ds:5', hash: '7', data:[...], sideChannel: {}});`.
+    The page is scanned with plain string searches for the payload of the given key, and only its data array is
+    decoded as JSON, so no DOM tree is built for the page.
+
+    Args:
+        raw_html (str): HTML of the Play Store page.
+        blob_key (str): Key of the payload, e.g. "ds:5".
+
+    Returns:
+        Union[None, list]: The decoded data array, or None if the payload is missing or not valid JSON.
+    """
+    search_start = 0
+    while (callback_start := raw_html.find("AF_initDataCallback(", search_start)) != -1:
+        search_start = callback_start + len("AF_initDataCallback(")
+        key_start = raw_html.find("key:", search_start)
+        if key_start == -1:
+            return None
+        key_start += len("key:")
+        while key_start < len(raw_html) and raw_html[key_start].isspace():
+            key_start += 1
+        #Key is a quoted string, e.g. 'ds:5'
+        key_end = raw_html.find(raw_html[key_start:key_start + 1] or "'", key_start + 1)
+        if key_end == -1 or raw_html[key_start + 1:key_end] != blob_key:
+            continue
+        data_start = raw_html.find("data:", key_start)
+        if data_start == -1:
+            return None
+        data_start += len("data:")
+        while data_start < len(raw_html) and raw_html[data_start].isspace():
+            data_start += 1
+        try:
+            data, _ = _JSON_DECODER.raw_decode(raw_html, data_start)
+        except ValueError:
+            return None
+        return data if isinstance(data, list) else None
+    return None
+
+def get_data_blob_value(data: list, path: list[int]) -> any:
+    """
+    Returns the value at the given index path of a decoded data blob.
+
+    Args:
+        data (list): The decoded data array.
+        path (list[int]): List indices leading to the value.
+
+    Returns:
+        any: The value, or None if the path does not exist.
+    """
+    for index in path:
+        if not isinstance(data, list) or index >= len(data):
+            return None
+        data = data[index]
+    return data
+
+def format_compact_count(count: int) -> str:
+    """
+    Formats a count the way the Play Store displays it, e.g. 2643210 => "2.64M" and 100000 => "100K".
+
+    Counts of a thousand or more are shortened with a K/M/B suffix and rounded down to three significant digits.
+
+    Args:
+        count (int): The count.
+
+    Returns:
+        str: The formatted count.
+    """
+    for divisor, suffix in ((10 ** 9, "B"), (10 ** 6, "M"), (10 ** 3, "K")):
+        if count >= divisor:
+            decimals = max(0, 3 - len(str(count // divisor)))
+            #Integer division truncates instead of rounding, so the count is never overstated
+            digits = str(count // (divisor // 10 ** decimals))
+            formatted_value = digits
+            if decimals:
+                formatted_value = f"{digits[:-decimals]}.{digits[-decimals:]}".rstrip("0").rstrip(".")
+            return f"{formatted_value}{suffix}"
+    return str(count)
+
+def format_blob_rating(value: any) -> Union[None, str]:
+    """
+    Formats an embedded average rating like the store page, e.g. 3.8765 => "3.9".
+
+    Args:
+        value (any): The value read from the embedded app data.
+
+    Returns:
+        Union[None, str]: The formatted rating, or None if the rating is missing.
+    """
+    return f"{value:.1f}" if isinstance(value, (int, float)) and value > 0 else None
+
+def format_blob_installs(value: any) -> Union[None, str]:
+    """
+    Formats an embedded minimum install count like the store page, e.g. 5000000000 => "5B+".
+
+    Args:
+        value (any): The value read from the embedded app data.
+
+    Returns:
+        Union[None, str]: The formatted install count, or None if the count is missing.
+    """
+    return f"{format_compact_count(value)}+" if isinstance(value, int) else None
+
+def format_blob_count(value: any) -> Union[None, str]:
+    """
+    Formats an embedded count like the store page, e.g. 2643210 => "2.64M".
+
+    Args:
+        value (any): The value read from the embedded app data.
+
+    Returns:
+        Union[None, str]: The formatted count, or None if the count is missing.
+    """
+    return format_compact_count(value) if isinstance(value, int) and value > 0 else None
+
+def format_blob_timestamp(value: any) -> Union[None, str]:
+    """
+    Formats an embedded unix timestamp as a UTC date, e.g. 1741564800 => "Mar 10, 2025".
+
+    Args:
+        value (any): The value read from the embedded app data.
+
+    Returns:
+        Union[None, str]: The formatted date, or None if the timestamp is missing.
+    """
+    return datetime.fromtimestamp(value, timezone.utc).strftime("%b %d, %Y") if isinstance(value, int) and value > 0 else None
+
+DATA_BLOB_FORMATTERS = {
+    "rating": format_blob_rating,
+    "installs": format_blob_installs,
+    "count": format_blob_count,
+    "timestamp": format_blob_timestamp,
+}
+
+def get_app_info_from_data_blobs(raw_html: str) -> tuple[str, str, str, str]:
+    """
+    Extracts data points from the structured app data embedded in the given HTML.
+
+    Play Store pages carry the app details in the `AF_initDataCallback` payload with the key `APP_DATA_BLOB_KEY`.
+    The data points are read from the `data_blob_path` of each extraction rule and formatted like the values displayed on the page:
+    - Ratings: The average rating with one decimal, e.g. "3.9".
+    - Download count: The install count bucket, e.g. "5B+".
+    - Review count: The number of ratings in the compact form, e.g. "2.64M".
+    - Last update time: The date of the last update, e.g. "Mar 10, 2025".
+    Data points that are missing from the payload, or all of them if the payload is missing, are extracted from the
+    rendered html with `get_app_info_from_html` instead.
+
+    Args:
+        raw_html (str): HTML containing the data points
+
+    Returns:
+        tuple[str, str, str, str]: A tuple containing the rating, download count, review count and last update time as strings in that order.
+        If any of the data points are not found, they are represented by the string 'Not Found'.
+    """
+    extraction_rules = _EXTRACTION_RULES
+    scaped_data = {data_key: "Not Found" for data_key in extraction_rules}
+    app_data = find_data_blob(raw_html, APP_DATA_BLOB_KEY) if raw_html else None
+    if app_data is not None:
+        for data_key, rule in extraction_rules.items():
+            blob_value = rule["data_blob_format"](get_data_blob_value(app_data, rule["data_blob_path"]))
+            if blob_value:
+                scaped_data[data_key] = blob_value
+
+    if "Not Found" in scaped_data.values():
+        #Fall back to the rendered html for the missing data points
+        css_data = dict(zip(scaped_data, get_app_info_from_html(raw_html, "lxml")))
+        scaped_data = {k: v if v != "Not Found" else css_data[k] for k, v in scaped_data.items()}
+    return tuple(scaped_data.values())
+
+def get_app_info_from_html(raw_html: Union[str, bytes], parser_backend: str = None) -> tuple[str, str, str, str]:
+    """
+    Extracts data points from the given HTML.
+
+    Parses html using the configured parser backend, lxml XPath expressions by default or BeautifulSoup css
+    selectors (see `configure_parser_backend`). Both backends return the same data points. The "json" backend
+    reads the data points from the app data embedded in the page with `get_app_info_from_data_blobs`.
+    If present in the html, extracts the following data points and returns them in this order:
+    - Ratings: The number of stars.
+    - Download count: The number of times the app was downloaded.
+    - Review count: The number of reviews left.
+    - Last update time: When was the last update released for the app.   
+    If data point is not present in the html, 'Not found' is returned for it.
+    The html can also be given as utf-8 encoded bytes or a bytes-like view such as an `mmap`, which the lxml backend
+    parses without copying it.
+    
+    Args:
+        raw_html (Union[str, bytes]): HTML containing the data points
+        parser_backend (str): Parser backend to use instead of the configured one, "lxml", "bs4" or "json".
+
+    Returns:
+        tuple[str, str, str, str]: A tuple containing the rating, review count, download count and last update time as strings in that order.
+        If any of the data points are not found, they are represented by the string 'Not Found'.
+    """
+    extraction_rules = _EXTRACTION_RULES
+    parser_backend = parser_backend or _PARSER_BACKEND
+    if parser_backend != "lxml" and not isinstance(raw_html, str):
+        raw_html = str(raw_html, "utf-8")
+    if parser_backend == "json":
+        return get_app_info_from_data_blobs(raw_html)
+    if parser_backend == "lxml":
+        element_texts = select_element_texts_lxml(raw_html, extraction_rules)
+    else:
+        element_texts = select_element_texts_bs4(raw_html, {k: rule["css_selector"] for k, rule in extraction_rules.items()})
+    scaped_data = {k:"Not Found" for k in extraction_rules}
+    #Try to find data for each defined css path
+    for data_key, rule in extraction_rules.items():
+         element_text = element_texts[data_key]
+         if element_text is not None:
+            #Filter all the non wanted elements
+            filtered_regex = rule["filter"].findall(element_text)
+            if filtered_regex:
+                filtered_value = rule["value_func"](filtered_regex)
+                if filtered_value:
+                    scaped_data[data_key] = filtered_value
+
+    #This expects that we use python +3.7, dict order needs to be guaranteed
+    return tuple(scaped_data.values())
+
+#Compiled extraction rules of the default spec, see configure_extraction_spec
+_EXTRACTION_RULES = compile_extraction_spec(DEFAULT_EXTRACTION_SPEC)
+_EXTRACTION_SPEC_DIGEST = digest_extraction_spec(DEFAULT_EXTRACTION_SPEC)
+
+def import_zstandard():
+    """
+    Imports the optional `zstandard` package used to compress the html archive.
+
+    Returns:
+        module: The `zstandard` module, or `None` if it is not installed.
+    """
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+class HtmlArchive:
+    """
+    Compressed, content-addressed archive of the fetched html pages, used in place of one html file per pair.
+
+    Pages are compressed, with zstd if the `zstandard` package is installed and gzip otherwise, and appended to
+    segment files of up to `segment_size` bytes. An SQLite index maps each (package, region) pair to the sha256 hash
+    of its page, and each hash to the segment, offset and length of the compressed page. Identical pages, e.g. of a
+    package in several regions, are stored once. A page is read back with two primary key lookups and a single read
+    from its segment. The index is committed in batches like `FetchStateStore`, after the segments are fsynced, so
+    the index never points past the data on disk; an interrupted run loses at most the pages of the last batch.
+    Segments are read through memory maps, so reading a page takes no system calls once its segment is mapped.
+    An archive opened with `read_only` can be read by other processes while a run is writing to it.
+    """
+
+    def __init__(self, archive_folder: str, compression: str = None, segment_size: int = DEFAULT_SEGMENT_SIZE,
+                 commit_every: int = DEFAULT_STATE_COMMIT_EVERY, commit_interval: float = DEFAULT_STATE_COMMIT_INTERVAL,
+                 read_only: bool = False) -> None:
+        self._archive_folder = archive_folder
+        self._compression = compression or ("zstd" if import_zstandard() else "gzip")
+        if self._compression not in HTML_ARCHIVE_COMPRESSIONS:
+            raise ValueError(f"Unknown html archive compression: {self._compression}")
+        self._segment_size = segment_size
+        self._commit_every = commit_every
+        self._commit_interval = commit_interval
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._lock = threading.Lock()
+        self._segment_maps = {}
+        self._segment_file = None
+        index_path = os.path.join(archive_folder, HTML_ARCHIVE_INDEX_FILE)
+        if read_only:
+            self._connection = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, timeout=30.0, check_same_thread=False)
+            return
+        os.makedirs(archive_folder, exist_ok=True)
+        self._connection = sqlite3.connect(index_path, timeout=30.0, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (content_hash TEXT NOT NULL PRIMARY KEY, segment INTEGER NOT NULL, "
+            "offset INTEGER NOT NULL, length INTEGER NOT NULL, size INTEGER NOT NULL, codec TEXT NOT NULL) WITHOUT ROWID"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages (package TEXT NOT NULL, region TEXT NOT NULL, content_hash TEXT NOT NULL, "
+            "PRIMARY KEY (package, region)) WITHOUT ROWID"
+        )
+        self._connection.commit()
+        last_segment = self._connection.execute("SELECT MAX(segment) FROM blobs").fetchone()[0]
+        self._segment = last_segment or 0
+        self._segment_file = open(self._segment_path(self._segment), "ab")
+
+    def __enter__(self) -> "HtmlArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def put(self, package: str, region: str, raw_html: Union[str, bytes]) -> bool:
+        """
+        Stores the page of a package/region pair, replacing an earlier page of the pair.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+            raw_html (Union[str, bytes]): The page.
+
+        Returns:
+            bool: True if the page was written to a segment, False if an identical page was already stored.
+        """
+        if self._segment_file is None:
+            raise ValueError("Can not store pages in a read-only html archive")
+        raw_bytes = raw_html.encode("utf-8") if isinstance(raw_html, str) else bytes(raw_html)
+        content_hash = hashlib.sha256(raw_bytes).hexdigest()
+        with self._lock:
+            if self._has_blob(content_hash):
+                self._add_page(package, region, content_hash)
+                return False
+        #Compress outside the lock, so workers can compress pages in parallel
+        compressed = self._compress(raw_bytes)
+        with self._lock:
+            is_new = not self._has_blob(content_hash)
+            if is_new:
+                if self._segment_file.tell() and self._segment_file.tell() + len(compressed) > self._segment_size:
+                    self._segment_file.close()
+                    self._segment += 1
+                    self._segment_file = open(self._segment_path(self._segment), "ab")
+                offset = self._segment_file.tell()
+                self._segment_file.write(compressed)
+                self._segment_file.flush()
+                self._connection.execute("INSERT INTO blobs (content_hash, segment, offset, length, size, codec) VALUES (?, ?, ?, ?, ?, ?)",
+                                         (content_hash, self._segment, offset, len(compressed), len(raw_bytes), self._compression))
+            self._add_page(package, region, content_hash)
+        return is_new
+
+    def get(self, package: str, region: str) -> Union[None, bytes]:
+        """
+        Reads the page of a package/region pair.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+
+        Returns:
+            Union[None, bytes]: The page, or None if the pair is not in the archive.
+        """
+        with self._lock:
+            location = self._connection.execute(
+                "SELECT blobs.segment, blobs.offset, blobs.length, blobs.codec FROM pages JOIN blobs ON blobs.content_hash = pages.content_hash "
+                "WHERE pages.package = ? AND pages.region = ?", (package, region)).fetchone()
+            if location is None:
+                return None
+            segment, offset, length, codec = location
+            segment_map = self._segment_maps.get(segment)
+            if segment_map is None or len(segment_map) < offset + length:
+                #The active segment grows, so it is mapped again when the page is past the mapped part
+                if segment_map is not None:
+                    segment_map.close()
+                with open(self._segment_path(segment), "rb") as segment_file:
+                    segment_map = self._segment_maps[segment] = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            compressed = segment_map[offset:offset + length]
+        return self._decompress(compressed, codec)
+
+    def iter_pages(self) -> Iterator[tuple[str, str, str]]:
+        """
+        Returns the package/region pairs in the archive with the sha256 hash of their page, sorted by package and region.
+
+        Returns:
+            Iterator[tuple[str, str, str]]: Iterator over the (package, region, content hash) tuples.
+        """
+        with self._lock:
+            return iter(self._connection.execute("SELECT package, region, content_hash FROM pages ORDER BY package, region").fetchall())
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the number of stored pages and unique pages, and the total size of the pages before and after compression.
+
+        Returns:
+            dict[str, int]: The "pages", "unique_pages", "size" and "stored_size" of the archive.
+        """
+        with self._lock:
+            pages = self._connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            unique_pages, size, stored_size = self._connection.execute("SELECT COUNT(*), SUM(size), SUM(length) FROM blobs").fetchone()
+        return {"pages": pages, "unique_pages": unique_pages, "size": size or 0, "stored_size": stored_size or 0}
+
+    def commit(self) -> None:
+        """
+        Fsyncs the segment and commits the index.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._commit()
+
+    def close(self) -> None:
+        """
+        Commits the index and closes the archive.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._segment_file is not None:
+                self._commit()
+                self._segment_file.close()
+            for segment_map in self._segment_maps.values():
+                segment_map.close()
+            self._segment_maps.clear()
+            self._connection.close()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self._archive_folder, f"segment_{segment:06d}.bin")
+
+    def _has_blob(self, content_hash: str) -> bool:
+        return self._connection.execute("SELECT 1 FROM blobs WHERE content_hash = ?", (content_hash,)).fetchone() is not None
+
+    def _add_page(self, package: str, region: str, content_hash: str) -> None:
+        self._connection.execute("INSERT OR REPLACE INTO pages (package, region, content_hash) VALUES (?, ?, ?)", (package, region, content_hash))
+        self._pending += 1
+        if self._pending >= self._commit_every or time.monotonic() - self._last_commit >= self._commit_interval:
+            self._commit()
+
+    def _commit(self) -> None:
+        if self._segment_file is None:
+            return
+        #The segment is on disk before the index points to it
+        os.fsync(self._segment_file.fileno())
+        self._connection.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def _compress(self, raw_bytes: bytes) -> bytes:
+        if self._compression == "zstd":
+            return import_zstandard().ZstdCompressor(level=DEFAULT_ZSTD_LEVEL).compress(raw_bytes)
+        return gzip.compress(raw_bytes, compresslevel=DEFAULT_GZIP_LEVEL)
+
+    @staticmethod
+    def _decompress(compressed: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            return import_zstandard().ZstdDecompressor().decompress(compressed)
+        return gzip.decompress(compressed)
+
+def configure_html_archive(archive: Union[None, HtmlArchive]) -> None:
+    """
+    Sets the archive `save_pkg_data` and `read_cached_html` store and read the html pages in. `None` stores
+    each page in its own file in the html output folder. The previous archive is closed.
+
+    Args:
+        archive (Union[None, HtmlArchive]): The archive, or None.
+
+    Returns:
+        None
+    """
+    global _HTML_ARCHIVE
+    previous_archive, _HTML_ARCHIVE = _HTML_ARCHIVE, archive
+    if previous_archive is not None:
+        previous_archive.close()
+
+def save_pkg_data(pkg: str, data_region: str, rating: str, reviews: str, downloads: str, last_updated: str, raw_html: str, output_prefix: str) -> None:
+    """
+    Saves the package data, including metadata and raw HTML, to specified output files.
+
+    This function stores the following information:
+    - Fetched data (name, region, rating, review, download_count, last_update_time) for package into the output csv file.
+    - Raw html into the html file into the html output folder. Name is formed by combining f'{pkgname}_{region}.html'.
+      If an html archive is configured with `configure_html_archive`, the raw html is stored in the archive instead.
+    - Normalized data into the columnar output, if a sink is configured with `configure_columnar_sink`.
+    Output file prefix contained in variable `output_prefix` is considered when outputing data to files.
+    
+    Args:
+        pkg (str): The name of the package.
+        data_region (str): The region from which the package data was fetched.
+        rating (str): The package's rating (in stars).
+        reviews (str): The number of reviews for the package.
+        downloads (str): The number of downloads for the package.
+        last_updated (str): The last update timestamp for the package.
+        raw_html (str): The raw HTML content for the package.
+        output_prefix (str): Output file name prefix.
+
+    Returns:
+        None
+    """
+    # save to CSV file
+    append_to_csv(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}", [pkg, data_region, rating, reviews, downloads, last_updated])
+    if _COLUMNAR_SINK is not None:
+        _COLUMNAR_SINK.write([pkg, data_region, rating, reviews, downloads, last_updated], time.time())
+
+    #save raw html for the package
+    if _HTML_ARCHIVE is not None:
+        _HTML_ARCHIVE.put(pkg, data_region, raw_html)
+        return
+    raw_html_output_path = f"{output_prefix}{OUTPUT_HTML_FOLDER}/{pkg}_{data_region}.html"
+    with open(raw_html_output_path, "w", encoding="utf-8") as file:
+        file.write(raw_html)
+
+def form_playstore_url(pkg: str, language:str, region: str) -> str:
+    """
+    Given playstore package, language and region, forms and returns a valid playstore url.
+
+    Args:
+        pkg (str): Targeted package page.
+        language (str): Targeted language (Optional). Empty or ISO 639-1 language code.
+        region (str): Targeted region (Optional). Empty or ISO 3166-1 alpha-2 country code.
+
+    Returns:
+        str: Valid google playstore url for the targeted parameters.
+    """
+    base_url = f"{_BASE_URL}/store/apps/details?id="
+    playstore_url = f"{base_url}{pkg}"
+    if region:
+        playstore_url = f"{playstore_url}&gl={region}"
+    if language:
+        playstore_url = f"{playstore_url}&hl={language}"
+    return playstore_url
+
+def parse_base_url(value: str) -> str:
+    """
+    Parses the base url of a store, e.g. "http://127.0.0.1:8080" for a local stand-in server.
+
+    Args:
+        value (str): The base url, with or without a trailing '/'.
+
+    Returns:
+        str: The base url without a trailing '/'.
+
+    Raises:
+        ValueError: If the value is not an http or https url of a host.
+    """
+    url = urlsplit(value)
+    if url.scheme not in ("http", "https") or not url.netloc or url.query or url.fragment:
+        raise ValueError(f"Invalid base url, expected e.g. http://127.0.0.1:8080: {value}")
+    return value.rstrip("/")
+
+def configure_base_url(base_url: str = DEFAULT_BASE_URL) -> None:
+    """
+    Sets the base url `form_playstore_url` forms the urls of the package pages with. The pages are requested from
+    `<base_url>/store/apps/details`, e.g. to point the fetcher at a local stand-in server for load tests.
+
+    Args:
+        base_url (str): The base url, see `parse_base_url`. Defaults to the Google Play Store.
+
+    Returns:
+        None
+    """
+    global _BASE_URL
+    _BASE_URL = parse_base_url(base_url)
+
+def parse_duration(value: str) -> float:
+    """
+    Parses a duration like "90", "30m", "12h", "7d" or "2w" into seconds. A number without a unit is in seconds.
+
+    Args:
+        value (str): The duration.
+
+    Returns:
+        float: The duration in seconds.
+
+    Raises:
+        ValueError: If the value is not a duration.
+    """
+    value = value.strip().lower()
+    unit = DURATION_UNITS.get(value[-1:])
+    if unit is not None:
+        value = value[:-1]
+    return float(value) * (unit or 1)
+
+def parse_compact_count(value: str) -> Union[None, float]:
+    """
+    Parses a count the way the Play Store displays it, e.g. "2.64M", "10M+" or "1,234", into a number.
+
+    Args:
+        value (str): The displayed count.
+
+    Returns:
+        Union[None, float]: The count, or None if the value is not a count, e.g. 'Not Found'.
+    """
+    value = value.strip().rstrip("+").replace(",", "").upper()
+    multiplier = COMPACT_COUNT_SUFFIXES.get(value[-1:])
+    if multiplier is not None:
+        value = value[:-1]
+    try:
+        return float(value) * (multiplier or 1)
+    except ValueError:
+        return None
+
+def parse_max_age_tier(value: str) -> tuple[str, float, float]:
+    """
+    Parses a max age tier given as `field:threshold:max_age`, e.g. "downloads:100M:1d".
+
+    For `rating`, `reviews` and `downloads` the tier applies to pairs whose value is at least the threshold. For
+    `last_updated` the threshold is a duration and the tier applies to packages updated within it.
+
+    Args:
+        value (str): The tier.
+
+    Returns:
+        tuple[str, float, float]: The field, the threshold and the max age in seconds.
+
+    Raises:
+        ValueError: If the value is not a tier.
+    """
+    field, threshold, max_age = value.split(":")
+    if field not in STALENESS_TIER_FIELDS:
+        raise ValueError(f"Unknown max age tier field: {field}")
+    threshold_value = parse_duration(threshold) if field == "last_updated" else parse_compact_count(threshold)
+    if threshold_value is None:
+        raise ValueError(f"Invalid max age tier threshold: {threshold}")
+    return field, threshold_value, parse_duration(max_age)
+
+class StalenessPolicy:
+    """
+    Decides when a fetched package/region pair is stale, so it is fetched again.
+
+    A pair is stale once more than its max age has passed since it was fetched. Pairs without a fetch time, e.g. from
+    a cache file written before the fetch time was recorded, are always stale. The default max age can be lowered with
+    tiers on the data points last extracted for the pair, e.g. to refresh popular packages or recently updated packages
+    more often. A pair gets the smallest max age of the tiers it matches. Only the max ages of pairs that match a tier
+    are kept in memory, the other pairs use the default.
+    """
+
+    def __init__(self, max_age: float, tiers: Iterable[tuple[str, float, float]] = ()) -> None:
+        self.max_age = max_age
+        self.tiers = list(tiers)
+        self._pair_max_ages = {}
+
+    def max_age_for_row(self, found_row: list[str]) -> float:
+        """
+        Returns the max age of a pair from the data points extracted for it.
+
+        Args:
+            found_row (list[str]): Row of the pair in the found csv file.
+
+        Returns:
+            float: The max age of the pair in seconds.
+        """
+        max_age = self.max_age
+        for field, threshold, tier_max_age in self.tiers:
+            value = found_row[STALENESS_TIER_FIELDS[field]] if len(found_row) > STALENESS_TIER_FIELDS[field] else ""
+            if field == "last_updated":
+                try:
+                    updated = datetime.strptime(value, "%b %d, %Y").replace(tzinfo=timezone.utc)
+                except ValueError:
+                    continue
+                matches = (datetime.now(timezone.utc) - updated).total_seconds() <= threshold
+            else:
+                count = parse_compact_count(value)
+                matches = count is not None and count >= threshold
+            if matches:
+                max_age = min(max_age, tier_max_age)
+        return max_age
+
+    def load_found_csv(self, found_csv_path: str) -> int:
+        """
+        Reads the max ages of the pairs matching a tier from the found csv file. The last row of a pair is used.
+
+        Args:
+            found_csv_path (str): Path to the found csv file.
+
+        Returns:
+            int: Number of pairs with a max age lowered by a tier.
+        """
+        if not self.tiers or not os.path.exists(found_csv_path):
+            return 0
+        with open(found_csv_path, newline='', encoding='utf-8') as csv_file:
+            for line in csv.reader(csv_file, delimiter=";"):
+                if len(line) < 2:
+                    continue
+                max_age = self.max_age_for_row(line)
+                if max_age < self.max_age:
+                    self._pair_max_ages[(line[0], line[1])] = max_age
+                else:
+                    self._pair_max_ages.pop((line[0], line[1]), None)
+        return len(self._pair_max_ages)
+
+    def max_age_for(self, package: str, region: str) -> float:
+        """
+        Returns the max age of a pair.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+
+        Returns:
+            float: The max age of the pair in seconds.
+        """
+        return self._pair_max_ages.get((package, region), self.max_age)
+
+    def is_stale(self, package: str, region: str, fetched_at: Union[None, float], now: float = None) -> bool:
+        """
+        Checks if a pair fetched at the given time is stale.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+            fetched_at (Union[None, float]): Unix timestamp of the latest fetch of the pair, or None if not known.
+            now (float): Current Unix timestamp. Defaults to the current time.
+
+        Returns:
+            bool: True if the pair should be fetched again.
+        """
+        if fetched_at is None:
+            return True
+        return (now or time.time()) - fetched_at > self.max_age_for(package, region)
+
+def configure_staleness(staleness_policy: Union[None, StalenessPolicy]) -> None:
+    """
+    Sets the policy deciding when fetched pairs of the fetch state store are stale. The csv cache applies its policy
+    when it is read with `read_cached_packages`.
+
+    Args:
+        staleness_policy (Union[None, StalenessPolicy]): The policy, or None to never fetch fetched pairs again.
+
+    Returns:
+        None
+    """
+    global _STALENESS_POLICY
+    _STALENESS_POLICY = staleness_policy
+
+class CacheIndex:
+    """
+    Compact in-memory index of the cached package/region pairs.
+
+    Region codes are interned to bit positions, and each package maps to a bitmask of its cached regions. A
+    membership check is two dictionary lookups and a bit test, instead of a scan of a list of region strings, and a
+    package takes a single small integer however many regions are cached for it. Duplicate rows of the cache file
+    take no extra memory. Stale pairs, decided by a `StalenessPolicy` when the cache file is read, are marked in a
+    second set of bitmasks that only holds the packages with stale pairs.
+    """
+
+    def __init__(self, pairs: Iterable[tuple[str, str]] = ()) -> None:
+        self._region_bits = {}
+        self._masks = {}
+        self._stale_masks = {}
+        self._size = 0
+        for package, region in pairs:
+            self.add(package, region)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, pair: tuple[str, str]) -> bool:
+        package, region = pair
+        region_bit = self._region_bits.get(region)
+        return region_bit is not None and self._masks.get(package, 0) >> region_bit & 1 == 1
+
+    def add(self, package: str, region: str, stale: bool = False) -> bool:
+        """
+        Adds a package/region pair to the index.
+
+        A pair added as stale stays stale until it is added again as fresh, e.g. from a later row of the cache file.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+            stale (bool): True if the pair is stale. Defaults to False.
+
+        Returns:
+            bool: True if the pair was added, False if it was already in the index.
+        """
+        region_bit = self._region_bits.get(region)
+        if region_bit is None:
+            region_bit = self._region_bits[region] = len(self._region_bits)
+        mask = self._masks.get(package, 0)
+        if mask >> region_bit & 1:
+            if not stale and package in self._stale_masks:
+                stale_mask = self._stale_masks.pop(package) & ~(1 << region_bit)
+                if stale_mask:
+                    self._stale_masks[package] = stale_mask
+            return False
+        self._masks[package] = mask | 1 << region_bit
+        if stale:
+            self._stale_masks[package] = self._stale_masks.get(package, 0) | 1 << region_bit
+        self._size += 1
+        return True
+
+    def is_stale(self, package: str, region: str) -> bool:
+        """
+        Checks if a cached pair is stale.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+
+        Returns:
+            bool: True if the pair is cached and stale.
+        """
+        region_bit = self._region_bits.get(region)
+        return region_bit is not None and self._stale_masks.get(package, 0) >> region_bit & 1 == 1
+
+    def stale_count(self) -> int:
+        """
+        Returns the number of stale pairs.
+
+        Returns:
+            int: Number of cached pairs that are stale.
+        """
+        return sum(bin(stale_mask).count("1") for stale_mask in self._stale_masks.values())
+
+    def regions(self, package: str) -> list[str]:
+        """
+        Returns the cached regions of the package.
+
+        Args:
+            package (str): The name of the package.
+
+        Returns:
+            list[str]: The cached regions in the order they were first added to the index.
+        """
+        mask = self._masks.get(package, 0)
+        return [region for region, region_bit in self._region_bits.items() if mask >> region_bit & 1]
+
+    def packages(self) -> Iterator[str]:
+        """
+        Returns the packages that are cached for at least one region.
+
+        Returns:
+            Iterator[str]: Iterator over the package names.
+        """
+        return iter(self._masks)
+
+    @classmethod
+    def from_csv(cls, cache_csv_path: str, staleness_policy: Union[None, StalenessPolicy] = None) -> "CacheIndex":
+        """
+        Loads the index from a cache csv file of `pkg;region;fetched_at` rows.
+
+        Rows are appended in the order the pairs were fetched, so a pair is fresh if any of its rows is fresh.
+        Rows without a fetch time are stale under a policy.
+
+        Args:
+            cache_csv_path (str): Path to the cache csv file.
+            staleness_policy (Union[None, StalenessPolicy]): Policy marking stale pairs, or None to keep every pair fresh.
+
+        Returns:
+            CacheIndex: Index of the pairs in the file.
+        """
+        cache = cls()
+        now = time.time()
+        with open(cache_csv_path, newline='') as csv_file:
+            #pkg;region;fetched_at
+            for line in csv.reader(csv_file, delimiter=";"):
+                if len(line) < 2:
+                    continue
+                stale = False
+                if staleness_policy is not None:
+                    fetched_at = float(line[2]) if len(line) >= 3 and line[2] else None
+                    stale = staleness_policy.is_stale(line[0], line[1], fetched_at, now)
+                cache.add(line[0], line[1], stale)
+        return cache
+
+def read_cached_packages(output_prefix: str, staleness_policy: Union[None, StalenessPolicy] = None) -> CacheIndex:
+    """
+    Reads the package/region pairs from the cache file that have cached data to avoid redundant requests.
+
+    This function parses the cache file into a `CacheIndex` of the pairs that already have cached data.
+    Output file prefix contained in `output_prefix` is considered when reading cache csv file. With a staleness
+    policy, the pairs whose data is too old are marked stale in the index, so they are fetched again.
+
+    Args:
+        output_prefix (str): Output file name prefix.
+        staleness_policy (Union[None, StalenessPolicy]): Policy marking stale pairs. Defaults to None (no stale pairs).
+
+    Returns:
+        CacheIndex: Index of the package/region pairs that have existing cached data.
+    """
+    if os.path.exists(f"{output_prefix}{CACHE_FILE}"):
+        return CacheIndex.from_csv(f"{output_prefix}{CACHE_FILE}", staleness_policy)
+    return CacheIndex()
+    
+def add_package_to_cache(output_prefix: str, cache: CacheIndex, pkg: str, data_region:str, status_code: int = 200) -> None:
+    """
+    Adds the package and its fetched region to the cache and appends it to the cache file.
+
+    This function adds the package/region pair to the cache index. It also appends the package, region and fetch time to the specified cache file. Prefix contained in
+    `output_prefix` is considered when outputing to the cache file. If the cache is a `FetchStateStore`, the pair
+    is recorded as found or missing in the store instead.
+
+    Args:
+        output_prefix (str): Prefix for the output files.
+        cache (CacheIndex): Index of the cached package/region pairs, or a `FetchStateStore`.
+        pkg (str): The name of the package to add to the cache.
+        data_region (str): The region from which the data for the package was fetched.
+        status_code (int): HTTP status of the response, 200 or 404. Defaults to 200.
+
+    Returns:
+        None
+    """
+    if isinstance(cache, FetchStateStore):
+        cache.record(pkg, data_region, FETCH_STATUS_FOUND if status_code == 200 else FETCH_STATUS_MISSING, status_code)
+        return
+    with OUTPUT_LOCK:
+        if isinstance(cache, CacheIndex):
+            cache.add(pkg, data_region)
+        else:
+            cache[pkg].append(data_region)
+        append_to_csv(f"{output_prefix}{CACHE_FILE}", [pkg, data_region, int(time.time())])
+
+def package_is_cached(cache: CacheIndex, package: str, data_region: str) -> bool:
+    """
+    Checks if the package is cached for the specified region.
+
+    This function checks if the given package has cached data for the specified region. Besides a `CacheIndex`
+    and a `FetchStateStore`, a plain dictionary mapping package names to lists of regions is accepted.
+
+    Args:
+        cache (CacheIndex): Index of the cached package/region pairs, or a `FetchStateStore`.
+        package (str): The name of the package to check.
+        data_region (str): The region (ISO 3166-1 alpha-2 country code) to check for the package.
+
+    Returns:
+        bool: True if the package is cached for the specified region, False otherwise.
+    """
+    if isinstance(cache, CacheIndex):
+        return (package, data_region) in cache
+    if isinstance(cache, FetchStateStore):
+        return cache.is_fetched(package, data_region)
+    return package in cache.keys() and data_region in cache[package]
+
+def package_needs_refresh(cache: CacheIndex, package: str, data_region: str) -> bool:
+    """
+    Checks if a cached package/region pair is fetched again, because the run is a refresh run or the pair is stale.
+
+    With the csv cache, stale pairs were marked when the cache was read. With a `FetchStateStore`, the time of the
+    latest fetch of the pair is checked against the policy set with `configure_staleness`.
+
+    Args:
+        cache (CacheIndex): Index of the cached package/region pairs, or a `FetchStateStore`.
+        package (str): The name of the package to check.
+        data_region (str): The region (ISO 3166-1 alpha-2 country code) to check for the package.
+
+    Returns:
+        bool: True if the cached pair is fetched again.
+    """
+    if _REFRESH_CACHED:
+        return True
+    if isinstance(cache, CacheIndex):
+        return cache.is_stale(package, data_region)
+    if isinstance(cache, FetchStateStore) and _STALENESS_POLICY is not None:
+        state = cache.get_state(package, data_region)
+        return state is not None and _STALENESS_POLICY.is_stale(package, data_region, state["last_fetched"])
+    return False
+
+class FetchStateStore:
+    """
+    Fetch state of package/region pairs stored in an SQLite database, used in place of the cache csv file.
+
+    The state of a pair is keyed on (package, region) and holds the fetch status, the HTTP status of the latest
+    request, the times of the first and latest request, the number of requests sent and the validators of the
+    cached page. Lookups use the primary key
+    index, so they stay fast with tens of millions of pairs, unlike scanning the region lists of the cache dictionary.
+    The database is in WAL mode, so other processes can read it during a run. Writes are committed in batches of
+    `commit_every` rows or every `commit_interval` seconds; an interrupted run loses at most the last batch, whose
+    pairs are fetched again on resume. The store is shared by concurrent workers, its connection is guarded by a lock.
+
+    Statuses:
+        found: The page was fetched (200).
+        missing: The Play Store has no page for the pair (404).
+        cached: The pair was imported from the cache csv file of an earlier run.
+        retrying: The latest request failed with a transient error and the pair is retried.
+        error: The pair failed, it is fetched again on the next run.
+    """
+
+    def __init__(self, db_path: str, commit_every: int = DEFAULT_STATE_COMMIT_EVERY, commit_interval: float = DEFAULT_STATE_COMMIT_INTERVAL) -> None:
+        self._lock = threading.Lock()
+        self._commit_every = commit_every
+        self._commit_interval = commit_interval
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        #timeout: wait for the write lock held by other processes instead of failing
+        self._connection = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS fetch_state ("
+            "package TEXT NOT NULL, region TEXT NOT NULL, status TEXT NOT NULL, http_status INTEGER, "
+            "first_fetched REAL, last_fetched REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "etag TEXT, last_modified TEXT, fresh_until REAL, "
+            "PRIMARY KEY (package, region)) WITHOUT ROWID"
+        )
+        #Stores created before the validators were kept
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(fetch_state)")}
+        for column, column_type in (("etag", "TEXT"), ("last_modified", "TEXT"), ("fresh_until", "REAL")):
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE fetch_state ADD COLUMN {column} {column_type}")
+        self._connection.commit()
+
+    def __enter__(self) -> "FetchStateStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def is_fetched(self, package: str, region: str) -> bool:
+        """
+        Checks if the pair has been fetched, i.e. it is found, missing or imported from the cache csv file.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+
+        Returns:
+            bool: True if the pair does not need to be fetched again.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT status FROM fetch_state WHERE package = ? AND region = ?", (package, region)).fetchone()
+        return row is not None and row[0] in FETCHED_STATUSES
+
+    def merge_from(self, db_path: str) -> int:
+        """
+        Copies the states of another fetch state store, e.g. the store of a shard, into this store.
+
+        A pair in both stores keeps the state with the later `last_fetched`. Stores created before the validators were
+        kept are merged without validators.
+
+        Args:
+            db_path (str): Path to the database of the other store.
+
+        Returns:
+            int: Number of states copied.
+        """
+        state_columns = ("package", "region", "status", "http_status", "first_fetched", "last_fetched", "attempts", "etag", "last_modified", "fresh_until")
+        with self._lock:
+            self._connection.commit()
+            self._connection.execute("ATTACH DATABASE ? AS other", (db_path,))
+            try:
+                other_columns = {row[1] for row in self._connection.execute("PRAGMA other.table_info(fetch_state)")}
+                selected_columns = ", ".join(column if column in other_columns else "NULL" for column in state_columns)
+                #WHERE true: an upsert from a SELECT needs a WHERE clause to be parsed
+                cursor = self._connection.execute(
+                    f"INSERT INTO fetch_state ({', '.join(state_columns)}) SELECT {selected_columns} FROM other.fetch_state WHERE true "
+                    "ON CONFLICT (package, region) DO UPDATE SET "
+                    "status = excluded.status, http_status = excluded.http_status, last_fetched = excluded.last_fetched, "
+                    "first_fetched = MIN(COALESCE(fetch_state.first_fetched, excluded.first_fetched), COALESCE(excluded.first_fetched, fetch_state.first_fetched)), "
+                    "attempts = excluded.attempts, etag = excluded.etag, last_modified = excluded.last_modified, fresh_until = excluded.fresh_until "
+                    "WHERE COALESCE(excluded.last_fetched, 0) >= COALESCE(fetch_state.last_fetched, 0)")
+                merged_states = cursor.rowcount
+                self._connection.commit()
+            finally:
+                self._connection.execute("DETACH DATABASE other")
+        return merged_states
+
+    def get_state(self, package: str, region: str) -> Union[None, dict]:
+        """
+        Returns the stored state of the pair.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+
+        Returns:
+            Union[None, dict]: The status, http_status, first_fetched, last_fetched and attempts of the pair, or None if
+            the pair is not in the store.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status, http_status, first_fetched, last_fetched, attempts FROM fetch_state WHERE package = ? AND region = ?",
+                (package, region)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("status", "http_status", "first_fetched", "last_fetched", "attempts"), row))
+
+    def record(self, package: str, region: str, status: str, http_status: int) -> None:
+        """
+        Records a request sent for the pair, counting it in the attempts of the pair.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+            status (str): The new status of the pair.
+            http_status (int): HTTP status of the response, -1 if no response was received.
+
+        Returns:
+            None
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO fetch_state (package, region, status, http_status, first_fetched, last_fetched, attempts) "
+                "VALUES (?, ?, ?, ?, ?, ?, 1) ON CONFLICT (package, region) DO UPDATE SET "
+                "status = excluded.status, http_status = excluded.http_status, last_fetched = excluded.last_fetched, "
+                "first_fetched = COALESCE(fetch_state.first_fetched, excluded.first_fetched), attempts = fetch_state.attempts + 1",
+                (package, region, status, http_status, now, now))
+            self._pending += 1
+            if self._pending >= self._commit_every or time.monotonic() - self._last_commit >= self._commit_interval:
+                self._commit()
+
+    def get_validators(self, package: str, region: str) -> Union[None, tuple[str, str, Union[None, float]]]:
+        """
+        Returns the validators of the cached page of the pair.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+
+        Returns:
+            Union[None, tuple[str, str, Union[None, float]]]: The ETag, Last-Modified and fresh until time of the
+            page, or None if the pair has no validators.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT etag, last_modified, fresh_until FROM fetch_state WHERE package = ? AND region = ?", (package, region)).fetchone()
+        if row is None or (not row[0] and not row[1] and row[2] is None):
+            return None
+        return row[0] or "", row[1] or "", row[2]
+
+    def record_validators(self, package: str, region: str, etag: str, last_modified: str, fresh_until: Union[None, float]) -> None:
+        """
+        Records the validators of the cached page of a pair that is in the store.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+            etag (str): ETag of the page, or an empty string.
+            last_modified (str): Last-Modified date of the page, or an empty string.
+            fresh_until (Union[None, float]): Time until which the page is fresh, or None.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE fetch_state SET etag = ?, last_modified = ?, fresh_until = ? WHERE package = ? AND region = ?",
+                (etag, last_modified, fresh_until, package, region))
+            self._pending += 1
+            if self._pending >= self._commit_every or time.monotonic() - self._last_commit >= self._commit_interval:
+                self._commit()
+
+    def import_cache_csv(self, cache_csv_path: str) -> int:
+        """
+        Imports the pairs of a cache csv file as fetched, so a run started with the csv cache can be resumed.
+
+        A pair with several rows or already in the store keeps the earliest fetch time as `first_fetched` and the latest
+        as `last_fetched`, so a pair fetched again is not seen as stale. The status of a pair already in the store is
+        kept.
+
+        Args:
+            cache_csv_path (str): Path to the cache csv file.
+
+        Returns:
+            int: Number of imported or updated pairs.
+        """
+        if not os.path.exists(cache_csv_path):
+            return 0
+        with open(cache_csv_path, newline='') as csv_file:
+            #pkg;region;fetched_at
+            pairs = ((line[0], line[1], float(line[2]) if len(line) >= 3 and line[2] else None)
+                     for line in csv.reader(csv_file, delimiter=";") if len(line) >= 2)
+            with self._lock:
+                changes_before = self._connection.total_changes
+                #Only rows that move a fetch time are updated, so the number of changes counts the imported pairs
+                self._connection.executemany(
+                    f"INSERT INTO fetch_state (package, region, status, first_fetched, last_fetched) VALUES (?, ?, '{FETCH_STATUS_CACHED}', ?3, ?3) "
+                    "ON CONFLICT(package, region) DO UPDATE SET "
+                    "first_fetched = MIN(COALESCE(fetch_state.first_fetched, excluded.first_fetched), excluded.first_fetched), "
+                    "last_fetched = MAX(COALESCE(fetch_state.last_fetched, excluded.last_fetched), excluded.last_fetched) "
+                    "WHERE excluded.last_fetched IS NOT NULL AND (fetch_state.last_fetched IS NULL OR fetch_state.first_fetched IS NULL "
+                    "OR excluded.last_fetched > fetch_state.last_fetched OR excluded.first_fetched < fetch_state.first_fetched)", pairs)
+                self._commit()
+                return self._connection.total_changes - changes_before
+
+    def status_counts(self) -> dict[str, int]:
+        """
+        Returns the number of pairs in each status.
+
+        Returns:
+            dict[str, int]: Number of pairs keyed by status.
+        """
+        with self._lock:
+            return dict(self._connection.execute("SELECT status, COUNT(*) FROM fetch_state GROUP BY status").fetchall())
+
+    def commit(self) -> None:
+        """
+        Commits the recorded states.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._commit()
+
+    def close(self) -> None:
+        """
+        Commits the recorded states and closes the database.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._commit()
+            self._connection.close()
+
+    def _commit(self) -> None:
+        #Rows are written before the states referring to them are committed
+        flush_output_sink()
+        self._connection.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+def open_fetch_state_store(output_prefix: str) -> FetchStateStore:
+    """
+    Opens the fetch state store of the output files, importing the cache csv file into a new store.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+
+    Returns:
+        FetchStateStore: The opened store.
+    """
+    store = FetchStateStore(f"{output_prefix}{STATE_STORE_FILE}")
+    if not store.status_counts():
+        store.import_cache_csv(f"{output_prefix}{CACHE_FILE}")
+    return store
+
+def record_failed_fetch(cache: Union[CacheIndex, FetchStateStore], package: str, region: str, status_code: int, retried: bool) -> None:
+    """
+    Records a failed request of the pair in the fetch state store. Does nothing with the csv cache, which only
+    holds fetched pairs.
+
+    Args:
+        cache (Union[CacheIndex, FetchStateStore]): The cache index or fetch state store of the run.
+        package (str): The name of the package.
+        region (str): The region of the package.
+        status_code (int): HTTP status of the response, -1 if no response was received.
+        retried (bool): True if the pair is retried.
+
+    Returns:
+        None
+    """
+    if isinstance(cache, FetchStateStore):
+        cache.record(package, region, FETCH_STATUS_RETRYING if retried else FETCH_STATUS_ERROR, status_code)
+
+def open_package_listing(file_path: str) -> io.TextIOBase:
+    """
+    Opens a package listing file for reading, decompressing it if it is gzip compressed.
+
+    Compression is detected from the first bytes of the file, so the file name does not need a `.gz` suffix.
+
+    Args:
+        file_path (str): The file path of the package listing.
+
+    Returns:
+        io.TextIOBase: The opened text file.
+    """
+    with open(file_path, "rb") as file:
+        is_gzip = file.read(2) == GZIP_MAGIC
+    if is_gzip:
+        return gzip.open(file_path, "rt", encoding="utf-8")
+    return open(file_path, "r", encoding="utf-8")
+
+class PackageListReader:
+    """
+    Streams the unique package names of a package listing file.
+
+    The package name is the first column of each line, without a `:process` suffix. Blank lines are skipped, and so
+    is the first line if the file has a header. Duplicates are dropped while the file is read, and the names are
+    yielded in input order, each at its first occurrence:
+    - memory: The names seen so far are kept in a set.
+    - disk: The names and their positions are sorted by name in chunks of `chunk_size` names written to temporary
+      files, which are merged to drop the duplicates. The unique names are then sorted back into input order the
+      same way. Memory use is bounded by the chunk size, so listings bigger than the memory can be read.
+    The counts of the latest pass over the file are kept in `lines`, `packages` and `duplicates`.
+    """
+
+    def __init__(self, file_path: str, dedup: str = "memory", chunk_size: int = DEFAULT_DEDUP_CHUNK_NAMES, header: bool = False) -> None:
+        if dedup not in PACKAGE_DEDUPS:
+            raise ValueError(f"Unknown package deduplication: {dedup}")
+        self.file_path = file_path
+        self.dedup = dedup
+        self.header = header
+        self.chunk_size = max(1, chunk_size)
+        self.lines = 0
+        self.packages = 0
+        self.duplicates = 0
+
+    def __iter__(self) -> Iterator[str]:
+        self.lines = self.packages = self.duplicates = 0
+        unique_names = self._iter_unique_on_disk() if self.dedup == "disk" else self._iter_unique()
+        for package in unique_names:
+            self.packages += 1
+            yield package
+
+    def iter_names(self) -> Iterator[str]:
+        """
+        Yields the package names of the file in input order, duplicates included.
+
+        Returns:
+            Iterator[str]: Iterator over the package names.
+        """
+        with open_package_listing(self.file_path) as file:
+            for line in file:
+                self.lines += 1
+                if self.header and self.lines == 1:
+                    continue
+                # we get only the package name and filter any process postfixes
+                package = line.strip().split(";")[0].split(":")[0].strip()
+                if not package:
+                    continue
+                yield package
+
+    def _iter_unique(self) -> Iterator[str]:
+        seen_packages = set()
+        for package in self.iter_names():
+            if package in seen_packages:
+                self.duplicates += 1
+                continue
+            seen_packages.add(package)
+            yield package
+
+    def _iter_unique_on_disk(self) -> Iterator[str]:
+        with tempfile.TemporaryDirectory(prefix="package_listing_") as temp_folder:
+            #Chunks of the names keyed by name, with the position of their first occurrence in the chunk
+            name_chunk_paths = []
+            chunk = {}
+            for position, package in enumerate(self.iter_names()):
+                if package in chunk:
+                    self.duplicates += 1
+                    continue
+                chunk[package] = position
+                if len(chunk) >= self.chunk_size:
+                    name_chunk_paths.append(self._write_chunk(temp_folder, "names", len(name_chunk_paths), (f"{package}\t{position:020d}" for package, position in chunk.items())))
+                    chunk = {}
+            if not name_chunk_paths:
+                #Fits in a single chunk, no need to go through the disk. The dict keeps the names in input order
+                yield from chunk
+                return
+            if chunk:
+                name_chunk_paths.append(self._write_chunk(temp_folder, "names", len(name_chunk_paths), (f"{package}\t{position:020d}" for package, position in chunk.items())))
+            #Merging by name puts the first occurrence of a name first, the unique names are chunked again keyed by position
+            position_chunk_paths = []
+            unique_lines = []
+            previous_package = None
+            for line in self._merge_chunks(name_chunk_paths):
+                package, _, position = line.partition("\t")
+                if package == previous_package:
+                    self.duplicates += 1
+                    continue
+                previous_package = package
+                unique_lines.append(f"{position}\t{package}")
+                if len(unique_lines) >= self.chunk_size:
+                    position_chunk_paths.append(self._write_chunk(temp_folder, "positions", len(position_chunk_paths), unique_lines))
+                    unique_lines = []
+            if unique_lines:
+                position_chunk_paths.append(self._write_chunk(temp_folder, "positions", len(position_chunk_paths), unique_lines))
+            for line in self._merge_chunks(position_chunk_paths):
+                yield line.partition("\t")[2]
+
+    @staticmethod
+    def _write_chunk(temp_folder: str, kind: str, chunk_number: int, lines: Iterable[str]) -> str:
+        chunk_path = os.path.join(temp_folder, f"{kind}_{chunk_number:06d}.txt")
+        with open(chunk_path, "w", encoding="utf-8") as chunk_file:
+            chunk_file.writelines(f"{line}\n" for line in sorted(lines))
+        return chunk_path
+
+    @staticmethod
+    def _merge_chunks(chunk_paths: list[str]) -> Iterator[str]:
+        with contextlib.ExitStack() as stack:
+            chunk_files = [stack.enter_context(open(chunk_path, encoding="utf-8")) for chunk_path in chunk_paths]
+            for line in heapq.merge(*chunk_files):
+                yield line.rstrip("\n")
+
+def read_package_names(file_path: str, header: bool = False) -> list[str]:
+    """
+    Reads package names from the given file and returns them as a list.
+
+    The names are read with a `PackageListReader`, so blank lines and duplicates are dropped. Large listings should be
+    streamed with the reader instead of being read into a list.
+
+    Args:
+        file_path (str): The file path of the CSV containing the package names.
+        header (bool): If set, the first line of the file is a header and is skipped. Defaults to False.
+
+    Returns:
+        list[str]: A list of the unique package names found in the CSV, in input order.
+    """
+    return list(PackageListReader(file_path, header=header))
+
+@contextlib.contextmanager
+def map_html_file(html_path: str) -> Iterator[Union[bytes, mmap.mmap]]:
+    """
+    Memory-maps a cached html file for reading.
+
+    The mapping can be hashed and parsed with the lxml backend directly, so the page is read from the page cache
+    without copying it into a bytes or str object. The mapping is closed when the context exits. Empty files can
+    not be mapped and are given as empty bytes.
+
+    Args:
+        html_path (str): Path to the html file.
+
+    Returns:
+        Iterator[Union[bytes, mmap.mmap]]: Context manager giving the read-only mapping of the file.
+    """
+    with open(html_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as html_map:
+            yield html_map
+
+def read_cached_html(output_prefix: str, package: str, region: str) -> Union[None, str]:
+    """
+    Reads the cached html page of a package and region.
+
+    The page is read from the html archive, if one is configured, and otherwise from its file in the html output
+    folder. The file is memory-mapped and decoded straight into the returned str, which is the only copy of the page.
+
+    Args:
+        output_prefix (str): The prefix for the output directory where cached HTML files are stored.
+        package (str): The package name for which to retrieve the cached HTML file.
+        region (str): The region associated with the cached HTML file.
+
+    Returns:
+        Union[None, str]: The cached html, or None if the page is not cached.
+    """
+    if _HTML_ARCHIVE is not None:
+        raw_bytes = _HTML_ARCHIVE.get(package, region)
+        return None if raw_bytes is None else raw_bytes.decode("utf-8")
+    html_path = f"{output_prefix}{OUTPUT_HTML_FOLDER}/{package}_{region}.html"
+    if not os.path.exists(html_path):
+        return None
+    with map_html_file(html_path) as html_map:
+        return str(html_map, "utf-8")
+
+def get_cached_html_file(output_prefix :str, package: str, region: str) -> Union[None, requests.Response]:
+    """
+    Retrieves the cached HTML content for a specific package and region.
+
+    This function checks if the cached HTML file for a given package and region exists. 
+    If the file is found, it reads the content and returns a spoofed `requests.Response` object 
+    with a status code of 200 and the HTML content as the response body. If the file does not 
+    exist, it returns `None`. If an html archive is configured, the page is read from the archive instead.
+    The fetch backends use `read_cached_html`, which returns the html without the spoofed response.
+
+    Args:
+        output_prefix (str): The prefix for the output directory where cached HTML files are stored.
+        package (str): The package name for which to retrieve the cached HTML file.
+        region (str): The region associated with the cached HTML file.
+
+    Returns:
+        requests.Response: A `requests.Response` object containing the cached HTML content if the file exists,
+        or `None` if the file is not found.
+    """
+    raw_html = read_cached_html(output_prefix, package, region)
+    if raw_html is None:
+        return None
+    #Spoof a Response object
+    import requests
+    response = requests.Response()
+    response.status_code = 200
+    response._content = raw_html.encode("utf-8")
+    #Pages are always stored utf-8 encoded, do not let requests guess the encoding
+    response.encoding = "utf-8"
+    return response
+
+def configure_revalidation(refresh: bool, page_validators: dict[tuple[str, str], tuple[str, str, Union[None, float]]] = None) -> None:
+    """
+    Sets whether cached package/region pairs are revalidated instead of skipped.
+
+    In a refresh run, the cached page of a pair is requested again with the validators stored from its previous
+    response. A 304 response reuses the cached html, which is extracted again. Pages that are still fresh according
+    to the lifetime given by their previous response are not requested or extracted at all, only their fetch time is
+    updated.
+
+    Args:
+        refresh (bool): True to revalidate the cached pairs.
+        page_validators (dict[tuple[str, str], tuple[str, str, Union[None, float]]]): Validators of the csv cache read
+            with `read_page_validators`. The fetch state store keeps its own validators. Defaults to None (no validators).
+
+    Returns:
+        None
+    """
+    global _REFRESH_CACHED, _PAGE_VALIDATORS
+    _REFRESH_CACHED = refresh
+    _PAGE_VALIDATORS = page_validators or {}
+
+def read_page_validators(output_prefix: str) -> dict[tuple[str, str], tuple[str, str, Union[None, float]]]:
+    """
+    Reads the validators of the cached pages from the validators csv file.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+
+    Returns:
+        dict[tuple[str, str], tuple[str, str, Union[None, float]]]: The ETag, Last-Modified and fresh until time of
+        the cached pages keyed by (package, region).
+    """
+    page_validators = {}
+    validators_csv_path = f"{output_prefix}{OUTPUT_VALIDATORS_CSV_FILE}"
+    if not os.path.exists(validators_csv_path):
+        return page_validators
+    with open(validators_csv_path, newline='', encoding='utf-8') as csv_file:
+        #pkg;region;etag;last_modified;fresh_until, later rows replace the earlier rows of a pair
+        for line in csv.reader(csv_file, delimiter=";"):
+            if len(line) >= 5:
+                page_validators[(line[0], line[1])] = (line[2], line[3], float(line[4]) if line[4] else None)
+    return page_validators
+
+def parse_cache_lifetime(headers: Mapping[str, str]) -> Union[None, float]:
+    """
+    Parses how long a page stays fresh from the `Cache-Control` and `Expires` header fields of its response.
+
+    The `max-age` directive of `Cache-Control` takes precedence over `Expires`. Pages sent with `no-cache` or
+    `no-store` have no lifetime, they are revalidated on every refresh.
+
+    Args:
+        headers (Mapping[str, str]): Headers of the response.
+
+    Returns:
+        Union[None, float]: Seconds the page stays fresh, or None if the response gives no lifetime.
+    """
+    directives = {}
+    for directive in (headers.get("Cache-Control") or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+    if "no-cache" in directives or "no-store" in directives:
+        return None
+    if directives.get("max-age", "").isdigit():
+        return float(directives["max-age"])
+    #An HTTP date like the one in Retry-After
+    return parse_retry_after(headers.get("Expires"))
+
+def parse_page_validators(headers: Mapping[str, str], previous_validators: Union[None, tuple[str, str, Union[None, float]]] = None) -> Union[None, tuple[str, str, Union[None, float]]]:
+    """
+    Reads the validators of a page from the headers of its response.
+
+    A 304 response may leave out the validators that did not change, they are kept from `previous_validators`.
+
+    Args:
+        headers (Mapping[str, str]): Headers of the response.
+        previous_validators (Union[None, tuple[str, str, Union[None, float]]]): Validators sent in the request, or None.
+
+    Returns:
+        Union[None, tuple[str, str, Union[None, float]]]: The ETag, Last-Modified and fresh until time of the page,
+        or None if the response has none of them.
+    """
+    previous_etag, previous_last_modified, _ = previous_validators or ("", "", None)
+    etag = headers.get("ETag") or previous_etag
+    last_modified = headers.get("Last-Modified") or previous_last_modified
+    lifetime = parse_cache_lifetime(headers)
+    fresh_until = None if lifetime is None else time.time() + lifetime
+    if not etag and not last_modified and fresh_until is None:
+        return None
+    return etag, last_modified, fresh_until
+
+def get_page_validators(cache: Union[CacheIndex, FetchStateStore], package: str, region: str) -> Union[None, tuple[str, str, Union[None, float]]]:
+    """
+    Returns the validators of the cached page of the pair, from the fetch state store or the validators read for
+    the csv cache.
+
+    Args:
+        cache (Union[CacheIndex, FetchStateStore]): The cache index or fetch state store of the run.
+        package (str): The name of the package.
+        region (str): The region of the package.
+
+    Returns:
+        Union[None, tuple[str, str, Union[None, float]]]: The ETag, Last-Modified and fresh until time of the page,
+        or None if the pair has no validators.
+    """
+    if isinstance(cache, FetchStateStore):
+        return cache.get_validators(package, region)
+    return _PAGE_VALIDATORS.get((package, region))
+
+def save_page_validators(output_prefix: str, cache: Union[CacheIndex, FetchStateStore], package: str, region: str,
+                         validators: Union[None, tuple[str, str, Union[None, float]]]) -> None:
+    """
+    Saves the validators of a fetched page in the fetch state store, or appends them to the validators csv file.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cache (Union[CacheIndex, FetchStateStore]): The cache index or fetch state store of the run.
+        package (str): The name of the package.
+        region (str): The region of the package.
+        validators (Union[None, tuple[str, str, Union[None, float]]]): Validators from `parse_page_validators`. Nothing
+            is saved if None.
+
+    Returns:
+        None
+    """
+    if validators is None:
+        return
+    if isinstance(cache, FetchStateStore):
+        cache.record_validators(package, region, *validators)
+        return
+    etag, last_modified, fresh_until = validators
+    append_to_csv(f"{output_prefix}{OUTPUT_VALIDATORS_CSV_FILE}", [package, region, etag, last_modified, "" if fresh_until is None else fresh_until])
+
+def get_revalidation_state(output_prefix: str, cache: Union[CacheIndex, FetchStateStore], package: str, region: str) -> tuple[Union[None, tuple[str, str, Union[None, float]]], Union[None, str]]:
+    """
+    Returns the validators and the cached html of a page to revalidate.
+
+    The cached html is read before the request, since a 304 response reuses it. Pages without validators, or whose
+    html is no longer cached, are downloaded again without validators.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cache (Union[CacheIndex, FetchStateStore]): The cache index or fetch state store of the run.
+        package (str): The name of the package.
+        region (str): The region of the package.
+
+    Returns:
+        tuple[Union[None, tuple[str, str, Union[None, float]]], Union[None, str]]: The validators and cached html of
+        the page, or (None, None) if the page can not be revalidated.
+    """
+    validators = get_page_validators(cache, package, region)
+    if validators is None:
+        return None, None
+    cached_html = read_cached_html(output_prefix, package, region)
+    if cached_html is None:
+        return None, None
+    return validators, cached_html
+
+def page_is_fresh(validators: Union[None, tuple[str, str, Union[None, float]]]) -> bool:
+    """
+    Checks if a cached page is still fresh, so it can be reused without revalidating it.
+
+    Args:
+        validators (Union[None, tuple[str, str, Union[None, float]]]): Validators of the page, or None.
+
+    Returns:
+        bool: True if the lifetime given by the previous response of the page has not passed.
+    """
+    return validators is not None and validators[2] is not None and validators[2] > time.time()
+
+def get_conditional_headers(validators: Union[None, tuple[str, str, Union[None, float]]]) -> dict[str, str]:
+    """
+    Forms the headers of a conditional request revalidating a cached page.
+
+    Args:
+        validators (Union[None, tuple[str, str, Union[None, float]]]): Validators of the page, or None.
+
+    Returns:
+        dict[str, str]: The `If-None-Match` and `If-Modified-Since` headers, empty for an unconditional request.
+    """
+    headers = {}
+    if validators is not None:
+        etag, last_modified, _ = validators
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    return headers
+
+def configure_session(pool_size: int = DEFAULT_POOL_SIZE, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT) -> requests.Session:
+    """
+    Creates the shared HTTP session used by `send_request`.
+
+    The session keeps connections to the Play Store alive between requests, so only the first request of each pooled
+    connection pays for the TCP and TLS handshakes. The connection pool holds up to `pool_size` connections per host,
+    which should be at least the number of concurrent workers. Responses are requested compressed with every
+    content encoding urllib3 is able to decode (gzip and deflate, and brotli if a brotli package is installed).
+    Any previously configured session is closed.
+
+    Args:
+        pool_size (int): Maximum number of kept-alive connections per host.
+        connect_timeout (float): Seconds to wait for a connection to be established.
+        read_timeout (float): Seconds to wait for the server to send data.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    global _SESSION, _SESSION_TIMEOUT
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.request import ACCEPT_ENCODING
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=False)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": ACCEPT_ENCODING, "Connection": "keep-alive"})
+    with _SESSION_LOCK:
+        if _SESSION is not None:
+            _SESSION.close()
+        _SESSION = session
+        _SESSION_TIMEOUT = (connect_timeout, read_timeout)
+    return session
+
+def get_session() -> requests.Session:
+    """
+    Returns the shared HTTP session, creating it with the default settings if it has not been configured.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    with _SESSION_LOCK:
+        session = _SESSION
+    return session if session is not None else configure_session()
+
+def get_session_pool_stats() -> dict[str, dict[str, int]]:
+    """
+    Returns connection pool statistics of the shared HTTP session for each pooled host.
+
+    For each host the following counters are returned:
+    - requests: Requests sent through the pool.
+    - connections: New connections opened by the pool.
+    - reused: Requests that reused a kept-alive connection.
+
+    Returns:
+        dict[str, dict[str, int]]: Statistics keyed by "scheme://host:port". Empty if no session is configured.
+    """
+    with _SESSION_LOCK:
+        session = _SESSION
+    pool_stats = {}
+    if session is None:
+        return pool_stats
+    for adapter in {id(a): a for a in session.adapters.values()}.values():
+        pools = adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            pool_stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "requests": pool.num_requests,
+                "connections": pool.num_connections,
+                "reused": max(0, pool.num_requests - pool.num_connections),
+            }
+    return pool_stats
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket rate limiter with AIMD (additive increase, multiplicative decrease) rate control.
+
+    One bucket is kept for each key, which is the region of the request or a single shared key when the whole egress
+    is limited together. A bucket refills at its current rate and holds at most `burst` tokens. Every successful
+    response increases the rate of its bucket by `increase` requests per second up to `max_rate`, and every throttle
+    response (429/503) multiplies it by `decrease_factor` down to `min_rate`. A throttled bucket hands out no tokens
+    until the `Retry-After` time of the response has passed, or for one token interval if no time was given.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, max_rate: float = DEFAULT_MAX_RATE, min_rate: float = DEFAULT_MIN_RATE,
+                 increase: float = 0.1, decrease_factor: float = 0.5, burst: float = 1.0, scope: str = "region") -> None:
+        """
+        Args:
+            rate (float): Initial rate of each bucket in requests per second.
+            max_rate (float): Upper limit for the rate of each bucket.
+            min_rate (float): Lower limit for the rate of each bucket.
+            increase (float): Requests per second added to the rate after each successful response.
+            decrease_factor (float): Multiplier applied to the rate after each throttle response.
+            burst (float): Maximum number of tokens a bucket can hold.
+            scope (str): "region" for a bucket per region, "global" for a single bucket shared by all requests.
+        """
+        self.initial_rate = min(max(rate, min_rate), max_rate)
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.burst = max(1.0, burst)
+        self.scope = scope
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: str, now: float) -> dict:
+        #Bucket state: current rate, available tokens, time of last refill and time until which the bucket is blocked
+        key = key if self.scope == "region" else "*"
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = {"rate": self.initial_rate, "tokens": self.burst, "updated": now, "blocked_until": 0.0}
+            self._buckets[key] = bucket
+        bucket["tokens"] = min(self.burst, bucket["tokens"] + (now - bucket["updated"]) * bucket["rate"])
+        bucket["updated"] = now
+        return bucket
+
+    def reserve(self, key: str) -> float:
+        """
+        Takes a token from the bucket of the key if one is available.
+
+        Args:
+            key (str): Region of the request.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(key, now)
+            if now < bucket["blocked_until"]:
+                return bucket["blocked_until"] - now
+            if bucket["tokens"] >= 1.0:
+                bucket["tokens"] -= 1.0
+                return 0.0
+            return (1.0 - bucket["tokens"]) / bucket["rate"]
+
+    def acquire(self, key: str) -> None:
+        """
+        Blocks the calling thread until a token for the key is available and takes it.
+
+        Args:
+            key (str): Region of the request.
+
+        Returns:
+            None
+        """
+        while (wait_time := self.reserve(key)) > 0:
+            time.sleep(wait_time)
+
+    async def acquire_async(self, key: str) -> None:
+        """
+        Waits without blocking the event loop until a token for the key is available and takes it.
+
+        Args:
+            key (str): Region of the request.
+
+        Returns:
+            None
+        """
+        import asyncio
+        while (wait_time := self.reserve(key)) > 0:
+            await asyncio.sleep(wait_time)
+
+    def on_success(self, key: str) -> None:
+        """
+        Additively increases the rate of the bucket after a response that was not throttled.
+
+        Args:
+            key (str): Region of the request.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            bucket = self._bucket(key, time.monotonic())
+            bucket["rate"] = min(self.max_rate, bucket["rate"] + self.increase)
+
+    def on_throttle(self, key: str, retry_after: Union[None, float] = None) -> None:
+        """
+        Multiplicatively decreases the rate of the bucket after a throttle response and pauses the bucket.
+
+        Args:
+            key (str): Region of the request.
+            retry_after (Union[None, float]): Seconds to wait given by the `Retry-After` header, if any.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(key, now)
+            bucket["rate"] = max(self.min_rate, bucket["rate"] * self.decrease_factor)
+            bucket["tokens"] = 0.0
+            pause = retry_after if retry_after is not None else 1.0 / bucket["rate"]
+            bucket["blocked_until"] = max(bucket["blocked_until"], now + pause)
+
+    def rates(self) -> dict[str, float]:
+        """
+        Returns the current rate of each bucket.
+
+        Returns:
+            dict[str, float]: Requests per second keyed by the bucket key.
+        """
+        with self._lock:
+            return {key: bucket["rate"] for key, bucket in self._buckets.items()}
+
+def configure_rate_limiter(rate_limiter: Union[None, AdaptiveRateLimiter]) -> None:
+    """
+    Sets the rate limiter shared by all fetch backends. `None` disables rate limiting.
+
+    Args:
+        rate_limiter (Union[None, AdaptiveRateLimiter]): The rate limiter to use.
+
+    Returns:
+        None
+    """
+    global _RATE_LIMITER
+    _RATE_LIMITER = rate_limiter
+
+def parse_retry_after(value: Union[None, str]) -> Union[None, float]:
+    """
+    Parses the value of a `Retry-After` header into seconds.
+
+    The header can either hold a number of seconds or an HTTP date.
+
+    Args:
+        value (Union[None, str]): The header value.
+
+    Returns:
+        Union[None, float]: Seconds to wait, or `None` if the value is missing or invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    from email.utils import parsedate_to_datetime
+    try:
+        retry_time = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_time.tzinfo is None:
+        retry_time = retry_time.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_time - datetime.now(timezone.utc)).total_seconds())
+
+def configure_retries(max_attempts: int = DEFAULT_MAX_ATTEMPTS, backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_cap: float = DEFAULT_BACKOFF_CAP,
+                      max_throttled_attempts: int = DEFAULT_MAX_THROTTLED_ATTEMPTS) -> None:
+    """
+    Sets how failed package/region pairs are retried by all fetch backends.
+
+    Throttle responses (429/503) are counted separately from the other failures, so a pair throttled while the
+    rate limiter slows down does not use up the attempts for failed requests and server errors.
+
+    Args:
+        max_attempts (int): Maximum number of failed requests, other than throttled ones, sent for a pair before its failure is recorded.
+        backoff_base (float): Backoff in seconds before the first retry. The backoff is doubled for each further retry.
+        backoff_cap (float): Upper limit for the backoff in seconds.
+        max_throttled_attempts (int): Maximum number of throttled requests sent for a pair before its failure is recorded.
+
+    Returns:
+        None
+    """
+    global _MAX_ATTEMPTS, _MAX_THROTTLED_ATTEMPTS, _BACKOFF_BASE, _BACKOFF_CAP
+    _MAX_ATTEMPTS = max(1, max_attempts)
+    _MAX_THROTTLED_ATTEMPTS = max(1, max_throttled_attempts)
+    _BACKOFF_BASE = backoff_base
+    _BACKOFF_CAP = backoff_cap
+
+def get_retry_delay(attempt: int) -> float:
+    """
+    Returns the backoff before retrying a pair that failed on the given attempt.
+
+    Uses capped exponential backoff with full jitter: a random delay between zero and
+    `min(backoff_cap, backoff_base * 2 ** (attempt - 1))`, so retries of pairs that failed together are spread out.
+
+    Args:
+        attempt (int): The attempt that failed, starting from 1.
+
+    Returns:
+        float: Seconds to wait before the retry.
+    """
+    return random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * 2 ** (attempt - 1)))
+
+def record_fetch_error(output_prefix: str, package: str, region: str, playstore_url: str, status_code: int, exception_msg: str, failure_msg: str) -> None:
+    """
+    Writes a package/region pair that will not be retried to the error csv file.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        package (str): The name of the package that failed.
+        region (str): The region that failed.
+        playstore_url (str): The url that was requested.
+        status_code (int): HTTP status of the response, -1 if no response was received.
+        exception_msg (str): Exception message of the failure, empty if the server returned an error status.
+        failure_msg (str): Console status line describing the failure.
+
+    Returns:
+        None
+    """
+    print(failure_msg)
+    with time_stage("write"):
+        append_to_csv(f"{output_prefix}{OUTPUT_ERROR_CSV_FILE}", [package, region, status_code, playstore_url, exception_msg])
+    if _METRICS is not None:
+        _METRICS.count_pair()
+
+def handle_failed_attempt(output_prefix: str, cached_packages: CacheIndex, package: str, region: str, playstore_url: str, status_code: int, exception_msg: str, attempt: int,
+                          throttles: int, failure_msg: str, retry_delay: float) -> Union[None, tuple[float, int, int]]:
+    """
+    Decides whether a failed package/region pair is retried, or records the failure in the error csv file.
+
+    A pair is retried until `max_attempts` failed requests, not counting throttled ones, have been sent for it.
+    Only pairs that are still failing after the last attempt are written to the error csv file. The failed attempt
+    is recorded in the fetch state store, if one is used.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): The cache index or fetch state store of the run.
+        package (str): The name of the package that failed.
+        region (str): The region that failed.
+        playstore_url (str): The url that was requested.
+        status_code (int): HTTP status of the response, -1 if no response was received.
+        exception_msg (str): Exception message of the failure, empty if the server returned an error status.
+        attempt (int): How many times the pair has been requested without being throttled, including the failed request.
+        throttles (int): How many requests of the pair have been throttled.
+        failure_msg (str): Console status line describing the failure.
+        retry_delay (float): Seconds to wait before the retry.
+
+    Returns:
+        Union[None, tuple[float, int, int]]: Seconds to wait before the pair is fetched again and the attempt and
+        throttle counts of the next request, or None if the pair will not be retried.
+    """
+    with time_stage("write"):
+        record_failed_fetch(cached_packages, package, region, status_code, attempt < _MAX_ATTEMPTS)
+    if attempt < _MAX_ATTEMPTS:
+        print(f"{failure_msg}, retrying in {retry_delay:.1f}s (attempt {attempt}/{_MAX_ATTEMPTS})")
+        if _METRICS is not None:
+            _METRICS.count_retry()
+        return retry_delay, attempt + 1, throttles
+    record_fetch_error(output_prefix, package, region, playstore_url, status_code, exception_msg, failure_msg)
+    return None
+
+def handle_throttle_response(output_prefix: str, cached_packages: CacheIndex, package: str, region: str, playstore_url: str, status_code: int, retry_after: Union[None, str], attempt: int,
+                             throttles: int, status_msg: str) -> Union[None, tuple[float, int, int]]:
+    """
+    Slows down the rate limiter after a throttle response (429/503) and decides whether the pair is fetched again.
+
+    With a rate limiter, the `Retry-After` time pauses the bucket of the region, so the pair can be re-queued
+    right away and waits for the bucket. Without one, the pair itself waits for the `Retry-After` time, or for the
+    exponential backoff if no time was given. Throttled requests do not count against `max_attempts`, only against
+    the much larger `max_throttled_attempts`, so pairs are not written to the error csv file just because the
+    Play Store asked to slow down for a while.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): The cache index or fetch state store of the run.
+        package (str): The name of the package the response is for.
+        region (str): The region the response is for.
+        playstore_url (str): The url that was requested.
+        status_code (int): HTTP status of the response, 429 or 503.
+        retry_after (Union[None, str]): Value of the `Retry-After` header of the response.
+        attempt (int): How many times the pair has been requested without being throttled, including this request.
+        throttles (int): How many earlier requests of the pair have been throttled.
+        status_msg (str): Start of the console status line for the pair.
+
+    Returns:
+        Union[None, tuple[float, int, int]]: Seconds to wait before the pair is fetched again and the attempt and
+        throttle counts of the next request, or None if the pair will not be retried.
+    """
+    throttles += 1
+    retry_seconds = parse_retry_after(retry_after)
+    if _RATE_LIMITER is not None:
+        _RATE_LIMITER.on_throttle(region, retry_seconds)
+        retry_delay = 0.0
+    else:
+        retry_delay = retry_seconds if retry_seconds is not None else get_retry_delay(throttles)
+    failure_msg = f"{status_msg}Server throttled the request ({status_code})"
+    with time_stage("write"):
+        record_failed_fetch(cached_packages, package, region, status_code, throttles < _MAX_THROTTLED_ATTEMPTS)
+    if throttles < _MAX_THROTTLED_ATTEMPTS:
+        print(f"{failure_msg}, retrying in {retry_delay:.1f}s (throttled {throttles}/{_MAX_THROTTLED_ATTEMPTS})")
+        if _METRICS is not None:
+            _METRICS.count_retry()
+        #The attempt is sent again, as the throttled request did not fail
+        return retry_delay, attempt, throttles
+    record_fetch_error(output_prefix, package, region, playstore_url, status_code, "", failure_msg)
+    return None
+
+class RetryQueue:
+    """
+    Queue of package/region pairs waiting for a delayed retry, ordered by the time they become ready.
+    """
+
+    def __init__(self) -> None:
+        self._heap = []
+        self._counter = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, package: str, region: str, attempt: int, delay: float, throttles: int = 0) -> None:
+        """
+        Adds a pair that becomes ready for its next attempt after `delay` seconds.
+
+        Args:
+            package (str): The name of the package.
+            region (str): The region of the package.
+            attempt (int): The number of the next attempt.
+            delay (float): Seconds until the pair is ready.
+            throttles (int): How many requests of the pair have been throttled. Defaults to 0.
+
+        Returns:
+            None
+        """
+        #The counter keeps pairs that are ready at the same time in insertion order
+        heapq.heappush(self._heap, (time.monotonic() + delay, self._counter, package, region, attempt, throttles))
+        self._counter += 1
+
+    def pop_ready(self) -> list[tuple[str, str, int, int]]:
+        """
+        Removes and returns all pairs that are ready for their next attempt.
+
+        Returns:
+            list[tuple[str, str, int, int]]: The ready (package, region, attempt, throttles) tuples.
+        """
+        now = time.monotonic()
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, package, region, attempt, throttles = heapq.heappop(self._heap)
+            ready.append((package, region, attempt, throttles))
+        return ready
+
+    def next_ready_in(self) -> Union[None, float]:
+        """
+        Returns the time until the next pair is ready.
+
+        Returns:
+            Union[None, float]: Seconds until the next pair is ready, or None if the queue is empty.
+        """
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+def format_duration(seconds: float) -> str:
+    """
+    Formats a number of seconds for the console, e.g. 3930 => "1h 05m" and 750 => "12m 30s".
+
+    Args:
+        seconds (float): The duration in seconds.
+
+    Returns:
+        str: The formatted duration.
+    """
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+class FetchMetrics:
+    """
+    Stage timers and counters of a run, shared by the fetch workers.
+
+    The stage timers add up the seconds the workers spend in each stage of the fetch loop: looking up the pair in the
+    cache, reading cached pages, waiting for the rate limiter, the network (DNS lookup and new connections with the
+    asyncio backend, time to the response headers and to the end of the body) and parsing and writing the outputs.
+    With concurrent workers the stages overlap, so their sum is larger than the run time, but their shares still tell
+    whether a run is network-, parse- or disk-bound. The counters hold the responses per HTTP status (-1 for failed
+    requests), the retries, the body bytes received and the pairs that are done.
+    Every `progress_interval` seconds, a progress line with the throughput and the ETA is printed and the metrics are
+    written to `metrics_file`, as Prometheus text if its name ends with `.prom` and as JSON otherwise.
+    """
+
+    def __init__(self, progress_interval: float = DEFAULT_PROGRESS_INTERVAL, metrics_file: str = None, total_pairs: int = None) -> None:
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._metrics_file = metrics_file
+        self.total_pairs = total_pairs
+        self.stage_seconds = dict.fromkeys(METRIC_STAGES, 0.0)
+        self.stage_calls = dict.fromkeys(METRIC_STAGES, 0)
+        self.status_codes = {}
+        self.retries = 0
+        self.body_bytes = 0
+        self.pairs_done = 0
+        self.pairs_skipped = 0
+        self._closed = threading.Event()
+        self._reporter = None
+        if progress_interval > 0:
+            self._reporter = threading.Thread(target=self._report_periodically, args=(progress_interval,), name="metrics-reporter", daemon=True)
+            self._reporter.start()
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        """
+        Adds the seconds spent in a stage.
+
+        Args:
+            stage (str): One of `METRIC_STAGES`.
+            seconds (float): The seconds spent in the stage.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += 1
+
+    @contextlib.contextmanager
+    def time_stage(self, stage: str) -> Iterator[None]:
+        """
+        Times the code run in the `with` block as the given stage.
+
+        Args:
+            stage (str): One of `METRIC_STAGES`.
+
+        Returns:
+            Iterator[None]: The context manager.
+        """
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - stage_start)
+
+    def record_response(self, status_code: int, ttfb: float = None) -> None:
+        """
+        Counts a response by its HTTP status and adds its time to the response headers.
+
+        Args:
+            status_code (int): HTTP status of the response, -1 for a failed request.
+            ttfb (float): Seconds from sending the request to receiving the response headers, or None for a failed request.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+            if ttfb is not None:
+                self.stage_seconds["network_ttfb"] += ttfb
+                self.stage_calls["network_ttfb"] += 1
+
+    def record_body(self, body_bytes: int, seconds: float) -> None:
+        """
+        Counts the bytes of a response body and adds the time it took to receive it.
+
+        Args:
+            body_bytes (int): Size of the body.
+            seconds (float): Seconds from the response headers to the end of the body.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.body_bytes += body_bytes
+            self.stage_seconds["network_body"] += seconds
+            self.stage_calls["network_body"] += 1
+
+    def count_retry(self) -> None:
+        """
+        Counts a pair that failed with a transient error and is retried.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.retries += 1
+
+    def count_pair(self, skipped: bool = False) -> None:
+        """
+        Counts a pair that is done, i.e. saved, missing, failed for good or skipped.
+
+        Args:
+            skipped (bool): True if the pair was skipped as cached.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.pairs_done += 1
+            if skipped:
+                self.pairs_skipped += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current metrics.
+
+        Returns:
+            dict: The elapsed seconds, the pair counts, the counters and the seconds and calls of each stage.
+        """
+        with self._lock:
+            return {
+                "elapsed_seconds": time.monotonic() - self._started,
+                "pairs_done": self.pairs_done,
+                "pairs_skipped": self.pairs_skipped,
+                "pairs_expected": self.total_pairs,
+                "requests": sum(self.status_codes.values()),
+                "status_codes": {str(status_code): count for status_code, count in sorted(self.status_codes.items())},
+                "retries": self.retries,
+                "body_bytes": self.body_bytes,
+                "stages": {stage: {"seconds": self.stage_seconds[stage], "calls": self.stage_calls[stage]} for stage in METRIC_STAGES},
+            }
+
+    def progress_line(self) -> str:
+        """
+        Forms the console progress line: pairs done, throughput, ETA and the share of each stage in the stage time.
+
+        Returns:
+            str: The progress line.
+        """
+        metrics = self.snapshot()
+        elapsed = max(metrics["elapsed_seconds"], 1e-9)
+        pairs_rate = metrics["pairs_done"] / elapsed
+        progress = f"{metrics['pairs_done']} pairs"
+        eta = ""
+        if metrics["pairs_expected"]:
+            progress = f"{metrics['pairs_done']}/{metrics['pairs_expected']} pairs ({100 * metrics['pairs_done'] / metrics['pairs_expected']:.1f}%)"
+            if pairs_rate > 0:
+                eta = f", ETA {format_duration(max(metrics['pairs_expected'] - metrics['pairs_done'], 0) / pairs_rate)}"
+        stage_total = sum(stage["seconds"] for stage in metrics["stages"].values())
+        stage_shares = ", ".join(f"{stage} {100 * stage_metrics['seconds'] / stage_total:.0f}%"
+                                 for stage, stage_metrics in metrics["stages"].items() if stage_metrics["seconds"] > 0) if stage_total > 0 else ""
+        return (f"Progress: {progress}, {pairs_rate:.1f} pairs/s, {metrics['requests'] / elapsed:.1f} requests/s, "
+                f"{metrics['body_bytes'] / elapsed / 1e6:.2f} MB/s{eta}" + (f" | {stage_shares}" if stage_shares else ""))
+
+    def to_prometheus(self) -> str:
+        """
+        Formats the current metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        metrics = self.snapshot()
+        lines = [
+            "# HELP playstore_fetcher_stage_seconds_total Seconds spent in each stage of the fetch loop.",
+            "# TYPE playstore_fetcher_stage_seconds_total counter",
+            *(f'playstore_fetcher_stage_seconds_total{{stage="{stage}"}} {stage_metrics["seconds"]:.6f}' for stage, stage_metrics in metrics["stages"].items()),
+            "# HELP playstore_fetcher_stage_calls_total Number of times each stage of the fetch loop was run.",
+            "# TYPE playstore_fetcher_stage_calls_total counter",
+            *(f'playstore_fetcher_stage_calls_total{{stage="{stage}"}} {stage_metrics["calls"]}' for stage, stage_metrics in metrics["stages"].items()),
+            "# HELP playstore_fetcher_responses_total Responses received by HTTP status, -1 for failed requests.",
+            "# TYPE playstore_fetcher_responses_total counter",
+            *(f'playstore_fetcher_responses_total{{status="{status_code}"}} {count}' for status_code, count in metrics["status_codes"].items()),
+            "# HELP playstore_fetcher_retries_total Pairs retried after a transient error.",
+            "# TYPE playstore_fetcher_retries_total counter",
+            f"playstore_fetcher_retries_total {metrics['retries']}",
+            "# HELP playstore_fetcher_body_bytes_total Bytes of the response bodies received.",
+            "# TYPE playstore_fetcher_body_bytes_total counter",
+            f"playstore_fetcher_body_bytes_total {metrics['body_bytes']}",
+            "# HELP playstore_fetcher_pairs_done_total Package/region pairs done, including the skipped pairs.",
+            "# TYPE playstore_fetcher_pairs_done_total counter",
+            f"playstore_fetcher_pairs_done_total {metrics['pairs_done']}",
+            "# HELP playstore_fetcher_pairs_skipped_total Package/region pairs skipped as cached.",
+            "# TYPE playstore_fetcher_pairs_skipped_total counter",
+            f"playstore_fetcher_pairs_skipped_total {metrics['pairs_skipped']}",
+            "# HELP playstore_fetcher_elapsed_seconds Seconds since the start of the run.",
+            "# TYPE playstore_fetcher_elapsed_seconds gauge",
+            f"playstore_fetcher_elapsed_seconds {metrics['elapsed_seconds']:.3f}",
+        ]
+        if metrics["pairs_expected"] is not None:
+            lines += ["# HELP playstore_fetcher_pairs_expected Expected number of package/region pairs of the run.",
+                      "# TYPE playstore_fetcher_pairs_expected gauge",
+                      f"playstore_fetcher_pairs_expected {metrics['pairs_expected']}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """
+        Writes the current metrics to the metrics file, if one is set. The file is replaced atomically, so a scraper
+        never reads a partly written file.
+
+        Returns:
+            None
+        """
+        if self._metrics_file is None:
+            return
+        metrics_text = self.to_prometheus() if self._metrics_file.endswith(".prom") else json.dumps(self.snapshot(), indent=2)
+        with open(f"{self._metrics_file}.tmp", "w", encoding="utf-8") as file:
+            file.write(metrics_text)
+        os.replace(f"{self._metrics_file}.tmp", self._metrics_file)
+
+    def close(self) -> None:
+        """
+        Stops the periodic reporting and writes the final metrics to the metrics file.
+
+        Returns:
+            None
+        """
+        self._closed.set()
+        if self._reporter is not None:
+            self._reporter.join()
+        self.write()
+
+    def _report_periodically(self, progress_interval: float) -> None:
+        while not self._closed.wait(progress_interval):
+            print(self.progress_line())
+            self.write()
+
+def configure_metrics(metrics: Union[None, FetchMetrics]) -> None:
+    """
+    Sets the metrics the fetch loop records its stage times and counters in. The previous metrics are closed,
+    writing the final metrics file.
+
+    Args:
+        metrics (Union[None, FetchMetrics]): The metrics, or None to record nothing.
+
+    Returns:
+        None
+    """
+    global _METRICS
+    previous_metrics, _METRICS = _METRICS, metrics
+    if previous_metrics is not None:
+        previous_metrics.close()
+
+def time_stage(stage: str) -> contextlib.AbstractContextManager:
+    """
+    Times the code run in the `with` block as the given stage of the configured metrics.
+
+    Args:
+        stage (str): One of `METRIC_STAGES`.
+
+    Returns:
+        contextlib.AbstractContextManager: The timer, or a context manager doing nothing if no metrics are configured.
+    """
+    metrics = _METRICS
+    return metrics.time_stage(stage) if metrics is not None else contextlib.nullcontext()
+
+def estimate_pair_count(file_path: str, regions: list[str], shard: tuple[int, int] = None) -> int:
+    """
+    Estimates the number of package/region pairs of a run for the ETA of the progress lines, from the non-blank lines
+    of the package listing. A header line and duplicate packages are counted too, so the estimate can be slightly high.
+
+    Args:
+        file_path (str): The file path of the package listing.
+        regions (list[str]): Regions to fetch the packages from.
+        shard (tuple[int, int]): The shard index and number of shards of the run, or None.
+
+    Returns:
+        int: The estimated number of pairs.
+    """
+    with open_package_listing(file_path) as listing:
+        package_lines = sum(1 for line in listing if line.strip())
+    pair_count = package_lines * len(set(regions))
+    return pair_count // shard[1] if shard is not None else pair_count
+
+def send_request(url: str, headers: dict[str, str] = None) -> requests.Response:
+    """
+    Makes a Get request to the given url. 
+
+    This function sends a GET request to the specified URL using the shared, pooled session from `get_session`
+    and returns the response object. The connect and read timeouts set with `configure_session` are applied, so a
+    stalled connection raises an exception instead of hanging the run.
+
+    Args:
+        url (str): Target for the get request.
+        headers (dict[str, str]): Extra headers of the request, e.g. from `get_conditional_headers`. Defaults to None.
+
+    Returns:
+        requests.Response: The response object
+    
+    Raises:
+        RequestException: If the request fails for any reason, throws subexception of RequestException
+    """
+    session = get_session()
+    return session.get(url, headers=headers, timeout=_SESSION_TIMEOUT)
+
+def process_playstore_response(output_prefix: str, cached_packages: CacheIndex, package: str, region: str, playstore_url: str, status_code: int, raw_html: str, pkg_is_cached: bool, status_msg: str) -> None:
+    """
+    Handles the Play Store response fetched for a package in a region.
+
+    This function is shared by the thread and asyncio fetch backends. Depending on the HTTP status it:
+    - 200: Extracts the data points from the html and saves them with the raw html.
+    - 404: Adds the package/region pair to the missing csv file.
+    - Other: Adds the package/region pair to the error csv file.
+    Pairs that returned 200 or 404 are added to the cache unless they were already cached. With a fetch state
+    store, errors are recorded in the store too. Parsing and writing are timed in the configured metrics.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+        package (str): The name of the package the response is for.
+        region (str): The region the response is for.
+        playstore_url (str): The url that was requested.
+        status_code (int): HTTP status of the response.
+        raw_html (str): Body of the response.
+        pkg_is_cached (bool): True if the pair is already in the cache.
+        status_msg (str): Start of the console status line for the pair.
+
+    Returns:
+        None
+    """
+    # if the request was successful
+    if status_code == 200 or status_code == 404:
+        status_msg = f"{status_msg}Request success ({status_code}) "
+        if status_code == 200:
+            print(f"{status_msg}Saving data")
+            with time_stage("parse"):
+                rating, downloads, reviews, last_updated = get_app_info_from_html(raw_html)
+            with time_stage("write"):
+                save_pkg_data(package, region, rating, reviews, downloads, last_updated, raw_html, output_prefix)
+        else:
+            print(f"{status_msg}Data not found")
+            with time_stage("write"):
+                append_to_csv(f"{output_prefix}{OUTPUT_MISSING_CSV_FILE}", [package, region, status_code, playstore_url])
+        #Cache the pkg for the region regardless of the HTTP status
+        if not pkg_is_cached:
+            with time_stage("write"):
+                add_package_to_cache(output_prefix, cached_packages, package, region, status_code)
+    else:
+        print(f"{status_msg}Server returned error ({status_code})")
+        with time_stage("write"):
+            record_failed_fetch(cached_packages, package, region, status_code, False)
+            append_to_csv(f"{output_prefix}{OUTPUT_ERROR_CSV_FILE}", [package, region, status_code, playstore_url, ""])
+    if _METRICS is not None:
+        _METRICS.count_pair()
+
+def record_fresh_page(output_prefix: str, cached_packages: CacheIndex, package: str, region: str, status_msg: str) -> None:
+    """
+    Records a cached pair whose page is still fresh as fetched now, without requesting or extracting the page again.
+
+    The data points and the html of the page are already in the outputs, so only the fetch time of the pair is
+    updated, which also ends its staleness.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+        package (str): The name of the package.
+        region (str): The region of the package.
+        status_msg (str): Start of the console status line for the pair.
+
+    Returns:
+        None
+    """
+    print(f"{status_msg}Cached html is fresh, skipping")
+    with time_stage("write"):
+        add_package_to_cache(output_prefix, cached_packages, package, region)
+    if _METRICS is not None:
+        _METRICS.count_pair(skipped=True)
+
+def fetch_playstore_data_for_region(output_prefix: str, cached_packages: CacheIndex, package: str, region: str, use_cached_html: bool, attempt: int = 1,
+                                    throttles: int = 0) -> Union[None, tuple[float, int, int]]:
+    """
+    Fetches Play Store data for a given package in a single region.
+
+    This function interacts with the package cache to fetch Play Store data for the specified package and region.
+    Data is fetched only if it is missing from the cache, or if the cached html file is used for rerunning the
+    extraction. In a refresh run set with `configure_revalidation`, and for stale pairs, cached pairs are requested
+    again with the validators of their cached page, and a 304 response reuses the cached html. Requests wait for a token from the shared rate limiter, if one is configured. Throttle responses
+    (429/503), other server errors (5xx) and failed requests are transient: the caller is told to retry the pair
+    after a delay, until the maximum number of attempts is reached and the failure is recorded in the error csv file.
+    Throttle responses are counted against their own, larger maximum.
+    The console status for the package/region pair is printed as a single line so output from
+    concurrent workers stays readable.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+        package (str): The name of the package to fetch data for.
+        region (str): ISO 3166-1 alpha-2 country code of the region to fetch data for.
+        use_cached_html (bool): If flag is set, cached version of the html file will be used rather than fetching from playstore.
+        attempt (int): How many times the pair has been requested without being throttled, including this request. Defaults to 1.
+        throttles (int): How many earlier requests of the pair have been throttled. Defaults to 0.
+
+    Returns:
+        Union[None, tuple[float, int, int]]: Seconds to wait before the pair is fetched again and the attempt and
+        throttle counts of the next request, or None if the pair is done.
+    """
+    status_msg = f"Collecting {package}/{region}: "
+    #Already fetched? are we rerunning data collection on cached files?
+    with time_stage("cache_lookup"):
+        pkg_is_cached = package_is_cached(cached_packages, package, region)
+        needs_refresh = pkg_is_cached and package_needs_refresh(cached_packages, package, region)
+    if pkg_is_cached and not use_cached_html and not needs_refresh:
+        print(f"{status_msg}Is cached, skipping")
+        if _METRICS is not None:
+            _METRICS.count_pair(skipped=True)
+        return None
+
+    from requests.exceptions import RequestException
+    playstore_url = form_playstore_url(package, "en", region)
+    try:
+        status_code, raw_html = 200, None
+        validators, cached_html, response_validators = None, None, None
+
+        #We are basicly rerunning data collection on cached files
+        if use_cached_html and pkg_is_cached:
+            with time_stage("cache_read"):
+                raw_html = read_cached_html(output_prefix, package, region)
+
+        #Refresh run, revalidate the cached page instead of downloading it again
+        if raw_html is None and needs_refresh:
+            with time_stage("cache_read"):
+                validators, cached_html = get_revalidation_state(output_prefix, cached_packages, package, region)
+            if page_is_fresh(validators):
+                record_fresh_page(output_prefix, cached_packages, package, region, status_msg)
+                return None
+
+        #Not a rerun, or data was not available
+        if raw_html is None:
+            #Set the sleep flag if we are here from failed cache fetch
+            pkg_is_cached = False
+            if _RATE_LIMITER is not None:
+                with time_stage("rate_limit"):
+                    _RATE_LIMITER.acquire(region)
+            #Request may throw exception for various reasons
+            request_start = time.perf_counter()
+            playstore_response = send_request(playstore_url, get_conditional_headers(validators))
+            status_code = playstore_response.status_code
+            if _METRICS is not None:
+                #requests reads the body before returning, elapsed is the time to the response headers
+                request_seconds = time.perf_counter() - request_start
+                ttfb = min(playstore_response.elapsed.total_seconds(), request_seconds)
+                _METRICS.record_response(status_code, ttfb)
+                _METRICS.record_body(len(playstore_response.content), request_seconds - ttfb)
+            if status_code in THROTTLE_STATUS_CODES:
+                return handle_throttle_response(output_prefix, cached_packages, package, region, playstore_url, status_code,
+                                                playstore_response.headers.get("Retry-After"), attempt, throttles, status_msg)
+            if status_code >= 500:
+                return handle_failed_attempt(output_prefix, cached_packages, package, region, playstore_url, status_code, "", attempt, throttles,
+                                             f"{status_msg}Server returned error ({status_code})", get_retry_delay(attempt))
+            if _RATE_LIMITER is not None:
+                _RATE_LIMITER.on_success(region)
+            if status_code == 304 and cached_html is not None:
+                status_code, raw_html = 200, cached_html
+                status_msg = f"{status_msg}Not modified, "
+            else:
+                raw_html = playstore_response.text
+            response_validators = parse_page_validators(playstore_response.headers, validators)
+
+        process_playstore_response(output_prefix, cached_packages, package, region, playstore_url, status_code, raw_html, pkg_is_cached, status_msg)
+        if status_code == 200:
+            with time_stage("write"):
+                save_page_validators(output_prefix, cached_packages, package, region, response_validators)
+    except RequestException as e:
+        if _METRICS is not None:
+            _METRICS.record_response(-1)
+        return handle_failed_attempt(output_prefix, cached_packages, package, region, playstore_url, -1, repr(e), attempt, throttles,
+                                     f"{status_msg}Request failed: {e}", get_retry_delay(attempt))
+    return None
+
+def fetch_playstore_data_from_regions(output_prefix: str, cached_packages: CacheIndex, package: str, regions: list[str], use_cached_html: bool) -> None:
+    """
+    Fetches Play Store data for a given package in each specified region.
+
+    This function interacts with the package cache to fetch Play Store data for the specified package. 
+    It retrieves data for missing regions and updates both the cache and the cache file.
+    Failed regions are retried after their backoff before moving on to the next region.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+        package (str): The name of the package to fetch data for.
+        regions (list[str]): A list of ISO 3166-1 alpha-2 country codes representing the regions to fetch data for.
+        use_cached_html (bool): If flag is set, cached version of the html file will be used rather than fetching from playstore.
+
+    Returns:
+        None
+    """
+    for region in regions:
+        attempt, throttles = 1, 0
+        while (retry := fetch_playstore_data_for_region(output_prefix, cached_packages, package, region, use_cached_html, attempt, throttles)) is not None:
+            retry_delay, attempt, throttles = retry
+            time.sleep(retry_delay)
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """
+    Parses a shard given as `i/N`, e.g. "0/4", into the shard index and the number of shards.
+
+    Shards are numbered from 0, so the shards of a four machine run are 0/4, 1/4, 2/4 and 3/4.
+
+    Args:
+        value (str): The shard.
+
+    Returns:
+        tuple[int, int]: The shard index and the number of shards.
+
+    Raises:
+        ValueError: If the value is not a shard.
+    """
+    index, count = (int(part) for part in value.split("/"))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard, the index must be between 0 and the number of shards - 1: {value}")
+    return index, count
+
+def get_pair_shard(package: str, region: str, shard_count: int) -> int:
+    """
+    Returns the shard a package/region pair belongs to.
+
+    The shard is taken from a hash of the pair instead of Python's `hash`, which is salted per process, so every
+    machine assigns the pair to the same shard.
+
+    Args:
+        package (str): The name of the package.
+        region (str): The region of the package.
+        shard_count (int): Number of shards.
+
+    Returns:
+        int: Index of the shard of the pair.
+    """
+    digest = hashlib.blake2b(f"{package};{region}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+def get_shard_prefix(output_prefix: str, shard: tuple[int, int]) -> str:
+    """
+    Returns the output prefix of a shard, a folder of the shard under the output prefix of the run.
+
+    Args:
+        output_prefix (str): Prefix of the output files of the run.
+        shard (tuple[int, int]): The shard index and the number of shards.
+
+    Returns:
+        str: Prefix of the output files of the shard.
+    """
+    return f"{output_prefix}{SHARD_FOLDER.format(index=shard[0], count=shard[1])}"
+
+def configure_shard(shard: Union[None, tuple[int, int]]) -> None:
+    """
+    Sets the shard whose package/region pairs are fetched.
+
+    Args:
+        shard (Union[None, tuple[int, int]]): The shard index and the number of shards, or None to fetch every pair.
+
+    Returns:
+        None
+    """
+    global _SHARD
+    _SHARD = shard
+
+def iter_package_region_pairs(package_names: Iterable[str], regions: list[str]) -> Iterator[tuple[str, str]]:
+    """
+    Yields every unique (package, region) pair for the given packages and regions.
+
+    Pairs are yielded in input order, each package in all of its regions before the next package.
+    Duplicate pairs are dropped so the same pair is never fetched by two workers at the same time. A
+    `PackageListReader` drops duplicate packages itself, so its names are not tracked again. If a shard is set with
+    `configure_shard`, only the pairs of the shard are yielded.
+
+    Args:
+        package_names (Iterable[str]): Package names to fetch.
+        regions (list[str]): ISO 3166-1 alpha-2 country codes to fetch the packages from.
+
+    Returns:
+        Iterator[tuple[str, str]]: Iterator over the unique (package, region) pairs.
+    """
+    unique_regions = list(dict.fromkeys(regions))
+    seen_packages = None if isinstance(package_names, PackageListReader) else set()
+    for package in package_names:
+        if seen_packages is not None:
+            if package in seen_packages:
+                continue
+            seen_packages.add(package)
+        for region in unique_regions:
+            if _SHARD is None or get_pair_shard(package, region, _SHARD[1]) == _SHARD[0]:
+                yield package, region
+
+def read_download_counts(found_csv_path: str) -> dict[str, float]:
+    """
+    Reads the highest download count of each package from the found csv file.
+
+    Args:
+        found_csv_path (str): Path to the found csv file.
+
+    Returns:
+        dict[str, float]: Download count keyed by package name. Packages without a count are left out.
+    """
+    download_counts = {}
+    if not os.path.exists(found_csv_path):
+        return download_counts
+    downloads_column = STALENESS_TIER_FIELDS["downloads"]
+    with open(found_csv_path, newline='', encoding='utf-8') as csv_file:
+        for line in csv.reader(csv_file, delimiter=";"):
+            if len(line) > downloads_column:
+                downloads = parse_compact_count(line[downloads_column])
+                if downloads is not None and downloads > download_counts.get(line[0], -1):
+                    download_counts[line[0]] = downloads
+    return download_counts
+
+class FetchScheduler:
+    """
+    Builds the work set of package/region pairs once and dispatches it interleaved by region.
+
+    Cached pairs that do not need a refresh are dropped while the work set is built, before any request is sent.
+    The remaining pairs are put in a queue per region, ordered by the priority:
+    - input: The order of the input file.
+    - staleness: Cached pairs that need a refresh first, then the pairs that were never fetched.
+    - downloads: Packages with the most downloads in the found csv file first.
+    - A callable taking the package and region and returning a sort key, lowest first.
+    The queues are dispatched in a staggered round robin: every round takes one pair from each region, and each
+    region starts one round after the previous one. Consecutive requests are for different regions and, with the
+    same package order in every region, for different packages, so a package is never requested in all regions in
+    a burst.
+    """
+
+    def __init__(self, priority: Union[str, Callable[[str, str], any]] = "input", found_csv_path: str = None) -> None:
+        if isinstance(priority, str) and priority not in SCHEDULE_ORDERS[1:]:
+            raise ValueError(f"Unknown schedule priority: {priority}")
+        self.priority = priority
+        self.found_csv_path = found_csv_path
+        self.scheduled = 0
+        self.skipped = 0
+        self._queues = {}
+
+    def build(self, package_names: Iterable[str], regions: list[str], cached_packages: CacheIndex, use_cached_html: bool) -> int:
+        """
+        Builds the work set from the packages and regions, dropping the cached pairs that do not need a refresh.
+
+        Args:
+            package_names (Iterable[str]): Package names to fetch.
+            regions (list[str]): ISO 3166-1 alpha-2 country codes to fetch the packages from.
+            cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+            use_cached_html (bool): If set, cached pairs are kept to rerun the extraction on their cached html.
+
+        Returns:
+            int: Number of scheduled pairs.
+        """
+        #The regions are dispatched in the given order
+        self._queues = {region: [] for region in regions}
+        self.scheduled = self.skipped = 0
+        refresh_pairs = set()
+        for package, region in iter_package_region_pairs(package_names, regions):
+            if package_is_cached(cached_packages, package, region) and not use_cached_html:
+                if not package_needs_refresh(cached_packages, package, region):
+                    self.skipped += 1
+                    continue
+                if self.priority == "staleness":
+                    refresh_pairs.add((package, region))
+            self._queues[region].append(package)
+            self.scheduled += 1
+        priority_key = self._priority_key(refresh_pairs)
+        if priority_key is not None:
+            for region, queue in self._queues.items():
+                #Sorting is stable, pairs of the same priority stay in input order
+                queue.sort(key=lambda package: priority_key(package, region))
+        return self.scheduled
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        queues = [(region, deque(queue)) for region, queue in self._queues.items()]
+        self._queues = {}
+        dispatch_round = 0
+        while queues:
+            for region_number, (region, queue) in enumerate(queues):
+                if region_number <= dispatch_round and queue:
+                    yield queue.popleft(), region
+            queues = [(region, queue) for region, queue in queues if queue]
+            dispatch_round += 1
+
+    def _priority_key(self, refresh_pairs: set[tuple[str, str]]) -> Union[None, Callable[[str, str], any]]:
+        if callable(self.priority):
+            return self.priority
+        if self.priority == "staleness":
+            return lambda package, region: 0 if (package, region) in refresh_pairs else 1
+        if self.priority == "downloads":
+            download_counts = read_download_counts(self.found_csv_path) if self.found_csv_path else {}
+            return lambda package, region: -download_counts.get(package, 0)
+        return None
+
+def configure_scheduler(scheduler: Union[None, FetchScheduler]) -> None:
+    """
+    Sets the scheduler the fetch backends take their package/region pairs from.
+
+    Args:
+        scheduler (Union[None, FetchScheduler]): The scheduler, or None to stream the pairs in input order.
+
+    Returns:
+        None
+    """
+    global _SCHEDULER
+    _SCHEDULER = scheduler
+
+def iter_scheduled_pairs(package_names: Iterable[str], regions: list[str], cached_packages: CacheIndex, use_cached_html: bool) -> Iterator[tuple[str, str]]:
+    """
+    Returns the package/region pairs to fetch, from the scheduler set with `configure_scheduler` or streamed in
+    input order from `iter_package_region_pairs`.
+
+    Args:
+        package_names (Iterable[str]): Package names to fetch.
+        regions (list[str]): ISO 3166-1 alpha-2 country codes to fetch the packages from.
+        cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+        use_cached_html (bool): If flag is set, cached version of the html file will be used rather than fetching from playstore.
+
+    Returns:
+        Iterator[tuple[str, str]]: Iterator over the pairs to fetch.
+    """
+    if _SCHEDULER is None:
+        return iter_package_region_pairs(package_names, regions)
+    _SCHEDULER.build(package_names, regions, cached_packages, use_cached_html)
+    print(f"Scheduled {_SCHEDULER.scheduled} package/region pairs, skipped {_SCHEDULER.skipped} cached pairs")
+    if _METRICS is not None:
+        _METRICS.total_pairs = _SCHEDULER.scheduled
+    return iter(_SCHEDULER)
+
+def fetch_playstore_data_sequentially(output_prefix: str, cached_packages: CacheIndex, package_names: Iterable[str], regions: list[str], use_cached_html: bool) -> None:
+    """
+    Fetches Play Store data for the given packages and regions one pair at a time.
+
+    Pairs that failed with a transient error are put in a `RetryQueue` and fetched again once their backoff has
+    passed, in between the remaining pairs, so a failing pair does not stall the run. After the last pair the
+    loop waits for the remaining retries.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+        package_names (Iterable[str]): Package names to fetch data for.
+        regions (list[str]): A list of ISO 3166-1 alpha-2 country codes representing the regions to fetch data for.
+        use_cached_html (bool): If flag is set, cached version of the html file will be used rather than fetching from playstore.
+
+    Returns:
+        None
+    """
+    retry_queue = RetryQueue()
+
+    def fetch(package: str, region: str, attempt: int, throttles: int) -> None:
+        retry = fetch_playstore_data_for_region(output_prefix, cached_packages, package, region, use_cached_html, attempt, throttles)
+        if retry is not None:
+            retry_delay, attempt, throttles = retry
+            retry_queue.push(package, region, attempt, retry_delay, throttles)
+
+    for package, region in iter_scheduled_pairs(package_names, regions, cached_packages, use_cached_html):
+        for retry in retry_queue.pop_ready():
+            fetch(*retry)
+        fetch(package, region, 1, 0)
+    while retry_queue:
+        time.sleep(retry_queue.next_ready_in())
+        for retry in retry_queue.pop_ready():
+            fetch(*retry)
+
+def fetch_playstore_data_concurrently(output_prefix: str, cached_packages: CacheIndex, package_names: Iterable[str], regions: list[str], use_cached_html: bool, workers: int) -> None:
+    """
+    Fetches Play Store data for the given packages and regions using a bounded pool of worker threads.
+
+    Each (package, region) pair is fetched by `fetch_playstore_data_for_region` in a worker thread. At most
+    `2 * workers` pairs are queued at once so huge package listings are not loaded into the pool up front.
+    Pairs that are already cached are skipped before they are queued, unless cached html files are reused or the
+    pair needs a refresh.
+    Cache and csv writes are serialized with `OUTPUT_LOCK`, and a pair is written to the cache only after its
+    data row, so a run can be resumed from the cache file at any point. Pairs that failed with a transient error
+    wait in a `RetryQueue` without holding a worker, and are queued again ahead of new pairs once their backoff
+    has passed.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+        package_names (Iterable[str]): Package names to fetch data for.
+        regions (list[str]): A list of ISO 3166-1 alpha-2 country codes representing the regions to fetch data for.
+        use_cached_html (bool): If flag is set, cached version of the html file will be used rather than fetching from playstore.
+        workers (int): Number of worker threads fetching pairs concurrently.
 
-def append_to_csv(output_path: str, data: Iterable[any]) -> None:
+    Returns:
+        None
     """
-    Appends the given data to the given csv file.
+    max_queued = max(1, workers) * 2
+    retry_queue = RetryQueue()
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        #Maps each queued future to its (package, region)
+        in_flight = {}
 
-    If the given path does not exist, creates the csv file. Proceeds to append the given data to the
-    given csv file.
+        def submit(package: str, region: str, attempt: int, throttles: int) -> None:
+            future = executor.submit(fetch_playstore_data_for_region, output_prefix, cached_packages, package, region, use_cached_html, attempt, throttles)
+            in_flight[future] = (package, region)
+
+        def collect() -> None:
+            #Wait for a finished pair, or until the next retry is ready
+            if in_flight:
+                done, _ = wait(in_flight, timeout=retry_queue.next_ready_in(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    package, region = in_flight.pop(future)
+                    retry = future.result()
+                    if retry is not None:
+                        retry_delay, attempt, throttles = retry
+                        retry_queue.push(package, region, attempt, retry_delay, throttles)
+            elif retry_queue:
+                time.sleep(retry_queue.next_ready_in())
+            for retry in retry_queue.pop_ready():
+                submit(*retry)
+
+        for package, region in iter_scheduled_pairs(package_names, regions, cached_packages, use_cached_html):
+            if not use_cached_html and package_is_cached(cached_packages, package, region) and not package_needs_refresh(cached_packages, package, region):
+                print(f"Collecting {package}/{region}: Is cached, skipping")
+                if _METRICS is not None:
+                    _METRICS.count_pair(skipped=True)
+                continue
+            #Wait for a free slot before queueing more work
+            while len(in_flight) >= max_queued:
+                collect()
+            submit(package, region, 1, 0)
+        while in_flight or retry_queue:
+            collect()
+
+def import_aiohttp():
+    """
+    Imports the optional `aiohttp` package used by the asyncio fetch backend.
+
+    Returns:
+        module: The `aiohttp` module, or `None` if it is not installed.
+    """
+    try:
+        import aiohttp
+        return aiohttp
+    except ImportError:
+        return None
+
+async def fetch_playstore_data_for_region_async(session, output_prefix: str, cached_packages: CacheIndex, package: str, region: str, use_cached_html: bool, attempt: int = 1,
+                                                throttles: int = 0) -> Union[None, tuple[float, int, int]]:
+    """
+    Fetches Play Store data for a given package in a single region using the asyncio backend.
+
+    Coroutine version of `fetch_playstore_data_for_region`. The page is requested with the given `aiohttp` session,
+    while reading cached html files, parsing and writing the outputs are done in worker threads so the event loop
+    is never blocked by disk or CPU work.
 
     Args:
-        output_path (str): Path to the csv file.
-        data (Iterable[any]): Data to output to the csv file.
-    
+        session (aiohttp.ClientSession): Session used to send the request.
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+        package (str): The name of the package to fetch data for.
+        region (str): ISO 3166-1 alpha-2 country code of the region to fetch data for.
+        use_cached_html (bool): If flag is set, cached version of the html file will be used rather than fetching from playstore.
+        attempt (int): How many times the pair has been requested without being throttled, including this request. Defaults to 1.
+        throttles (int): How many earlier requests of the pair have been throttled. Defaults to 0.
+
     Returns:
-        None
+        Union[None, tuple[float, int, int]]: Seconds to wait before the pair is fetched again and the attempt and
+        throttle counts of the next request, or None if the pair is done.
     """
-    with open(output_path, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file, delimiter=";")
-        writer.writerow(data)
+    aiohttp = import_aiohttp()
+    status_msg = f"Collecting {package}/{region}: "
+    with time_stage("cache_lookup"):
+        pkg_is_cached = package_is_cached(cached_packages, package, region)
+        needs_refresh = pkg_is_cached and package_needs_refresh(cached_packages, package, region)
+    if pkg_is_cached and not use_cached_html and not needs_refresh:
+        print(f"{status_msg}Is cached, skipping")
+        if _METRICS is not None:
+            _METRICS.count_pair(skipped=True)
+        return None
+
+    import asyncio
+    playstore_url = form_playstore_url(package, "en", region)
+    try:
+        status_code, raw_html = 200, None
+        validators, cached_html, response_validators = None, None, None
+        if use_cached_html and pkg_is_cached:
+            with time_stage("cache_read"):
+                raw_html = await asyncio.to_thread(read_cached_html, output_prefix, package, region)
+
+        if raw_html is None and needs_refresh:
+            with time_stage("cache_read"):
+                validators, cached_html = await asyncio.to_thread(get_revalidation_state, output_prefix, cached_packages, package, region)
+            if page_is_fresh(validators):
+                await asyncio.to_thread(record_fresh_page, output_prefix, cached_packages, package, region, status_msg)
+                return None
+
+        if raw_html is None:
+            pkg_is_cached = False
+            if _RATE_LIMITER is not None:
+                with time_stage("rate_limit"):
+                    await _RATE_LIMITER.acquire_async(region)
+            request_start = time.perf_counter()
+            async with session.get(playstore_url, headers=get_conditional_headers(validators)) as response:
+                status_code = response.status
+                if _METRICS is not None:
+                    _METRICS.record_response(status_code, time.perf_counter() - request_start)
+                if status_code in THROTTLE_STATUS_CODES:
+                    return await asyncio.to_thread(handle_throttle_response, output_prefix, cached_packages, package, region, playstore_url, status_code,
+                                                   response.headers.get("Retry-After"), attempt, throttles, status_msg)
+                if status_code >= 500:
+                    return await asyncio.to_thread(handle_failed_attempt, output_prefix, cached_packages, package, region, playstore_url, status_code, "", attempt, throttles,
+                                                   f"{status_msg}Server returned error ({status_code})", get_retry_delay(attempt))
+                if status_code == 304 and cached_html is not None:
+                    status_code, raw_html = 200, cached_html
+                    status_msg = f"{status_msg}Not modified, "
+                else:
+                    body_start = time.perf_counter()
+                    body = await response.read()
+                    #A charset that does not match the body must not fail the pair, so undecodable bytes are replaced
+                    raw_html = body.decode(response.get_encoding(), errors="replace")
+                    if _METRICS is not None:
+                        _METRICS.record_body(len(body), time.perf_counter() - body_start)
+                response_validators = parse_page_validators(response.headers, validators)
+            if _RATE_LIMITER is not None:
+                _RATE_LIMITER.on_success(region)
+
+        await asyncio.to_thread(process_playstore_response, output_prefix, cached_packages, package, region, playstore_url, status_code, raw_html, pkg_is_cached, status_msg)
+        if status_code == 200:
+            with time_stage("write"):
+                await asyncio.to_thread(save_page_validators, output_prefix, cached_packages, package, region, response_validators)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if _METRICS is not None:
+            _METRICS.record_response(-1)
+        return await asyncio.to_thread(handle_failed_attempt, output_prefix, cached_packages, package, region, playstore_url, -1, repr(e), attempt, throttles,
+                                       f"{status_msg}Request failed: {e}", get_retry_delay(attempt))
+    return None
 
-def get_app_info_from_html(raw_html: str) -> tuple[str, str, str, str]:
+def create_metrics_trace_config(aiohttp):
     """
-    Extracts data points from the given HTML.
+    Creates an `aiohttp` trace config timing the DNS lookups and the new connections of the asyncio backend in the
+    configured metrics. The connection time includes the DNS lookup of the connection.
 
-    Parses html using BeautifulSoup. 
-    If present in the html, extracts the following data points and returns them in this order:
-    - Ratings: The number of stars.
-    - Download count: The number of times the app was downloaded.
-    - Review count: The number of reviews left.
-    - Last update time: When was the last update released for the app.   
-    If data point is not present in the html, 'Not found' is returned for it.
-    
     Args:
-        raw_html (str): HTML containing the data points
+        aiohttp (module): The `aiohttp` module.
 
     Returns:
-        tuple[str, str, str, str]: A tuple containing the rating, review count, download count and last update time as strings in that order.
-        If any of the data points are not found, they are represented by the string 'Not Found'.
+        aiohttp.TraceConfig: The trace config.
     """
-    soup = BeautifulSoup(raw_html, 'lxml')
-
-    #CSS selector paths for data
-    scrape_css_data = {
-        "star_rating": {
-            "css_selector" : "div.l8YSdd div.w7Iutd div.wVqUob div.ClM7O div div.TT9eCd",
-            "filter": r"(?:[^\w\d]*)(\d+\.\d+|\d+)(?=[A-Za-z]+)", 
-            "value_func": lambda filter: filter[0] if isinstance(filter[0], str) else filter[0][0]
-        },
-        "download_count": {
-            "css_selector" : "div.l8YSdd div.w7Iutd div div.ClM7O:not(:has(> img)):not(:has(> div)):not(:has(> span))",
-            "filter": r"(\d+(\.\d+)?[KMB]?\+?)", 
-            "value_func": lambda filter: filter[0] if isinstance(filter[0], str) else filter[0][0]
-        }, #Tricky to select
-        "review_count": {
-            "css_selector" : "div.l8YSdd div.w7Iutd div.wVqUob div.g1rdde",
-            "filter": r"(\d+(\.\d+)?[KMB]?\+?)",
-            "value_func": lambda filter: filter[0] if isinstance(filter[0], str) else filter[0][0]
-        }, #If rating data is not available, will match to "downloads" text. Filter handles it.
-        "last_updated_time": {
-            "css_selector" : "div.xg1aie", 
-            "filter": r"\b(?:[A-Za-z]{3} \d{1,2},? \d{4}|\d{1,2} [A-Za-z]{3} \d{4}|\d{1,2} [A-Za-z]{3},? \d{4})\b",
-            "value_func": lambda filter: parser.parse(' '.join([v for v in filter if v])).strftime("%b %d, %Y")
-        },
-    }
-    scaped_data = {k:"Not Found" for k,p in scrape_css_data.items()}
-    #Try to find data for each defined css path
-    for data_key, scrape_data in scrape_css_data.items():
-         html_element = soup.select_one(scrape_data["css_selector"])
-         if html_element:
-            #Filter all the non wanted elements
-            filtered_regex = re.findall(scrape_data["filter"], html_element.get_text(strip=True))
-            if filtered_regex:
-                filtered_value = scrape_data["value_func"](filtered_regex)
-                if filtered_value:
-                    scaped_data[data_key] = filtered_value
+    trace_config = aiohttp.TraceConfig()
 
-    #This expects that we use python +3.7, dict order needs to be guaranteed
-    return tuple(scaped_data.values())
+    async def on_dns_resolvehost_start(session, context, params) -> None:
+        context.dns_start = time.perf_counter()
 
-def save_pkg_data(pkg: str, data_region: str, rating: str, reviews: str, downloads: str, last_updated: str, raw_html: str, output_prefix: str) -> None:
+    async def on_dns_resolvehost_end(session, context, params) -> None:
+        if _METRICS is not None:
+            _METRICS.add_time("network_dns", time.perf_counter() - context.dns_start)
+
+    async def on_connection_create_start(session, context, params) -> None:
+        context.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params) -> None:
+        if _METRICS is not None:
+            _METRICS.add_time("network_connect", time.perf_counter() - context.connect_start)
+
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+async def fetch_playstore_data_async(output_prefix: str, cached_packages: CacheIndex, package_names: Iterable[str], regions: list[str], use_cached_html: bool, max_in_flight: int) -> None:
     """
-    Saves the package data, including metadata and raw HTML, to specified output files.
+    Fetches Play Store data for the given packages and regions with a bounded window of asyncio requests.
+
+    `max_in_flight` coroutines share one iterator over the unique (package, region) pairs, so at most that many
+    requests are in flight at any time and the pairs are never all materialized in memory. Pairs that failed with
+    a transient error wait in a shared `RetryQueue` without holding a slot, and are taken ahead of new pairs once
+    their backoff has passed. All coroutines share a single `aiohttp` session whose connection pool is sized to the
+    window. The connect and read timeouts of the shared session set with `configure_session` are applied to the
+    `aiohttp` session as well.
 
-    This function stores the following information:
-    - Fetched data (name, region, rating, review, download_count, last_update_time) for package into the output csv file.
-    - Raw html into the html file into the html output folder. Name is formed by combining f'{pkgname}_{region}.html'.
-    Output file prefix contained in variable `output_prefix` is considered when outputing data to files.
-    
     Args:
-        pkg (str): The name of the package.
-        data_region (str): The region from which the package data was fetched.
-        rating (str): The package's rating (in stars).
-        reviews (str): The number of reviews for the package.
-        downloads (str): The number of downloads for the package.
-        last_updated (str): The last update timestamp for the package.
-        raw_html (str): The raw HTML content for the package.
-        output_prefix (str): Output file name prefix.
+        output_prefix (str): Prefix of the output files.
+        cached_packages (CacheIndex): Index of the package/region pairs where data has been fetched.
+        package_names (Iterable[str]): Package names to fetch data for.
+        regions (list[str]): A list of ISO 3166-1 alpha-2 country codes representing the regions to fetch data for.
+        use_cached_html (bool): If flag is set, cached version of the html file will be used rather than fetching from playstore.
+        max_in_flight (int): Maximum number of requests in flight at the same time.
 
     Returns:
         None
     """
-    # save to CSV file
-    append_to_csv(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}", [pkg, data_region, rating, reviews, downloads, last_updated])
+    import asyncio
+    aiohttp = import_aiohttp()
+    pairs = iter_scheduled_pairs(package_names, regions, cached_packages, use_cached_html)
+    retry_queue = RetryQueue()
+    ready_retries = deque()
+    #Number of coroutines fetching a pair, their pairs may still end up in the retry queue
+    active_fetches = 0
+    #Set when a fetch ends, so idle workers check again for a retry to take or for the end of the run
+    fetch_ended = asyncio.Event()
 
-    #save raw html for the package
-    raw_html_output_path = f"{output_prefix}{OUTPUT_HTML_FOLDER}/{pkg}_{data_region}.html"
-    with open(raw_html_output_path, "w", encoding="utf-8") as file:
-        file.write(raw_html)
+    def next_pair() -> Union[None, tuple[str, str, int, int]]:
+        ready_retries.extend(retry_queue.pop_ready())
+        if ready_retries:
+            return ready_retries.popleft()
+        package, region = next(pairs, (None, None))
+        return None if package is None else (package, region, 1, 0)
 
-def form_playstore_url(pkg: str, language:str, region: str) -> str:
+    async def fetch_worker(session) -> None:
+        nonlocal active_fetches
+        #The event loop is single threaded, so the shared iterator and queues need no locking
+        while True:
+            pair = next_pair()
+            if pair is None:
+                if not retry_queue and not active_fetches:
+                    return
+                #Sleep until the next retry is ready or another fetch ends, whichever comes first
+                fetch_ended.clear()
+                try:
+                    await asyncio.wait_for(fetch_ended.wait(), timeout=retry_queue.next_ready_in())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            package, region, attempt, throttles = pair
+            active_fetches += 1
+            retry = None
+            try:
+                retry = await fetch_playstore_data_for_region_async(session, output_prefix, cached_packages, package, region, use_cached_html, attempt, throttles)
+            finally:
+                active_fetches -= 1
+                if retry is not None:
+                    retry_delay, attempt, throttles = retry
+                    retry_queue.push(package, region, attempt, retry_delay, throttles)
+                fetch_ended.set()
+
+    connector = aiohttp.TCPConnector(limit=max(1, max_in_flight))
+    connect_timeout, read_timeout = _SESSION_TIMEOUT
+    timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+    trace_configs = [create_metrics_trace_config(aiohttp)] if _METRICS is not None else []
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=trace_configs) as session:
+        await asyncio.gather(*(fetch_worker(session) for _ in range(max(1, max_in_flight))))
+
+            
+def iter_cached_html_files(output_prefix: str) -> Iterator[tuple[str, str, str]]:
     """
-    Given playstore package, language and region, forms and returns a valid playstore url.
+    Yields the package, region and path of every cached html file in the html output folder.
+
+    The files are named `{package}_{region}.html`. Package names can contain underscores, so the region is taken
+    from after the last underscore. Files are yielded sorted by name so reprocessing outputs are reproducible.
 
     Args:
-        pkg (str): Targeted package page.
-        language (str): Targeted language (Optional). Empty or ISO 639-1 language code.
-        region (str): Targeted region (Optional). Empty or ISO 3166-1 alpha-2 country code.
+        output_prefix (str): Prefix of the output files.
 
     Returns:
-        str: Valid google playstore url for the targeted parameters.
+        Iterator[tuple[str, str, str]]: Iterator over the (package, region, path) of the cached html files.
     """
-    base_url = "https://play.google.com/store/apps/details?id="
-    playstore_url = f"{base_url}{pkg}"
-    if region:
-        playstore_url = f"{playstore_url}&gl={region}"
-    if language:
-        playstore_url = f"{playstore_url}&hl={language}"
-    return playstore_url
+    html_folder = f"{output_prefix}{OUTPUT_HTML_FOLDER}"
+    if not os.path.isdir(html_folder):
+        return
+    with os.scandir(html_folder) as entries:
+        file_names = sorted(entry.name for entry in entries if entry.name.endswith(".html") and entry.is_file())
+    for file_name in file_names:
+        package, _, region = file_name[:-len(".html")].rpartition("_")
+        if package and region:
+            yield package, region, f"{html_folder}/{file_name}"
+
+def iter_cached_pages(output_prefix: str, archive_folder: Union[None, str] = None) -> Iterator[tuple[str, str, Union[None, str], Union[None, str]]]:
+    """
+    Yields the package, region, file path and content hash of every cached page, from the html output folder or
+    from the html archive.
+
+    Args:
+        output_prefix (str): Prefix of the output files.
+        archive_folder (Union[None, str]): Folder of the html archive, or None for the html files.
 
-def read_cached_packages(output_prefix: str) -> set[str]:
+    Returns:
+        Iterator[tuple[str, str, Union[None, str], Union[None, str]]]: Iterator over the (package, region, path,
+        content hash) of the cached pages. Archived pages have no path, and the hash of html files is not known
+        before they are read.
     """
-    Reads the package names from the cache file that have cached data to avoid redundant requests.
+    if archive_folder is None:
+        for package, region, html_path in iter_cached_html_files(output_prefix):
+            yield package, region, html_path, None
+    elif os.path.exists(os.path.join(archive_folder, HTML_ARCHIVE_INDEX_FILE)):
+        with HtmlArchive(archive_folder, read_only=True) as archive:
+            for package, region, content_hash in archive.iter_pages():
+                yield package, region, None, content_hash
 
-    This function parses the cache file to extract the package names that already have cached data.
-    Output file prefix contained in `output_prefix` is considered when reading cache csv file. 
+def init_reparse_worker(parser_backend: str, extraction_config: Union[None, str], archive_folder: Union[None, str] = None) -> None:
+    """
+    Configures the parser and the html archive of a reparse worker process.
 
     Args:
-        output_prefix (str): Output file name prefix.
+        parser_backend (str): Parser backend used to extract the data points.
+        extraction_config (Union[None, str]): Path to the extraction spec override file, or None.
+        archive_folder (Union[None, str]): Folder of the html archive the pages are read from, or None for html files.
 
     Returns:
-        set[str]: A set of package names that have existing cached data.
+        None
     """
-    package_cache = defaultdict(list)
-    if os.path.exists(f"{output_prefix}{CACHE_FILE}"):
-        with open(f"{output_prefix}{CACHE_FILE}", newline='') as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=";")
-            #pkg;region
-            for line in csv_reader:
-                package_cache[line[0]].append(line[1])
-    return package_cache
-    
-def add_package_to_cache(output_prefix: str, cache: defaultdict[list[str]], pkg: str, data_region:str) -> None:
+    configure_parser_backend(parser_backend)
+    configure_extraction_spec(extraction_config)
+    configure_html_archive(HtmlArchive(archive_folder, read_only=True) if archive_folder else None)
+
+def read_reparse_manifest(manifest_path: str) -> dict[str, dict]:
     """
-    Adds the package and its fetched region to the cache and appends it to the cache file.
+    Reads the reparse manifest of the previous reparse.
 
-    This function updates the cache dictionary by appending the region to the list of cached regions for 
-    the given package. It also appends the package and region to the specified cache file. Prefix contained in
-    `output_prefix` is considered when outputing to the cache file.
+    The manifest holds an entry for each successfully reparsed html file, keyed by file name. An entry has the size,
+    modification time and sha256 hash of the file, the extractor version used and the extracted csv row.
 
     Args:
-        output_prefix (str): Prefix for the output files.
-        cache (dict[list[str]]): A dictionary where package names are keys, and values are lists of regions.
-        pkg (str): The name of the package to add to the cache.
-        data_region (str): The region from which the data for the package was fetched.
+        manifest_path (str): Path to the manifest file.
+
+    Returns:
+        dict[str, dict]: The manifest entries keyed by file name. Empty if there is no readable manifest.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+def write_reparse_manifest(manifest_path: str, manifest: dict[str, dict]) -> None:
+    """
+    Writes the reparse manifest through a temporary file, so an interrupted write keeps the previous manifest.
+
+    Args:
+        manifest_path (str): Path to the manifest file.
+        manifest (dict[str, dict]): The manifest entries keyed by file name.
 
     Returns:
         None
     """
-    cache[pkg].append(data_region)
-    append_to_csv(f"{output_prefix}{CACHE_FILE}", [pkg, data_region])
+    temp_manifest_path = f"{manifest_path}.tmp"
+    with open(temp_manifest_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, separators=(",", ":"))
+    os.replace(temp_manifest_path, manifest_path)
 
-def package_is_cached(cache: defaultdict[list[str]], package: str, data_region: str) -> bool:
+def reparse_html_file(reparse_task: tuple[str, str, str, Union[None, dict]]) -> tuple[list[str], str, dict]:
     """
-    Checks if the package is cached for the specified region.
+    Extracts the data points of a single cached html file. Run in the reparse worker processes.
 
-    This function checks if the given package has cached data for the specified region.
+    The file is memory-mapped, and the mapping is hashed and parsed without copying the page into Python memory, so
+    the memory use of a worker does not grow with the size of the pages. If the hash matches the previous manifest
+    entry of the file, which was made with the current extractor version, the previously extracted row is reused
+    without parsing. Tasks without a path are read from the html archive of the worker instead.
 
     Args:
-        cache (defaultdict[list[str]]): A dictionary where keys are package names, and values are lists of regions where data is cached.
-        package (str): The name of the package to check.
-        data_region (str): The region (ISO 3166-1 alpha-2 country code) to check for the package.
+        reparse_task (tuple[str, str, str, Union[None, dict]]): The package, region and path of the cached html file,
+            or None for an archived page, and its previous manifest entry if it was made with the current extractor version.
 
     Returns:
-        bool: True if the package is cached for the specified region, False otherwise.
+        tuple[list[str], str, dict]: The found csv row of the package, an empty error message and the new manifest
+        entry of the file. If the file could not be processed, the row and entry are None and the error message
+        describes the failure.
     """
-    return package in cache.keys() and data_region in cache[package]
+    package, region, html_path, previous_entry = reparse_task
+    try:
+        if html_path is None:
+            html_path = f"{package}_{region}.html in the html archive"
+            raw_html = _HTML_ARCHIVE.get(package, region)
+            size, mtime_ns, content_hash = len(raw_html), None, hashlib.sha256(raw_html).hexdigest()
+            row = reparse_html(package, region, raw_html, content_hash, previous_entry)
+        else:
+            file_stat = os.stat(html_path)
+            with map_html_file(html_path) as raw_html:
+                size, mtime_ns, content_hash = file_stat.st_size, file_stat.st_mtime_ns, hashlib.sha256(raw_html).hexdigest()
+                row = reparse_html(package, region, raw_html, content_hash, previous_entry)
+    except Exception as e:
+        return None, f"{html_path}: {e!r}", None
+    manifest_entry = {
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "sha256": content_hash,
+        "extractor_version": get_extractor_version(),
+        "row": row,
+    }
+    return row, "", manifest_entry
 
-def read_package_names(file_path: str) -> list[str]:
+def reparse_html(package: str, region: str, raw_html: Union[bytes, mmap.mmap], content_hash: str, previous_entry: Union[None, dict]) -> list[str]:
     """
-    Reads package names from the given file and returns them as a list.
+    Returns the found csv row of a cached page, reusing the row of the previous manifest entry if the page is unchanged.
 
     Args:
-        file_path (str): The file path of the CSV containing the package names.
+        package (str): The name of the package.
+        region (str): The region of the package.
+        raw_html (Union[bytes, mmap.mmap]): The utf-8 encoded page.
+        content_hash (str): The sha256 hash of the page.
+        previous_entry (Union[None, dict]): The previous manifest entry of the page, or None.
 
     Returns:
-        list[str]: A list of package names found in the CSV.
+        list[str]: The found csv row of the package.
     """
-    package_names = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            parts = line.strip().split(";")
-            if parts:
-                package_names.append(parts[0].split(":")[0])  # we get only the package name and filter any process postfixes
-    return package_names
+    if previous_entry and previous_entry.get("sha256") == content_hash:
+        return previous_entry["row"]
+    rating, downloads, reviews, last_updated = get_app_info_from_html(raw_html)
+    return [package, region, rating, reviews, downloads, last_updated]
 
-def get_cached_html_file(output_prefix :str, package: str, region: str) -> Union[None, requests.Response]:
+def iter_reparse_results(reparse_tasks: list[tuple], processes: int, chunksize: int, parser_backend: str,
+                         extraction_config: str, archive_folder: Union[None, str] = None) -> Iterator[tuple[list[str], str, dict]]:
     """
-    Retrieves the cached HTML content for a specific package and region.
+    Runs `reparse_html_file` for the reparse tasks in a pool of worker processes and yields the results in task order.
 
-    This function checks if the cached HTML file for a given package and region exists. 
-    If the file is found, it reads the content and returns a spoofed `requests.Response` object 
-    with a status code of 200 and the HTML content as the response body. If the file does not 
-    exist, it returns `None`.
+    The pool is only started if there are tasks, so a reparse where every file is unchanged starts no processes.
 
     Args:
-        output_prefix (str): The prefix for the output directory where cached HTML files are stored.
-        package (str): The package name for which to retrieve the cached HTML file.
-        region (str): The region associated with the cached HTML file.
+        reparse_tasks (list[tuple]): The tasks given to `reparse_html_file`.
+        processes (int): Number of worker processes. Defaults to the number of CPUs.
+        chunksize (int): Number of files handed to a worker process at a time.
+        parser_backend (str): Parser backend used to extract the data points.
+        extraction_config (str): Path to a JSON file overriding parts of the extraction spec, or None.
+        archive_folder (Union[None, str]): Folder of the html archive the pages are read from, or None for html files.
 
     Returns:
-        requests.Response: A `requests.Response` object containing the cached HTML content if the file exists,
-        or `None` if the file is not found.
+        Iterator[tuple[list[str], str, dict]]: Iterator over the results of `reparse_html_file`.
     """
-    html_path = f"{output_prefix}{OUTPUT_HTML_FOLDER}/{package}_{region}.html"
-    if os.path.exists(html_path):
-        raw_html = ""
-        with open(html_path, 'r', encoding='utf-8') as file:
-            raw_html = file.read()
-        #Spoof a Response object
-        response = requests.Response()
-        response.status_code = 200
-        response._content = raw_html.encode("utf-8")
-        return response
-    return None
+    if not reparse_tasks:
+        return
+    with multiprocessing.Pool(processes or os.cpu_count(), initializer=init_reparse_worker, initargs=(parser_backend, extraction_config, archive_folder)) as pool:
+        yield from pool.imap(reparse_html_file, reparse_tasks, chunksize=max(1, chunksize))
 
-def send_request(url: str) -> requests.Response:
+def reparse_cached_html(output_prefix: str, processes: int = None, chunksize: int = DEFAULT_REPARSE_CHUNKSIZE,
+                        parser_backend: str = DEFAULT_PARSER_BACKEND, extraction_config: str = None, full: bool = False,
+                        html_archive: str = "files") -> int:
     """
-    Makes a Get request to the given url. 
+    Extracts the data points again from every cached html file and writes a fresh found csv file.
+
+    The reparse is incremental. A manifest of the previous reparse records the size, modification time, content hash,
+    extractor version and extracted row of every file. Files whose size and modification time are unchanged reuse
+    their row without being read, and files whose content hash is unchanged reuse it without being parsed. Only new
+    and changed files, or all files after the extractor version has changed, are parsed again. With the html archive,
+    the content hash of each page is known from the archive index, so unchanged pages are not even decompressed.
 
-    This function sends a GET request to the specified URL and returns the response 
-    object
+    Parsing is CPU-bound, so the files to parse are spread over a pool of worker processes in chunks of `chunksize`
+    files, which keeps the per-file overhead of the pool low. The rows are written in file name order to a temporary
+    file that replaces the found csv file once all files have been processed, so an interrupted run leaves the
+    previous found csv file and manifest in place.
 
     Args:
-        url (str): Target for the get request.
+        output_prefix (str): Prefix of the output files.
+        processes (int): Number of worker processes. Defaults to the number of CPUs.
+        chunksize (int): Number of files handed to a worker process at a time.
+        parser_backend (str): Parser backend used to extract the data points.
+        extraction_config (str): Path to a JSON file overriding parts of the extraction spec, or None.
+        full (bool): If True, the manifest is ignored and every file is parsed again.
+        html_archive (str): Where the pages are read from, "files" for the html output folder or "segments" for the html archive.
 
     Returns:
-        requests.Response: The response object
-    
-    Raises:
-        RequestException: If the request fails for any reason, throws subexception of RequestException
+        int: Number of files that were processed successfully.
+    """
+    #The version of the extractor run by the workers, this also rejects an invalid config before starting them
+    configure_parser_backend(parser_backend)
+    configure_extraction_spec(extraction_config)
+    extractor_version = get_extractor_version()
+
+    found_csv_path = f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}"
+    manifest_path = f"{output_prefix}{REPARSE_MANIFEST_FILE}"
+    previous_manifest = {} if full else read_reparse_manifest(manifest_path)
+    archive_folder = f"{output_prefix}{OUTPUT_HTML_ARCHIVE_FOLDER}" if html_archive == "segments" else None
+    manifest = {}
+    reparse_plan = []
+    reparse_tasks = []
+    for package, region, html_path, content_hash in iter_cached_pages(output_prefix, archive_folder):
+        file_name = f"{package}_{region}.html"
+        previous_entry = previous_manifest.get(file_name)
+        if not previous_entry or previous_entry.get("extractor_version") != extractor_version:
+            previous_entry = None
+        elif html_path is None:
+            if content_hash == previous_entry.get("sha256"):
+                reparse_plan.append((file_name, previous_entry))
+                continue
+        else:
+            file_stat = os.stat(html_path)
+            if (file_stat.st_size, file_stat.st_mtime_ns) == (previous_entry.get("size"), previous_entry.get("mtime_ns")):
+                reparse_plan.append((file_name, previous_entry))
+                continue
+        reparse_plan.append((file_name, None))
+        reparse_tasks.append((package, region, html_path, previous_entry))
+
+    temp_csv_path = f"{found_csv_path}.tmp"
+    parsed_files = 0
+    reparse_results = iter_reparse_results(reparse_tasks, processes, chunksize, parser_backend, extraction_config, archive_folder)
+    with open(temp_csv_path, mode='w', newline='', encoding='utf-8') as file, contextlib.closing(reparse_results):
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow(FOUND_CSV_HEADER)
+        #The plan and the tasks are both in file name order, so the parse results are merged back in place of their files
+        for file_name, manifest_entry in reparse_plan:
+            if manifest_entry is not None:
+                row = manifest_entry["row"]
+            else:
+                row, error_msg, manifest_entry = next(reparse_results)
+                if row is None:
+                    print(f"Failed to process {error_msg}")
+                    continue
+            writer.writerow(row)
+            manifest[file_name] = manifest_entry
+            parsed_files += 1
+    os.replace(temp_csv_path, found_csv_path)
+    write_reparse_manifest(manifest_path, manifest)
+    print(f"Reused {len(reparse_plan) - len(reparse_tasks)} unchanged files, parsed {len(reparse_tasks)} files")
+    return parsed_files
+
+def find_shard_prefixes(output_prefix: str) -> list[str]:
     """
-    return requests.get(url)
+    Finds the output prefixes of the shards written under the output prefix.
+
+    Args:
+        output_prefix (str): Prefix of the output files of the sharded run.
 
-def fetch_playstore_data_from_regions(output_prefix: str, cached_packages: defaultdict[list[str]], package: str, regions: list[str], use_cached_html: bool) -> None:
+    Returns:
+        list[str]: Prefixes of the shard folders, ordered by number of shards and shard index.
     """
-    Fetches Play Store data for a given package in each specified region.
+    shard_prefixes = []
+    for shard_prefix in glob.glob(f"{glob.escape(output_prefix)}shard_*_of_*/"):
+        shard_prefix = shard_prefix.replace(os.sep, "/")
+        shard_match = SHARD_FOLDER_PATTERN.search(shard_prefix)
+        if shard_match is not None:
+            shard_prefixes.append(((int(shard_match.group(2)), int(shard_match.group(1))), shard_prefix))
+    return [shard_prefix for _, shard_prefix in sorted(shard_prefixes)]
 
-    This function interacts with the package cache to fetch Play Store data for the specified package. 
-    It retrieves data for missing regions and updates both the cache and the cache file.
+def iter_output_rows(csv_path: str, header: Union[None, list[str]] = None) -> Iterator[list[str]]:
+    """
+    Yields the rows of an output csv file, leaving out the header row and rows without a package and region.
 
     Args:
-        output_prefix (str): Prefix of the output files.
-        cached_packages (dict[list[str]]): A dictionary mapping package names to lists of regions where data has been fetched.
-        package (str): The name of the package to fetch data for.
-        regions (list[str]): A list of ISO 3166-1 alpha-2 country codes representing the regions to fetch data for.
-        use_cached_html (bool): If flag is set, cached version of the html file will be used rather than fetching from playstore.
+        csv_path (str): Path to the csv file. A file that does not exist has no rows.
+        header (Union[None, list[str]]): Header row of the file, or None if the file has no header.
+
+    Returns:
+        Iterator[list[str]]: Iterator over the rows.
+    """
+    if not os.path.exists(csv_path):
+        return
+    with open(csv_path, newline='', encoding='utf-8') as csv_file:
+        for line in csv.reader(csv_file, delimiter=";"):
+            if len(line) >= 2 and line != header:
+                yield line
+
+class OutputRowMerger:
+    """
+    Merges the rows of output csv files, keeping a single row per package/region pair.
+
+    Rows are appended as the pairs are fetched, so the last row of a pair is its latest one and replaces the earlier
+    rows of the pair. The rows are upserted into a temporary SQLite database, keyed by the kind of output file and the
+    pair, so the merged files do not need to fit in memory. Each upsert moves the pair to the end of its kind, so the
+    pairs are read back ordered by their latest row. The database is removed when the merger is closed.
+    """
+
+    def __init__(self, temp_folder: str = None) -> None:
+        self._temp_folder = tempfile.mkdtemp(prefix="merge_", dir=temp_folder)
+        self._connection = sqlite3.connect(os.path.join(self._temp_folder, "rows.db"))
+        #A scratch database, nothing to recover after a crash
+        self._connection.execute("PRAGMA journal_mode=OFF")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute(
+            "CREATE TABLE output_row (kind TEXT NOT NULL, package TEXT NOT NULL, region TEXT NOT NULL, seq INTEGER NOT NULL, line TEXT NOT NULL, "
+            "PRIMARY KEY (kind, package, region)) WITHOUT ROWID"
+        )
+        self._connection.execute("CREATE INDEX output_row_order ON output_row (kind, seq)")
+        self._seq = 0
+
+    def __enter__(self) -> "OutputRowMerger":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add_rows(self, kind: str, csv_paths: Iterable[str], header: Union[None, list[str]] = None) -> None:
+        """
+        Adds the rows of output csv files, replacing the earlier rows of their pairs.
+
+        Args:
+            kind (str): Name of the kind of the files, e.g. "found".
+            csv_paths (Iterable[str]): Paths to the csv files, in the order their rows were written.
+            header (Union[None, list[str]]): Header row of the files, or None if they have no header.
+
+        Returns:
+            None
+        """
+        for csv_path in csv_paths:
+            self._connection.executemany(
+                "INSERT INTO output_row (kind, package, region, seq, line) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, package, region) DO UPDATE SET seq = excluded.seq, line = excluded.line",
+                ((kind, line[0], line[1], self._next_seq(), json.dumps(line)) for line in iter_output_rows(csv_path, header)))
+        self._connection.commit()
+
+    def keep_latest_of(self, kinds: Iterable[str]) -> None:
+        """
+        Keeps a single row per pair across several kinds, the one added last, e.g. so a pair found in an earlier run
+        and missing in a later one only has its missing row.
+
+        Args:
+            kinds (Iterable[str]): Names of the kinds whose rows replace each other.
+
+        Returns:
+            None
+        """
+        kinds = list(kinds)
+        placeholders = ", ".join("?" for _ in kinds)
+        self._connection.execute(
+            f"DELETE FROM output_row WHERE kind IN ({placeholders}) AND EXISTS (SELECT 1 FROM output_row AS other "
+            f"WHERE other.kind IN ({placeholders}) AND other.package = output_row.package AND other.region = output_row.region "
+            "AND other.seq > output_row.seq)", (*kinds, *kinds))
+        self._connection.commit()
+
+    def count(self, kind: str) -> int:
+        """
+        Returns the number of pairs of a kind.
+
+        Args:
+            kind (str): Name of the kind.
+
+        Returns:
+            int: The number of pairs.
+        """
+        return self._connection.execute("SELECT COUNT(*) FROM output_row WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def iter_rows(self, kind: str) -> Iterator[list[str]]:
+        """
+        Yields the latest row of each pair of a kind, ordered by their latest row.
+
+        Args:
+            kind (str): Name of the kind.
+
+        Returns:
+            Iterator[list[str]]: Iterator over the rows.
+        """
+        for (line,) in self._connection.execute("SELECT line FROM output_row WHERE kind = ? ORDER BY seq", (kind,)):
+            yield json.loads(line)
+
+    def close(self) -> None:
+        """
+        Closes and removes the database.
+
+        Returns:
+            None
+        """
+        self._connection.close()
+        shutil.rmtree(self._temp_folder, ignore_errors=True)
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+def write_output_rows(csv_path: str, header: Union[None, list[str]], rows: Iterable[list[str]]) -> None:
+    """
+    Replaces an output csv file with the given rows. The rows are written to a temporary file first, so an
+    interrupted write leaves the previous file in place.
+
+    Args:
+        csv_path (str): Path to the csv file.
+        header (Union[None, list[str]]): Header row written first, or None for a file without a header.
+        rows (Iterable[list[str]]): The rows.
 
     Returns:
         None
     """
-    for region in regions:
-        print(f"Collecting {package}/{region}: ", end="")
-        #Already fetched? are we rerunning data collection on cached files?
-        pkg_is_cached = package_is_cached(cached_packages, package, region)
-        if pkg_is_cached and not use_cached_html:
-            print("Is cached, skipping")
-            continue
+    with open(f"{csv_path}.tmp", mode='w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file, delimiter=";")
+        if header is not None:
+            writer.writerow(header)
+        writer.writerows(rows)
+    os.replace(f"{csv_path}.tmp", csv_path)
 
-        playstore_url = form_playstore_url(package, "en", region)
-        try:
-            playstore_response = None
-
-            #We are basicly rerunning data collection on cached files
-            if use_cached_html and pkg_is_cached:
-                playstore_response = get_cached_html_file(output_prefix, package, region)
-
-            #Not a rerun, or data was not available
-            if not use_cached_html or (not pkg_is_cached and use_cached_html) or not playstore_response:
-                #Set the sleep flag if we are here from failed cache fetch
-                pkg_is_cached = False
-                #Request may throw exception for various reasons
-                playstore_response = send_request(playstore_url)
-                
-            # if the request was successful
-            if playstore_response.status_code == 200 or playstore_response.status_code == 404:
-                print(f"Request success ({playstore_response.status_code}) ", end="")
-                if playstore_response.status_code == 200:
-                    print("Saving data")
-                    rating, downloads, reviews, last_updated = get_app_info_from_html(playstore_response.text)
-                    save_pkg_data(package, region, rating, reviews, downloads, last_updated, playstore_response.text, output_prefix)
-                else:
-                    print("Data not found")
-                    append_to_csv(f"{output_prefix}{OUTPUT_MISSING_CSV_FILE}", [package, region, playstore_response.status_code, playstore_url])
-                #Cache the pkg for the region regardless of the HTTP status
-                if not pkg_is_cached:
-                    add_package_to_cache(output_prefix, cached_packages, package, region)
-            else:
-                print(f"Server returned error ({playstore_response.status_code})")
-                if playstore_response.status_code == 429:
-                    #Too many request, try again in a hour
-                    print("Too many requests, stopping for an hour")
-                    time.sleep(3600)
-                append_to_csv(f"{output_prefix}{OUTPUT_ERROR_CSV_FILE}", [package, region, playstore_response.status_code, playstore_url, ""])
-        except RequestException as e:
-            print(f"Request failed: {e}")
-            append_to_csv(f"{output_prefix}{OUTPUT_ERROR_CSV_FILE}", [package, region, -1, playstore_url, repr(e)])
+def merge_html_files(source_folder: str, target_folder: str) -> int:
+    """
+    Adds the cached html files of a folder to another folder. Files are hard linked where possible and copied
+    otherwise. A file already in the target folder is replaced, as the source is the later fetch.
+
+    Args:
+        source_folder (str): Folder of the html files to add.
+        target_folder (str): Folder the files are added to.
+
+    Returns:
+        int: Number of files added.
+    """
+    if not os.path.isdir(source_folder):
+        return 0
+    merged_files = 0
+    with os.scandir(source_folder) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith(".html"):
+                continue
+            target_path = os.path.join(target_folder, entry.name)
+            if os.path.exists(target_path):
+                if os.path.samefile(entry.path, target_path):
+                    continue
+                os.remove(target_path)
+            try:
+                os.link(entry.path, target_path)
+            except OSError:
+                shutil.copy2(entry.path, target_path)
+            merged_files += 1
+    return merged_files
+
+def merge_shards(output_prefix: str) -> dict[str, int]:
+    """
+    Merges the outputs of the shards written under the output prefix into the output files of the prefix.
+
+    The found, missing and error csv files, the cache and validators csv files and the fetch state stores of the
+    shards are combined with the existing output files of the prefix into one dataset with a single row per
+    package/region pair, the latest one. A pair only keeps its latest found, missing or error row, so a pair found
+    before and missing in a later shard run is only missing. Within one folder, a found row is taken as the latest. The cached html files are linked into the html output folder of the prefix. Html archives are not merged,
+    they stay in the shard folders. Merging again after further shard runs gives the same result as a single merge.
+    The rows are merged in an `OutputRowMerger`, so the outputs of the shards do not need to fit in memory.
+
+    Args:
+        output_prefix (str): Prefix of the output files of the sharded run.
+
+    Returns:
+        dict[str, int]: The number of merged shards, and the number of pairs in each merged file.
+    """
+    shard_prefixes = find_shard_prefixes(output_prefix)
+    #The merged files of an earlier merge come first, so the shard rows replace them
+    prefixes = [output_prefix, *shard_prefixes]
+    os.makedirs(f"{output_prefix}{OUTPUT_HTML_FOLDER}", exist_ok=True)
+    #The scratch database is kept next to the outputs, as it grows as big as them
+    with OutputRowMerger(os.path.dirname(os.path.abspath(f"{output_prefix}{CACHE_FILE}"))) as merger:
+        #The rows are added folder by folder, so a row of a later folder replaces the earlier rows of its pair. The rows
+        #within a folder have no fetch time, there a found row replaces a missing or error row and a missing row an error row
+        for prefix in prefixes:
+            merger.add_rows("errors", [f"{prefix}{OUTPUT_ERROR_CSV_FILE}"], ERROR_CSV_HEADER)
+            merger.add_rows("missing", [f"{prefix}{OUTPUT_MISSING_CSV_FILE}"], MISSING_CSV_HEADER)
+            merger.add_rows("found", [f"{prefix}{OUTPUT_FOUND_CSV_FILE}"], FOUND_CSV_HEADER)
+            merger.add_rows("cached", [f"{prefix}{CACHE_FILE}"])
+            merger.add_rows("validators", [f"{prefix}{OUTPUT_VALIDATORS_CSV_FILE}"])
+        merger.keep_latest_of(("found", "missing", "errors"))
+        write_output_rows(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}", FOUND_CSV_HEADER, merger.iter_rows("found"))
+        write_output_rows(f"{output_prefix}{OUTPUT_MISSING_CSV_FILE}", MISSING_CSV_HEADER, merger.iter_rows("missing"))
+        write_output_rows(f"{output_prefix}{OUTPUT_ERROR_CSV_FILE}", ERROR_CSV_HEADER, merger.iter_rows("errors"))
+        write_output_rows(f"{output_prefix}{CACHE_FILE}", None, merger.iter_rows("cached"))
+        if merger.count("validators"):
+            write_output_rows(f"{output_prefix}{OUTPUT_VALIDATORS_CSV_FILE}", None, merger.iter_rows("validators"))
+        merge_counts = {kind: merger.count(kind) for kind in ("found", "missing", "errors", "cached")}
+    html_files = sum(merge_html_files(f"{shard_prefix}{OUTPUT_HTML_FOLDER}", f"{output_prefix}{OUTPUT_HTML_FOLDER}") for shard_prefix in shard_prefixes)
+
+    merged_states = 0
+    shard_stores = [f"{shard_prefix}{STATE_STORE_FILE}" for shard_prefix in shard_prefixes if os.path.exists(f"{shard_prefix}{STATE_STORE_FILE}")]
+    if shard_stores:
+        with FetchStateStore(f"{output_prefix}{STATE_STORE_FILE}") as state_store:
+            for store_path in shard_stores:
+                merged_states += state_store.merge_from(store_path)
+    return {"shards": len(shard_prefixes), **merge_counts, "html_files": html_files, "states": merged_states}
 
-            
 def init_checks(package_input_csv: str, output_prefix: str) -> tuple[bool, str]:
     """
     Checks and creates the expected folders and files needed for the process.
@@ -362,9 +4459,9 @@ def init_checks(package_input_csv: str, output_prefix: str) -> tuple[bool, str]:
 
     output_csv_check = {
         
-        f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}": ['Package Name', 'Data Region', 'Rating', 'Reviews', 'Downloads', 'Last Updated'],
-        f"{output_prefix}{OUTPUT_MISSING_CSV_FILE}": ['Package Name', 'Data Region', 'Http Status', 'Url'],
-        f"{output_prefix}{OUTPUT_ERROR_CSV_FILE}": ['Package Name', 'Data Region', 'Http Status', 'Url', 'Exception Message'],
+        f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}": FOUND_CSV_HEADER,
+        f"{output_prefix}{OUTPUT_MISSING_CSV_FILE}": MISSING_CSV_HEADER,
+        f"{output_prefix}{OUTPUT_ERROR_CSV_FILE}": ERROR_CSV_HEADER,
     }
     #Check if the ouput csv file exists, if not create it
     for path, header in output_csv_check.items():
@@ -377,52 +4474,170 @@ def init_checks(package_input_csv: str, output_prefix: str) -> tuple[bool, str]:
     #All good
     return (True, "")
 
-def main(input_file: str, regions: list[str], output_prefix: str, use_cached_html: bool) -> None:
+def main(input_file: str, regions: list[str], output_prefix: str, use_cached_html: bool, workers: int = 1, backend: str = "threads", max_in_flight: int = 100,
+         pool_size: int = None, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+         rate: float = DEFAULT_RATE, max_rate: float = DEFAULT_MAX_RATE, rate_limit_scope: str = "region",
+         max_attempts: int = DEFAULT_MAX_ATTEMPTS, backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_cap: float = DEFAULT_BACKOFF_CAP,
+         max_throttled_attempts: int = DEFAULT_MAX_THROTTLED_ATTEMPTS, parser_backend: str = DEFAULT_PARSER_BACKEND, extraction_config: str = None, state_store: str = "csv",
+         flush_rows: int = DEFAULT_FLUSH_ROWS, flush_interval: float = DEFAULT_FLUSH_INTERVAL, html_archive: str = "files",
+         refresh: bool = False, max_age: float = None, max_age_tiers: list[tuple[str, float, float]] = None, dedup: str = "memory",
+         header: bool = False, schedule: str = "stream", shard: tuple[int, int] = None, columnar_output: str = None,
+         progress_interval: float = DEFAULT_PROGRESS_INTERVAL, metrics_file: str = None, base_url: str = DEFAULT_BASE_URL) -> None:
     """
     Fetches Google Play Store data for the given packages and outputs the data as a CSV file.
 
     This function reads package names from the specified CSV file, fetches data from the Google Play Store 
     for each package in each defined region, and caches the results. It then outputs the fetched data to a CSV file and stores the raw html.
     Output file names are prefixed with the string contained in `output_prefix`. If the use_cached_html flag is set, cached html files will be
-    used instead of fetching data from playstore.
+    used instead of fetching data from playstore. If `workers` is greater than one, package/region pairs are fetched
+    concurrently by a pool of worker threads. With the "asyncio" backend, pairs are fetched by coroutines keeping up to
+    `max_in_flight` requests in flight instead.
 
     Args:
         input_file (str): File path containing the packages to fetch
         regions (list[str]): Regions to fetch data from.
         output_prefix (str): Prefix for output files.
         use_cached_html (bool): Use cached html files.
+        workers (int): Number of package/region pairs fetched concurrently. Defaults to 1 (sequential fetching).
+        backend (str): Fetch backend, "threads" or "asyncio". Defaults to "threads".
+        max_in_flight (int): Maximum number of requests in flight with the "asyncio" backend. Defaults to 100.
+        pool_size (int): Kept-alive connections per host in the shared HTTP session. Defaults to the larger of `workers` and `DEFAULT_POOL_SIZE`.
+        connect_timeout (float): Seconds to wait for a connection to be established.
+        read_timeout (float): Seconds to wait for the server to send data.
+        rate (float): Initial request rate per second of each rate limiter bucket. 0 disables rate limiting.
+        max_rate (float): Upper limit the adaptive rate limiter can raise the rate to.
+        rate_limit_scope (str): "region" for a rate limiter bucket per region, "global" for one bucket for all requests.
+        max_attempts (int): Maximum number of failed requests, not counting throttled ones, sent for a package/region pair before its failure is recorded.
+        backoff_base (float): Backoff in seconds before the first retry of a failed pair, doubled for each further retry.
+        backoff_cap (float): Upper limit for the retry backoff in seconds.
+        max_throttled_attempts (int): Maximum number of throttled requests sent for a package/region pair before its failure is recorded.
+        parser_backend (str): Parser backend used to extract the data points, "lxml", "bs4" or "json".
+        extraction_config (str): Path to a JSON file overriding parts of the extraction spec. Defaults to None (default spec).
+        state_store (str): Where the fetched pairs are kept, "csv" for the cache csv file or "sqlite" for a `FetchStateStore`. Defaults to "csv".
+        flush_rows (int): Number of output csv rows buffered before they are written. 0 writes every row right away.
+        flush_interval (float): Seconds after which buffered output csv rows are written at the latest.
+        html_archive (str): How the fetched html pages are stored, "files" for a file per pair or "segments" for an `HtmlArchive`. Defaults to "files".
+        refresh (bool): Revalidate the cached pairs with the validators of their cached page instead of skipping them. Defaults to False.
+        max_age (float): Seconds after which a fetched pair is stale and fetched again. Defaults to None (never stale).
+        max_age_tiers (list[tuple[str, float, float]]): Tiers from `parse_max_age_tier` lowering the max age of some pairs.
+        dedup (str): How duplicate packages of the input file are dropped, "memory" or "disk". Defaults to "memory".
+        header (bool): If set, the first line of the input file is a header and is skipped. Defaults to False.
+        schedule (str): Order of the pairs, "stream" for input order without a work set, or the priority of a
+            `FetchScheduler`, "input", "staleness" or "downloads". Defaults to "stream".
+        shard (tuple[int, int]): Shard index and number of shards from `parse_shard`. Only the pairs of the shard are
+            fetched, and the outputs are written to the shard folder under `output_prefix`. Defaults to None (all pairs).
+        columnar_output (str): Columnar format the found data is also written in, "parquet" or "arrow", with a part file
+            per run in the columnar output folder. Defaults to None (found csv file only).
+        progress_interval (float): Seconds between the progress lines of a `FetchMetrics`. 0 disables them. Defaults to 30.
+        metrics_file (str): Path of the metrics file, Prometheus text if it ends with ".prom", JSON otherwise. Defaults to None.
+        base_url (str): Base url the package pages are requested from, see `configure_base_url`. Defaults to the Google Play Store.
     Returns:
         None
     """
+    if shard is not None:
+        output_prefix = get_shard_prefix(output_prefix, shard)
     #Check and create all folders and files for operation
     init_successful, init_error_msg = init_checks(input_file, output_prefix)
+    if init_successful and backend == "asyncio" and not import_aiohttp():
+        init_successful, init_error_msg = (False, "The asyncio backend requires the aiohttp package!")
+    if init_successful and columnar_output is not None and import_pyarrow() is None:
+        init_successful, init_error_msg = (False, "The columnar output requires the pyarrow package!")
     if init_successful:
+        #Shared keep-alive session for all requests of the run
+        configure_session(pool_size or max(workers, DEFAULT_POOL_SIZE), connect_timeout, read_timeout)
+        configure_base_url(base_url)
+        configure_rate_limiter(AdaptiveRateLimiter(rate, max_rate, scope=rate_limit_scope) if rate > 0 else None)
+        configure_retries(max_attempts, backoff_base, backoff_cap, max_throttled_attempts)
+        configure_parser_backend(parser_backend)
+        configure_extraction_spec(extraction_config)
+        configure_output_sink(BufferedCsvSink(flush_rows, flush_interval) if flush_rows > 0 else None)
+        configure_html_archive(HtmlArchive(f"{output_prefix}{OUTPUT_HTML_ARCHIVE_FOLDER}") if html_archive == "segments" else None)
+        if columnar_output is not None:
+            #A part file per run, as Parquet and Arrow files can not be appended to
+            columnar_part = f"run_{time.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}"
+            configure_columnar_sink(ColumnarFoundSink(get_columnar_path(output_prefix, columnar_output, columnar_part), columnar_output))
         #start time
         start_time = time.time()
-        #Read package names and cache contents
-        package_names = read_package_names(input_file)
-        cached_packages = read_cached_packages(output_prefix)
+        #The scheduler sets the exact number of pairs once it is built
+        metrics = FetchMetrics(progress_interval, metrics_file)
+        if schedule == "stream" and progress_interval > 0:
+            metrics.total_pairs = estimate_pair_count(input_file, regions, shard)
+        configure_metrics(metrics)
+        #Stream package names and read cache contents
+        package_names = PackageListReader(input_file, dedup, header=header)
+        staleness_policy = StalenessPolicy(max_age, max_age_tiers or ()) if max_age is not None else None
+        if staleness_policy is not None:
+            staleness_policy.load_found_csv(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}")
+        configure_staleness(staleness_policy)
+        cached_packages = open_fetch_state_store(output_prefix) if state_store == "sqlite" else read_cached_packages(output_prefix, staleness_policy)
+        if isinstance(cached_packages, CacheIndex) and staleness_policy is not None:
+            print(f"Cache: {len(cached_packages)} pairs, {cached_packages.stale_count()} stale")
+        configure_shard(shard)
+        if shard is not None:
+            print(f"Shard {shard[0]}/{shard[1]}: writing to {output_prefix}")
+        configure_scheduler(FetchScheduler(schedule, f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}") if schedule != "stream" else None)
+        #The fetch state store keeps the validators with the states
+        load_validators = (refresh or staleness_policy is not None) and state_store == "csv"
+        configure_revalidation(refresh, read_page_validators(output_prefix) if load_validators else None)
         #Request google playstore pages
-        for pkg_name in package_names:
-            #Fetch data for the package in the regions
-            fetch_playstore_data_from_regions(output_prefix, cached_packages, pkg_name, regions, use_cached_html)
+        try:
+            if backend == "asyncio":
+                import asyncio
+                asyncio.run(fetch_playstore_data_async(output_prefix, cached_packages, package_names, regions, use_cached_html, max_in_flight))
+            elif workers > 1:
+                fetch_playstore_data_concurrently(output_prefix, cached_packages, package_names, regions, use_cached_html, workers)
+            else:
+                fetch_playstore_data_sequentially(output_prefix, cached_packages, package_names, regions, use_cached_html)
+        finally:
+            #Keep the rows and states recorded before an interruption, rows first so no state refers to a lost row
+            configure_output_sink(None)
+            configure_columnar_sink(None)
+            configure_revalidation(False)
+            configure_staleness(None)
+            configure_scheduler(None)
+            configure_shard(None)
+            configure_metrics(None)
+            configure_base_url()
+            if _HTML_ARCHIVE is not None:
+                _HTML_ARCHIVE.commit()
+            if isinstance(cached_packages, FetchStateStore):
+                cached_packages.commit()
         #ending time
         end_time = time.time()
         #calculating minutes how long code runs
         elapsed_time = (end_time - start_time) / 60
         print(f"Time taken: {elapsed_time:.2f} minutes")
+        run_metrics = metrics.snapshot()
+        print(f"Pairs: {run_metrics['pairs_done']} done, {run_metrics['pairs_skipped']} skipped as cached, {run_metrics['retries']} retries, "
+              f"{run_metrics['body_bytes'] / 1e6:.1f} MB received")
+        print("Responses: " + ", ".join(f"{count} {status_code}" for status_code, count in run_metrics["status_codes"].items()))
+        print("Stage times: " + ", ".join(f"{stage} {stage_metrics['seconds']:.1f}s" for stage, stage_metrics in run_metrics["stages"].items() if stage_metrics["calls"]))
+        print(f"Package listing: {package_names.packages} packages, {package_names.duplicates} duplicates removed")
+        for host, host_stats in get_session_pool_stats().items():
+            print(f"Connection pool {host}: {host_stats['requests']} requests, {host_stats['connections']} connections opened, {host_stats['reused']} reused")
+        if _RATE_LIMITER is not None:
+            for bucket_key, bucket_rate in _RATE_LIMITER.rates().items():
+                print(f"Rate limit {bucket_key}: {bucket_rate:.2f} requests/s")
+        if isinstance(cached_packages, FetchStateStore):
+            print("Fetch state: " + ", ".join(f"{count} {status}" for status, count in sorted(cached_packages.status_counts().items())))
+            cached_packages.close()
+        if _HTML_ARCHIVE is not None:
+            archive_stats = _HTML_ARCHIVE.stats()
+            print(f"HTML archive: {archive_stats['pages']} pages, {archive_stats['unique_pages']} unique, "
+                  f"{archive_stats['size'] / 1e6:.1f} MB compressed to {archive_stats['stored_size'] / 1e6:.1f} MB")
+            configure_html_archive(None)
     else:
         #Something went wrong, error msg before exit
         print(init_error_msg)
 
-def parse_console_arguments() -> tuple[str,Iterable[str], str, bool]:
+def parse_console_arguments() -> argparse.Namespace:
     """
     Parses command-line arguments for fetching data from the Google Play Store.
 
     This function sets up the argument parser, processes the command-line arguments,
-    and returns the file path to the package listing, the regions to fetch data from,
-    an optional prefix for output file names, and a flag indicating if cached HTML files
-    should be used instead of fetching data from the Play Store.
+    and returns them as a namespace. The namespace contains the file path to the package listing, the regions to fetch data from,
+    an optional prefix for output file names, a flag indicating if cached HTML files
+    should be used instead of fetching data from the Play Store and the settings of the fetch backend.
 
     Command-line arguments:
         --package_listing (str): The file path to the CSV file (';' delimiter expected) containing the listing of packages to fetch.
@@ -432,31 +4647,242 @@ def parse_console_arguments() -> tuple[str,Iterable[str], str, bool]:
                                (e.g., "FIN" => "FIN_raw_html_output"). Defaults to an empty string if not provided.
         --use_cached_html (bool): An optional flag to use cached HTML files instead of fetching data from the Play Store.
                                    Defaults to False. Helpful when reprocessing already fetched packages.
+        --workers (int): An optional number of package/region pairs fetched concurrently. Defaults to 1.
+        --backend (str): An optional fetch backend, "threads" or "asyncio". Defaults to "threads".
+        --max_in_flight (int): An optional maximum number of requests in flight with the asyncio backend. Defaults to 100.
+        --pool_size (int): An optional number of kept-alive connections per host. Defaults to the larger of --workers and 10.
+        --connect_timeout (float): An optional connect timeout in seconds. Defaults to 10.
+        --read_timeout (float): An optional read timeout in seconds. Defaults to 30.
+        --rate (float): An optional initial request rate per second of each rate limiter bucket. 0 disables rate limiting. Defaults to 5.
+        --max_rate (float): An optional upper limit for the adaptive request rate. Defaults to 50.
+        --rate_limit_scope (str): An optional rate limiter scope, "region" or "global". Defaults to "region".
+        --max_attempts (int): An optional maximum number of requests sent for a failing package/region pair, not counting throttled requests. Defaults to 5.
+        --backoff_base (float): An optional backoff in seconds before the first retry. Defaults to 2.
+        --backoff_cap (float): An optional upper limit for the retry backoff in seconds. Defaults to 300.
+        --max_throttled_attempts (int): An optional maximum number of throttled requests sent for a package/region pair. Defaults to 50.
+        --parser_backend (str): An optional parser backend, "lxml", "bs4" or "json". Defaults to "lxml".
+        --extraction_config (str): An optional path to a JSON file overriding selectors, filters and data paths of the extraction spec.
+        --state_store (str): An optional store of the fetched pairs, "csv" or "sqlite". Defaults to "csv".
+        --flush_rows (int): An optional number of output csv rows buffered before they are written. 0 disables buffering. Defaults to 1000.
+        --flush_interval (float): An optional number of seconds after which buffered rows are written at the latest. Defaults to 5.
+        --html_archive (str): An optional storage of the fetched html pages, "files" or "segments". Defaults to "files".
+        --refresh: If given, cached pairs are revalidated with conditional requests instead of being skipped.
+        --max_age (str): An optional duration, e.g. "7d", after which a fetched pair is stale and fetched again.
+        --max_age_tier (str): An optional tier `field:threshold:max_age` lowering the max age, e.g. "downloads:100M:1d". Can be repeated.
+        --dedup (str): An optional way to drop duplicate packages of the input file, "memory" or "disk". Defaults to "memory".
+        --header (bool): An optional flag telling that the first line of the input file is a header.
+        --schedule (str): An optional order of the pairs, "stream", "input", "staleness" or "downloads". Defaults to "stream".
+        --shard (str): An optional shard `i/N` of the package/region pairs fetched by this run, e.g. "0/4".
+        --columnar_output (str): An optional columnar format the found data is also written in, "parquet" or "arrow".
+        --progress_interval (float): An optional number of seconds between the progress lines. 0 disables them. Defaults to 30.
+        --metrics_file (str): An optional path of a metrics file, Prometheus text if it ends with ".prom", JSON otherwise.
+        --base_url (str): An optional base url the package pages are requested from. Defaults to "https://play.google.com".
 
     Returns:
-        tuple: A tuple containing four elements:
+        argparse.Namespace: A namespace containing the following attributes:
             - `package_listing` (str): The file path to the package listing CSV.
             - `regions` (Iterable[str]): A list or other iterable of regions specified by the user, or ["US"] if no regions are provided.
             - `output_prefix` (str): The optional prefix for output file names, or an empty string if not provided.
             - `use_cached_html` (bool): Whether to use cached HTML files instead of fetching from the Play Store.
+            - `workers` (int): Number of package/region pairs fetched concurrently.
+            - `backend` (str): The fetch backend, "threads" or "asyncio".
+            - `max_in_flight` (int): Maximum number of requests in flight with the asyncio backend.
+            - `pool_size` (int): Kept-alive connections per host, or None to size the pool from --workers.
+            - `connect_timeout` (float): Connect timeout in seconds.
+            - `read_timeout` (float): Read timeout in seconds.
+            - `rate` (float): Initial request rate per second of each rate limiter bucket.
+            - `max_rate` (float): Upper limit for the adaptive request rate.
+            - `rate_limit_scope` (str): The rate limiter scope, "region" or "global".
+            - `max_attempts` (int): Maximum number of requests sent for a failing package/region pair, not counting throttled requests.
+            - `backoff_base` (float): Backoff in seconds before the first retry.
+            - `backoff_cap` (float): Upper limit for the retry backoff in seconds.
+            - `max_throttled_attempts` (int): Maximum number of throttled requests sent for a package/region pair.
+            - `parser_backend` (str): The parser backend, "lxml", "bs4" or "json".
+            - `extraction_config` (str): Path to the extraction spec override file, or None.
+            - `state_store` (str): The store of the fetched pairs, "csv" or "sqlite".
+            - `flush_rows` (int): Number of output csv rows buffered before they are written.
+            - `flush_interval` (float): Seconds after which buffered output csv rows are written at the latest.
+            - `html_archive` (str): The storage of the fetched html pages, "files" or "segments".
+            - `refresh` (bool): Whether the cached pairs are revalidated.
+            - `max_age` (float): Seconds after which a fetched pair is stale, or None.
+            - `max_age_tier` (list[tuple[str, float, float]]): The max age tiers, or None.
+            - `dedup` (str): How duplicate packages are dropped, "memory" or "disk".
+            - `header` (bool): True if the first line of the input file is a header.
+            - `schedule` (str): The order of the pairs, "stream", "input", "staleness" or "downloads".
+            - `shard` (tuple[int, int]): The shard index and number of shards, or None.
+            - `columnar_output` (str): The columnar format of the found data, "parquet" or "arrow", or None.
+            - `progress_interval` (float): Seconds between the progress lines.
+            - `metrics_file` (str): Path of the metrics file, or None.
+            - `base_url` (str): The base url the package pages are requested from, without a trailing '/'.
 
     Example usage:
-        python script.py --package_listing path/to/packages.csv --regions US,FI,JA --output_prefix FIN --use_cached_html False
+        python script.py --package_listing path/to/packages.csv --regions US,FI,JA --output_prefix FIN --use_cached_html False --workers 8
 
     Notes:
         - If the --regions argument is not specified, the default value "US" will be used.
         - The --package_listing argument is required.
         - The --output_prefix argument is optional and defaults to an empty string if not specified.
         - The --use_cached_html argument is optional and defaults to False if not specified.
+        - The --workers argument is optional and defaults to 1 (sequential fetching) if not specified.
+        - The --backend argument is optional and defaults to "threads". The "asyncio" backend requires the aiohttp package.
+        - The --state_store argument is optional and defaults to "csv". A new "sqlite" store imports the pairs of an existing cache csv file.
+        - The --refresh argument is optional. With --use_cached_html, the cached html is reused without revalidating it.
+        - The --max_age_tier argument only has an effect with --max_age. Pairs cached before fetch times were recorded are stale.
+        - The --package_listing file can be gzip compressed. Both --dedup ways fetch the packages in input order.
+        - Every --schedule except "stream" builds the work set of all pairs in memory and interleaves the regions.
+        - With --shard, the outputs are written to a shard_i_of_N/ folder under --output_prefix. The `merge` command combines them.
+        - The --columnar_output argument requires the pyarrow package. The `export` command writes an existing found csv file.
+        - The ETA of the progress lines is estimated from the lines of the --package_listing file, unless a --schedule is used.
+        - The --base_url argument is meant for load tests against a local stand-in server, e.g. benchmarks/mock_store.py.
     """
     parser = argparse.ArgumentParser(description="This is a script that fetched data from google playstore for given packages and regions")
     parser.add_argument('--package_listing', type=str, required=True, help="File path to the file containing the listing of packages to fetch")
     parser.add_argument('--regions', type=lambda value: value.split(','), default="US", help="Listing of regions to fetch data from, ',' seperated list (e.g.: US,FI,JA). Defaults to US if none given")
     parser.add_argument('--output_prefix', default="", help="Optional input to prefix the output file names of the program, enabling seperate output files/folders. (e.g. FIN => FIN_raw_html_output). Defaults to nothing.")
     parser.add_argument('--use_cached_html', type=bool, default=False, help="Optional input to avoid fetching data from playstore. Instead use the existing cached html files.")
-    args = parser.parse_args()
-    return args.package_listing, args.regions, args.output_prefix, args.use_cached_html
+    parser.add_argument('--workers', type=int, default=1, help="Optional number of package/region pairs fetched concurrently by a pool of worker threads. Defaults to 1.")
+    parser.add_argument('--backend', choices=["threads", "asyncio"], default="threads", help="Optional fetch backend. 'asyncio' keeps up to --max_in_flight requests in flight using coroutines (requires aiohttp). Defaults to threads.")
+    parser.add_argument('--max_in_flight', type=int, default=100, help="Optional maximum number of requests in flight with the asyncio backend. Defaults to 100.")
+    parser.add_argument('--pool_size', type=int, default=None, help="Optional number of kept-alive connections per host in the shared HTTP session. Defaults to the larger of --workers and 10.")
+    parser.add_argument('--connect_timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT, help="Optional timeout in seconds for establishing a connection. Defaults to 10.")
+    parser.add_argument('--read_timeout', type=float, default=DEFAULT_READ_TIMEOUT, help="Optional timeout in seconds for the server to send data. Defaults to 30.")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help="Optional initial request rate per second. The rate adapts to throttle responses (429/503). 0 disables rate limiting. Defaults to 5.")
+    parser.add_argument('--max_rate', type=float, default=DEFAULT_MAX_RATE, help="Optional upper limit for the adaptive request rate per second. Defaults to 50.")
+    parser.add_argument('--rate_limit_scope', choices=["region", "global"], default="region", help="Optional rate limiter scope. 'region' limits each region separately, 'global' limits all requests together. Defaults to region.")
+    parser.add_argument('--max_attempts', type=int, default=DEFAULT_MAX_ATTEMPTS, help="Optional maximum number of requests sent for a package/region pair that keeps failing with a transient error (failed request or 5xx) before it is written to the error file. Throttled requests (429 or 503) do not count against it, see --max_throttled_attempts. Defaults to 5.")
+    parser.add_argument('--backoff_base', type=float, default=DEFAULT_BACKOFF_BASE, help="Optional backoff in seconds before the first retry of a failed pair. Doubled for each further retry, with random jitter. Defaults to 2.")
+    parser.add_argument('--backoff_cap', type=float, default=DEFAULT_BACKOFF_CAP, help="Optional upper limit for the retry backoff in seconds. Defaults to 300.")
+    parser.add_argument('--max_throttled_attempts', type=int, default=DEFAULT_MAX_THROTTLED_ATTEMPTS, help="Optional maximum number of throttled requests (429 or 503) sent for a package/region pair before it is written to the error file. Throttled pairs are fetched again once the rate limiter has slowed down or the Retry-After time has passed. Defaults to 50.")
+    parser.add_argument('--parser_backend', choices=PARSER_BACKENDS, default=DEFAULT_PARSER_BACKEND, help="Optional parser backend used to extract the data points. 'lxml' uses precompiled XPath expressions, 'bs4' uses BeautifulSoup css selectors, 'json' reads the app data embedded in the page and falls back to lxml for missing data points. Defaults to lxml.")
+    parser.add_argument('--extraction_config', default=None, help="Optional path to a JSON file overriding the selectors, filters and data paths used to extract the data points, e.g. when the store page class names change.")
+    parser.add_argument('--state_store', choices=STATE_STORES, default="csv", help="Optional store of the fetched package/region pairs. sqlite keeps the fetch state of each pair in an indexed database instead of the cache csv file. Defaults to csv.")
+    parser.add_argument('--flush_rows', type=int, default=DEFAULT_FLUSH_ROWS, help="Optional number of output csv rows buffered before they are written to the files. 0 writes every row right away. Defaults to 1000.")
+    parser.add_argument('--flush_interval', type=float, default=DEFAULT_FLUSH_INTERVAL, help="Optional number of seconds after which buffered output csv rows are written at the latest. Defaults to 5.")
+    parser.add_argument('--html_archive', choices=HTML_ARCHIVES, default="files", help="Optional storage of the fetched html pages. segments stores them compressed and deduplicated in an archive of segment files instead of a file per package/region pair. Defaults to files.")
+    parser.add_argument('--refresh', action='store_true', help="Optional flag to request the cached package/region pairs again with the ETag and Last-Modified of their cached page. Unchanged pages (304) reuse the cached html.")
+    parser.add_argument('--max_age', type=parse_duration, default=None, help="Optional duration (e.g. 90, 30m, 12h, 7d, 2w) after which a fetched package/region pair is stale and fetched again. Defaults to never.")
+    parser.add_argument('--max_age_tier', type=parse_max_age_tier, action='append', default=None, help="Optional tier field:threshold:max_age lowering the max age of matching pairs, e.g. downloads:100M:1d or last_updated:30d:2d. Can be given several times.")
+    parser.add_argument('--dedup', choices=PACKAGE_DEDUPS, default="memory", help="Optional way to drop duplicate packages of the input file. disk sorts the names in chunks on disk for listings bigger than the memory. Both fetch the packages in input order. Defaults to memory.")
+    parser.add_argument('--header', action="store_true", help="Optional flag telling that the first line of the input file is a header, which is skipped.")
+    parser.add_argument('--schedule', choices=SCHEDULE_ORDERS, default="stream", help="Optional order of the package/region pairs. stream fetches them in input order as the file is read. input, staleness and downloads build the work set up front, drop the cached pairs and interleave the regions, ordered by input order, stale pairs first or most downloads first. Defaults to stream.")
+    parser.add_argument('--shard', type=parse_shard, default=None, help="Optional shard i/N (e.g. 0/4) of the package/region pairs to fetch. Pairs are split into N shards by a hash of the pair, so N machines can each fetch a shard of the same input. The outputs are written to a shard_i_of_N/ folder under --output_prefix. Defaults to all pairs.")
+    parser.add_argument('--progress_interval', type=float, default=DEFAULT_PROGRESS_INTERVAL, help="Optional number of seconds between progress lines with the throughput, the ETA and the share of each stage (cache, rate limit, network, parse, write) of the fetch loop. 0 disables them. Defaults to 30.")
+    parser.add_argument('--metrics_file', default=None, help="Optional path of a file the stage timers and counters are written to with each progress line and at the end of the run. Prometheus text format if the name ends with .prom, JSON otherwise.")
+    parser.add_argument('--base_url', type=parse_base_url, default=DEFAULT_BASE_URL, help="Optional base url the package pages are requested from, e.g. http://127.0.0.1:8080 for a local stand-in server (see benchmarks/mock_store.py). Defaults to https://play.google.com.")
+    parser.add_argument('--columnar_output', choices=COLUMNAR_FORMATS, default=None, help="Optional columnar format (parquet or arrow) the found data is also written in, with typed columns: float rating, integer review and download counts, a date of the last update and nulls for data points that were not found. Requires pyarrow. Defaults to none.")
+    return parser.parse_args()
+
+def parse_reparse_arguments(argv: list[str]) -> argparse.Namespace:
+    """
+    Parses command-line arguments of the `reparse` command.
+
+    The `reparse` command extracts the data points again from all cached html files and writes a fresh found csv file,
+    without sending any requests. Files that are unchanged since the previous reparse with the same extractor are not
+    parsed again.
+
+    Command-line arguments:
+        --output_prefix (str): An optional prefix of the output files to reprocess. Defaults to an empty string.
+        --processes (int): An optional number of worker processes. Defaults to the number of CPUs.
+        --chunksize (int): An optional number of files handed to a worker process at a time. Defaults to 64.
+        --parser_backend (str): An optional parser backend, "lxml", "bs4" or "json". Defaults to "lxml".
+        --extraction_config (str): An optional path to a JSON file overriding parts of the extraction spec.
+        --full: If given, the manifest of the previous reparse is ignored and every file is parsed again.
+        --html_archive (str): An optional source of the cached pages, "files" or "segments". Defaults to "files".
+
+    Args:
+        argv (list[str]): The command-line arguments following the command name.
+
+    Returns:
+        argparse.Namespace: A namespace containing the parsed arguments.
+
+    Example usage:
+        python script.py reparse --output_prefix FIN --processes 32
+    """
+    parser = argparse.ArgumentParser(prog="play_store_fetcher.py reparse", description="Extracts the data points again from all cached html files and writes a fresh found csv file")
+    parser.add_argument('--output_prefix', default="", help="Optional prefix of the output files to reprocess. Defaults to nothing.")
+    parser.add_argument('--processes', type=int, default=None, help="Optional number of worker processes. Defaults to the number of CPUs.")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_REPARSE_CHUNKSIZE, help="Optional number of files handed to a worker process at a time. Defaults to 64.")
+    parser.add_argument('--parser_backend', choices=PARSER_BACKENDS, default=DEFAULT_PARSER_BACKEND, help="Optional parser backend used to extract the data points. Defaults to lxml.")
+    parser.add_argument('--extraction_config', default=None, help="Optional path to a JSON file overriding the selectors, filters and data paths used to extract the data points.")
+    parser.add_argument('--full', action='store_true', help="Optional flag to parse every file again, ignoring the manifest of the previous reparse.")
+    parser.add_argument('--html_archive', choices=HTML_ARCHIVES, default="files", help="Optional source of the cached pages. segments reads them from the html archive instead of the html output folder. Defaults to files.")
+    return parser.parse_args(argv)
+
+def parse_merge_arguments(argv: list[str]) -> argparse.Namespace:
+    """
+    Parses command-line arguments of the `merge` command.
+
+    The `merge` command combines the outputs of the shards written with --shard under the output prefix into the
+    output files of the prefix.
+
+    Command-line arguments:
+        --output_prefix (str): An optional prefix the shards were written under. Defaults to an empty string.
+
+    Args:
+        argv (list[str]): The command-line arguments following the command name.
+
+    Returns:
+        argparse.Namespace: A namespace containing the parsed arguments.
+
+    Example usage:
+        python script.py merge --output_prefix FIN
+    """
+    parser = argparse.ArgumentParser(prog="play_store_fetcher.py merge", description="Combines the outputs of the shards under the output prefix into one dataset")
+    parser.add_argument('--output_prefix', default="", help="Optional prefix the shards were written under. Defaults to nothing.")
+    return parser.parse_args(argv)
+
+def parse_export_arguments(argv: list[str]) -> argparse.Namespace:
+    """
+    Parses command-line arguments of the `export` command.
+
+    The `export` command writes the latest row of each pair in the found csv file to the columnar output.
+
+    Command-line arguments:
+        --output_prefix (str): An optional prefix of the output files to export. Defaults to an empty string.
+        --format (str): An optional columnar format, "parquet" or "arrow". Defaults to "parquet".
+        --batch_rows (int): An optional number of rows per row group or record batch. Defaults to 65536.
+
+    Args:
+        argv (list[str]): The command-line arguments following the command name.
+
+    Returns:
+        argparse.Namespace: A namespace containing the parsed arguments.
+
+    Example usage:
+        python script.py export --output_prefix FIN --format parquet
+    """
+    parser = argparse.ArgumentParser(prog="play_store_fetcher.py export", description="Writes the found csv file to a columnar file with typed columns")
+    parser.add_argument('--output_prefix', default="", help="Optional prefix of the output files to export. Defaults to nothing.")
+    parser.add_argument('--format', choices=COLUMNAR_FORMATS, default="parquet", help="Optional columnar format. Defaults to parquet.")
+    parser.add_argument('--batch_rows', type=int, default=DEFAULT_COLUMNAR_BATCH_ROWS, help="Optional number of rows per row group (parquet) or record batch (arrow). Defaults to 65536.")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    input_file, regions_list, output_prefix, use_cached_html = parse_console_arguments()
-    main(input_file, regions_list, output_prefix, use_cached_html)
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == "reparse":
+        reparse_args = parse_reparse_arguments(sys.argv[2:])
+        start_time = time.time()
+        parsed_files = reparse_cached_html(reparse_args.output_prefix, reparse_args.processes, reparse_args.chunksize, reparse_args.parser_backend, reparse_args.extraction_config, reparse_args.full, reparse_args.html_archive)
+        print(f"Reprocessed {parsed_files} files in {(time.time() - start_time) / 60:.2f} minutes")
+    elif len(sys.argv) > 1 and sys.argv[1] == "merge":
+        merge_args = parse_merge_arguments(sys.argv[2:])
+        merge_counts = merge_shards(merge_args.output_prefix)
+        print(f"Merged {merge_counts['shards']} shards: {merge_counts['found']} found, {merge_counts['missing']} missing, "
+              f"{merge_counts['errors']} errors, {merge_counts['cached']} cached pairs, {merge_counts['html_files']} html files")
+    elif len(sys.argv) > 1 and sys.argv[1] == "export":
+        export_args = parse_export_arguments(sys.argv[2:])
+        if import_pyarrow() is None:
+            print("The columnar output requires the pyarrow package!")
+        else:
+            exported_rows = export_found_csv(export_args.output_prefix, export_args.format, export_args.batch_rows)
+            print(f"Exported {exported_rows} rows to {get_columnar_path(export_args.output_prefix, export_args.format, 'export')}")
+    else:
+        args = parse_console_arguments()
+        main(args.package_listing, args.regions, args.output_prefix, args.use_cached_html, workers=args.workers, backend=args.backend, max_in_flight=args.max_in_flight,
+             pool_size=args.pool_size, connect_timeout=args.connect_timeout, read_timeout=args.read_timeout,
+             rate=args.rate, max_rate=args.max_rate, rate_limit_scope=args.rate_limit_scope,
+             max_attempts=args.max_attempts, backoff_base=args.backoff_base, backoff_cap=args.backoff_cap, max_throttled_attempts=args.max_throttled_attempts,
+             parser_backend=args.parser_backend, extraction_config=args.extraction_config, state_store=args.state_store,
+             flush_rows=args.flush_rows, flush_interval=args.flush_interval, html_archive=args.html_archive,
+             refresh=args.refresh, max_age=args.max_age, max_age_tiers=args.max_age_tier,
+             dedup=args.dedup, header=args.header, schedule=args.schedule, shard=args.shard, columnar_output=args.columnar_output,
+             progress_interval=args.progress_interval, metrics_file=args.metrics_file, base_url=args.base_url)
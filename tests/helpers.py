@@ -0,0 +1,10 @@
+# Helpers shared by the tests
+# make_response builds the mock response returned by the patched send_request
+
+
+
+from datetime import timedelta
+
+def make_response(status_code: int, text: str = "mock", headers: dict = None) -> object:
+    return type("Response", (object,), {"status_code": status_code, "text": text, "content": text.encode("utf-8"),
+                                        "headers": headers or {}, "elapsed": timedelta(milliseconds=5)})
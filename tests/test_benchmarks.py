@@ -0,0 +1,93 @@
+# These tests focus on the benchmark suite in the benchmarks folder
+# They run the benchmarks on a small corpus and cache, with short measuring rounds
+#
+# The tests make sure that:
+# 1. The generated corpus is reproducible and every parser backend extracts the expected data points from it
+# 2. The benchmarks return a result for each backend, cache size and startup command
+# 3. Comparing with a baseline flags the benchmarks that got slower by more than the threshold, whichever way the unit goes
+# 4. The end to end benchmark reads a real package listing and restores the module state configured before it
+# 5. The runner writes a JSON results file and exits with status 1 on a regression
+
+
+
+import json
+import pytest
+from benchmarks.corpus import generate_corpus
+from benchmarks.run_benchmarks import (benchmark_append_to_csv, benchmark_cache, benchmark_end_to_end, benchmark_import_time,
+                                       compare_results, main, result)
+import play_store_fetcher
+from play_store_fetcher import (PARSER_BACKENDS, FetchMetrics, configure_base_url, configure_metrics, configure_parser_backend, configure_session,
+                                get_app_info_from_html)
+
+@pytest.fixture(scope="module")
+def corpus() -> list:
+    return generate_corpus(4, page_size=20_000)
+
+@pytest.mark.parametrize("parser_backend", PARSER_BACKENDS)
+def test_corpus_extraction(corpus, parser_backend) -> None:
+    configure_parser_backend(parser_backend)
+    try:
+        for _, page, expected in corpus:
+            assert get_app_info_from_html(page) == expected
+    finally:
+        configure_parser_backend("lxml")
+
+def test_corpus_reproducible(corpus) -> None:
+    assert generate_corpus(4, page_size=20_000) == corpus
+    assert generate_corpus(4, page_size=20_000, seed=1) != corpus
+    assert all(len(page) >= 20_000 for _, page, _ in corpus)
+
+def test_benchmark_cache(tmp_path) -> None:
+    results = benchmark_cache([1000], str(tmp_path), min_time=0.01, repeat=1)
+    assert results["cache_read.1000"]["pairs"] == 1000
+    assert results["cache_read.1000"]["higher_is_better"] is False
+    assert results["cache_lookup.1000"]["value"] > 0
+
+def test_benchmark_append_to_csv(tmp_path) -> None:
+    results = benchmark_append_to_csv(str(tmp_path), min_time=0.01, repeat=1)
+    assert results["append_to_csv.unbuffered"]["value"] > 0 and results["append_to_csv.buffered"]["value"] > 0
+    assert list(tmp_path.iterdir()) == []
+
+def test_benchmark_end_to_end(corpus, tmp_path) -> None:
+    metrics = FetchMetrics(progress_interval=0)
+    configure_metrics(metrics)
+    configure_base_url("http://127.0.0.1:9/")
+    session = configure_session(3)
+    try:
+        results = benchmark_end_to_end(corpus, str(tmp_path), workers=2)
+        assert play_store_fetcher._METRICS is metrics and metrics.pairs_done == 0
+        assert play_store_fetcher._BASE_URL == "http://127.0.0.1:9"
+        assert play_store_fetcher._SESSION is session
+    finally:
+        configure_metrics(None)
+        configure_base_url()
+        configure_session()
+    assert results["end_to_end.threads"]["pairs"] == 8
+    assert results["end_to_end.threads"]["value"] > 0
+    assert (tmp_path / "end_to_end_packages.csv").read_text(encoding="utf-8").splitlines()[1:] == [package for package, _, _ in corpus]
+
+def test_benchmark_import_time() -> None:
+    results = benchmark_import_time(repeat=1)
+    assert set(results) == {"import_time.startup", "import_time.module", "import_time.help"}
+    assert all(import_result["unit"] == "ms" and not import_result["higher_is_better"] for import_result in results.values())
+
+def test_compare_results() -> None:
+    baseline = {"extraction.lxml": result(100, "pages/s"), "cache_read.1000": result(1.0, "s", higher_is_better=False),
+                "append_to_csv.buffered": result(1000, "rows/s")}
+    results = {"extraction.lxml": result(85, "pages/s"), "cache_read.1000": result(1.2, "s", higher_is_better=False),
+               "append_to_csv.buffered": result(950, "rows/s"), "end_to_end.threads": result(10, "pairs/s")}
+    assert compare_results(results, baseline, threshold=0.1) == ["extraction.lxml", "cache_read.1000"]
+    assert compare_results(results, baseline, threshold=0.25) == []
+
+def test_main_writes_results(tmp_path) -> None:
+    output_path = tmp_path / "results.json"
+    arguments = ["--benchmarks", "cache_read,cache_lookup", "--cache_sizes", "1000", "--min_time", "0.01", "--repeat", "1"]
+    assert main(arguments + ["--output", str(output_path)]) == 0
+    written = json.loads(output_path.read_text(encoding="utf-8"))
+    assert set(written["results"]) == {"cache_read.1000", "cache_lookup.1000"}
+    assert written["meta"]["arguments"]["cache_sizes"] == [1000]
+    baseline = {"results": {name: dict(value, value=value["value"] * 10 if value["higher_is_better"] else value["value"] / 10)
+                            for name, value in written["results"].items()}}
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(json.dumps(baseline), encoding="utf-8")
+    assert main(arguments + ["--output", str(tmp_path / "compared.json"), "--compare", str(baseline_path)]) == 1
@@ -0,0 +1,55 @@
+# These tests focus on the CacheIndex holding the cached package/region pairs in memory
+#
+# The tests make sure that:
+# 1. Pairs can be added and looked up, and duplicate pairs are only counted once
+# 2. The index is loaded from the existing cache csv file format
+# 3. The cache functions work with the index
+
+
+
+from unittest.mock import patch
+from play_store_fetcher import CACHE_FILE, CacheIndex, add_package_to_cache, package_is_cached, read_cached_packages
+
+def test_add_and_lookup() -> None:
+    cache = CacheIndex()
+    assert cache.add("com.example.app", "US")
+    assert cache.add("com.example.app", "FI")
+    assert not cache.add("com.example.app", "US")
+    assert cache.add("com.example.other", "FI")
+    assert ("com.example.app", "US") in cache
+    assert ("com.example.other", "FI") in cache
+    assert ("com.example.other", "US") not in cache
+    assert ("com.example.app", "SE") not in cache
+    assert ("com.example.missing", "US") not in cache
+    assert len(cache) == 3
+    assert cache.regions("com.example.app") == ["US", "FI"]
+    assert cache.regions("com.example.missing") == []
+    assert sorted(cache.packages()) == ["com.example.app", "com.example.other"]
+
+def test_many_regions() -> None:
+    regions = [f"R{i}" for i in range(100)]
+    cache = CacheIndex(("com.example.app", region) for region in regions[::2])
+    assert len(cache) == 50
+    assert all((("com.example.app", region) in cache) == (i % 2 == 0) for i, region in enumerate(regions))
+
+def test_from_csv(tmp_path) -> None:
+    (tmp_path / CACHE_FILE).write_text("com.example.app;US\ncom.example.app;FI\ncom.example.app;US\n\ncom.example.other;JP\n")
+    cache = read_cached_packages(f"{tmp_path}/")
+    assert isinstance(cache, CacheIndex)
+    assert len(cache) == 3
+    assert cache.regions("com.example.app") == ["US", "FI"]
+    assert package_is_cached(cache, "com.example.other", "JP")
+
+def test_read_without_cache_file(tmp_path) -> None:
+    cache = read_cached_packages(f"{tmp_path}/")
+    assert len(cache) == 0
+
+def test_add_package_to_cache(tmp_path) -> None:
+    output_prefix = f"{tmp_path}/"
+    cache = CacheIndex()
+    assert not package_is_cached(cache, "com.example.app", "US")
+    with patch("play_store_fetcher.time.time", return_value=1735689600.5):
+        add_package_to_cache(output_prefix, cache, "com.example.app", "US")
+    assert package_is_cached(cache, "com.example.app", "US")
+    assert not package_is_cached(cache, "com.example.app", "FI")
+    assert (tmp_path / CACHE_FILE).read_text() == "com.example.app;US;1735689600\n"
@@ -0,0 +1,105 @@
+# These tests focus on reading the cached html pages through memory maps
+#
+# The tests make sure that:
+# 1. Cached html files are memory-mapped, and empty files are read as empty bytes
+# 2. Cached pages are read from the html output folder or from the html archive, and missing pages give None
+# 3. The lxml parser extracts the data points straight from a memory-mapped page with non-ASCII text
+# 4. A read-only archive reads pages written by another archive object but refuses to store pages
+# 5. The reparse command reads the pages from the html archive and reuses unchanged pages from the manifest
+
+
+
+import os
+import csv
+import pytest
+from play_store_fetcher import (map_html_file, read_cached_html, get_app_info_from_html, reparse_cached_html, HtmlArchive, configure_html_archive,
+                                configure_parser_backend, configure_extraction_spec, DEFAULT_PARSER_BACKEND, OUTPUT_HTML_FOLDER,
+                                OUTPUT_HTML_ARCHIVE_FOLDER, OUTPUT_FOUND_CSV_FILE, FOUND_CSV_HEADER)
+
+PAGE_HTML = """<html><body>
+<h1 class="Fd93Bb">Sääpalvelu – ennuste</h1>
+<div class="l8YSdd"><div class="w7Iutd">
+    <div class="wVqUob">
+        <div class="ClM7O"><div><div class="TT9eCd">4.5<i>star</i></div></div></div>
+        <div class="g1rdde">1.2M reviews</div>
+    </div>
+    <div class="wVqUob">
+        <div class="ClM7O">10M+</div>
+        <div class="g1rdde">Downloads</div>
+    </div>
+</div></div>
+<div class="xg1aie">Last Updated: Jan 1, 2025</div>
+</body></html>"""
+
+@pytest.fixture(autouse=True)
+def default_reader() -> None:
+    yield
+    configure_html_archive(None)
+    configure_parser_backend(DEFAULT_PARSER_BACKEND)
+    configure_extraction_spec()
+
+@pytest.fixture
+def output_prefix(tmp_path) -> str:
+    html_folder = tmp_path / OUTPUT_HTML_FOLDER
+    html_folder.mkdir()
+    (html_folder / "com.example.app_FI.html").write_text(PAGE_HTML, encoding="utf-8")
+    (html_folder / "com.example.empty_US.html").write_text("", encoding="utf-8")
+    return f"{tmp_path}/"
+
+def test_map_html_file(output_prefix: str) -> None:
+    with map_html_file(f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.app_FI.html") as html_map:
+        assert html_map[:] == PAGE_HTML.encode("utf-8")
+    with map_html_file(f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.empty_US.html") as html_map:
+        assert html_map == b""
+
+def test_read_cached_html_from_files(output_prefix: str) -> None:
+    assert read_cached_html(output_prefix, "com.example.app", "FI") == PAGE_HTML
+    assert read_cached_html(output_prefix, "com.example.empty", "US") == ""
+    assert read_cached_html(output_prefix, "com.example.app", "US") is None
+
+def test_read_cached_html_from_archive(tmp_path) -> None:
+    archive = HtmlArchive(str(tmp_path / "archive"))
+    archive.put("com.example.app", "FI", PAGE_HTML)
+    configure_html_archive(archive)
+    assert read_cached_html(f"{tmp_path}/", "com.example.app", "FI") == PAGE_HTML
+    assert read_cached_html(f"{tmp_path}/", "com.example.app", "US") is None
+
+def test_lxml_parses_mapped_page(output_prefix: str) -> None:
+    configure_parser_backend("lxml")
+    with map_html_file(f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.app_FI.html") as html_map:
+        assert get_app_info_from_html(html_map) == ("4.5", "10M+", "1.2M", "Jan 01, 2025")
+
+def test_read_only_archive(tmp_path) -> None:
+    archive_folder = str(tmp_path / "archive")
+    with HtmlArchive(archive_folder, commit_every=1) as archive:
+        archive.put("com.example.app", "FI", PAGE_HTML)
+        with HtmlArchive(archive_folder, read_only=True) as reader:
+            assert reader.get("com.example.app", "FI") == PAGE_HTML.encode("utf-8")
+            archive.put("com.example.app", "US", PAGE_HTML.replace("4.5", "4.6"))
+            assert reader.get("com.example.app", "US") == PAGE_HTML.replace("4.5", "4.6").encode("utf-8")
+            with pytest.raises(ValueError):
+                reader.put("com.example.other", "FI", PAGE_HTML)
+
+def test_reparse_from_archive(tmp_path, capsys) -> None:
+    output_prefix = f"{tmp_path}/"
+    with HtmlArchive(f"{output_prefix}{OUTPUT_HTML_ARCHIVE_FOLDER}") as archive:
+        archive.put("com.example.app", "FI", PAGE_HTML)
+        archive.put("com.example.app", "US", PAGE_HTML)
+        archive.put("com.example.empty", "US", "<html></html>")
+    assert reparse_cached_html(output_prefix, processes=2, chunksize=1, html_archive="segments") == 3
+    with open(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}", newline='', encoding='utf-8') as file:
+        assert list(csv.reader(file, delimiter=";")) == [
+            FOUND_CSV_HEADER,
+            ["com.example.app", "FI", "4.5", "1.2M", "10M+", "Jan 01, 2025"],
+            ["com.example.app", "US", "4.5", "1.2M", "10M+", "Jan 01, 2025"],
+            ["com.example.empty", "US", "Not Found", "Not Found", "Not Found", "Not Found"],
+        ]
+    assert not os.path.exists(f"{output_prefix}{OUTPUT_HTML_FOLDER}")
+    with HtmlArchive(f"{output_prefix}{OUTPUT_HTML_ARCHIVE_FOLDER}") as archive:
+        archive.put("com.example.app", "US", PAGE_HTML.replace("4.5", "4.6"))
+    capsys.readouterr()
+    assert reparse_cached_html(output_prefix, processes=1, html_archive="segments") == 3
+    assert "Reused 2 unchanged files, parsed 1 files" in capsys.readouterr().out
+
+def test_reparse_without_archive(tmp_path) -> None:
+    assert reparse_cached_html(f"{tmp_path}/", processes=1, html_archive="segments") == 0
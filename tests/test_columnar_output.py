@@ -0,0 +1,106 @@
+# These tests focus on the columnar output of the found data
+# They write Parquet and Arrow files to a temporary folder and read them back with pyarrow
+#
+# The tests make sure that:
+# 1. Ratings, displayed counts and dates are normalized into typed values, with None for 'Not Found'
+# 2. The sink writes the rows in batches with typed columns, and the file only appears once the sink is closed
+# 3. save_pkg_data writes the found data to the configured sink next to the found csv file
+# 4. The export command writes the latest row of each pair of the found csv file and replaces the older part files
+
+
+
+import os
+import pytest
+from datetime import date
+from play_store_fetcher import (OUTPUT_COLUMNAR_FOLDER, OUTPUT_FOUND_CSV_FILE, ColumnarFoundSink, configure_columnar_sink,
+                                export_found_csv, get_columnar_path, init_checks, normalize_count, normalize_date,
+                                normalize_rating, save_pkg_data)
+
+@pytest.fixture
+def pyarrow():
+    pyarrow = pytest.importorskip("pyarrow")
+    yield pyarrow
+    configure_columnar_sink(None)
+
+def read_table(pyarrow, file_path: str, columnar_format: str):
+    if columnar_format == "parquet":
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(file_path)
+    import pyarrow.ipc
+    with pyarrow.ipc.open_file(file_path) as reader:
+        return reader.read_all()
+
+def test_normalize_rating() -> None:
+    assert normalize_rating("4.5") == 4.5
+    assert normalize_rating("Not Found") is None
+    assert normalize_rating(None) is None
+
+def test_normalize_count() -> None:
+    assert normalize_count("2.64M") == 2640000
+    assert normalize_count("4.35M") == 4350000
+    assert normalize_count("5B+") == 5000000000
+    assert normalize_count("10K+") == 10000
+    assert normalize_count("1,234") == 1234
+    assert normalize_count("100+") == 100
+    assert normalize_count("Not Found") is None
+    assert normalize_count("") is None
+
+def test_normalize_date() -> None:
+    assert normalize_date("Mar 10, 2025") == date(2025, 3, 10)
+    assert normalize_date("Not Found") is None
+
+@pytest.mark.parametrize("columnar_format", ["parquet", "arrow"])
+def test_sink_writes_typed_columns(pyarrow, tmp_path, columnar_format) -> None:
+    file_path = str(tmp_path / f"found.{columnar_format}")
+    sink = ColumnarFoundSink(file_path, columnar_format, batch_rows=2)
+    sink.write(["com.example.a", "US", "4.5", "2.64M", "5B+", "Mar 10, 2025"], 1741564800)
+    sink.write(["com.example.b", "US", "Not Found", "Not Found", "10K+", "Not Found"])
+    sink.write(["com.example.c", "FI", "3.9", "100", "1K+", "Jan 01, 2024"], 1741564800)
+    assert not os.path.exists(file_path)
+    sink.close()
+    table = read_table(pyarrow, file_path, columnar_format)
+    assert str(table.schema.field("rating").type) == "double"
+    assert str(table.schema.field("downloads").type) == "int64"
+    assert str(table.schema.field("last_updated").type) == "date32[day]"
+    rows = table.to_pylist()
+    assert [row["package"] for row in rows] == ["com.example.a", "com.example.b", "com.example.c"]
+    assert rows[0]["rating"] == 4.5 and rows[0]["reviews"] == 2640000 and rows[0]["downloads"] == 5000000000
+    assert rows[0]["last_updated"] == date(2025, 3, 10)
+    assert rows[0]["fetched_at"].timestamp() == 1741564800
+    assert rows[1]["rating"] is None and rows[1]["reviews"] is None and rows[1]["last_updated"] is None and rows[1]["fetched_at"] is None
+    if columnar_format == "parquet":
+        import pyarrow.parquet
+        assert pyarrow.parquet.ParquetFile(file_path).num_row_groups == 2
+
+def test_unknown_format(pyarrow, tmp_path) -> None:
+    with pytest.raises(ValueError):
+        ColumnarFoundSink(str(tmp_path / "found.csv"), "csv")
+
+def test_save_pkg_data_writes_sink(pyarrow, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    init_checks(str(input_csv), output_prefix)
+    part_path = get_columnar_path(output_prefix, "parquet", "run")
+    configure_columnar_sink(ColumnarFoundSink(part_path, "parquet"))
+    save_pkg_data("com.example.a", "US", "4.5", "100K+", "1M+", "Jan 01, 2025", "<html></html>", output_prefix)
+    configure_columnar_sink(None)
+    assert part_path == f"{tmp_path}/{OUTPUT_COLUMNAR_FOLDER}/run.parquet"
+    rows = read_table(pyarrow, part_path, "parquet").to_pylist()
+    assert [(row["package"], row["reviews"], row["downloads"]) for row in rows] == [("com.example.a", 100000, 1000000)]
+    assert rows[0]["fetched_at"] is not None
+
+def test_export_found_csv(pyarrow, tmp_path) -> None:
+    output_prefix = f"{tmp_path}/"
+    (tmp_path / OUTPUT_FOUND_CSV_FILE).write_text(
+        "Package Name;Data Region;Rating;Reviews;Downloads;Last Updated\n"
+        "com.example.a;US;4.0;10;1K+;Jan 01, 2024\n"
+        "com.example.b;US;Not Found;Not Found;Not Found;Not Found\n"
+        "com.example.a;US;4.5;20;5K+;Jan 01, 2025\n", encoding="utf-8")
+    old_part = get_columnar_path(output_prefix, "arrow", "run_old")
+    with ColumnarFoundSink(old_part, "arrow") as sink:
+        sink.write(["com.example.a", "US", "4.0", "10", "1K+", "Jan 01, 2024"])
+    assert export_found_csv(output_prefix, "arrow") == 2
+    assert not os.path.exists(old_part)
+    rows = read_table(pyarrow, get_columnar_path(output_prefix, "arrow", "export"), "arrow").to_pylist()
+    assert [(row["package"], row["rating"], row["downloads"]) for row in rows] == [("com.example.b", None, None), ("com.example.a", 4.5, 5000)]
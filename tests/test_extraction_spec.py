@@ -0,0 +1,67 @@
+# These tests focus on the extraction spec used by get_app_info_from_html
+#
+# The tests make sure that:
+# 1. Dates in the known formats of the store page are converted without dateutil
+# 2. Other dates fall back to dateutil
+# 3. Selectors and filters can be overridden from a config file for every parser backend
+# 4. Invalid config files are rejected
+
+
+
+import json
+import pytest
+from unittest.mock import patch
+from play_store_fetcher import configure_extraction_spec, get_app_info_from_html, parse_update_date
+
+@pytest.fixture(autouse=True)
+def default_spec() -> None:
+    yield
+    configure_extraction_spec()
+
+@pytest.mark.parametrize("matches, expected", [
+    (["Jan 1, 2025"], "Jan 01, 2025"),
+    (["Mar 30 2040"], "Mar 30, 2040"),
+    (["1 Jan 1900"], "Jan 01, 1900"),
+    (["20 Mar, 2010"], "Mar 20, 2010"),
+    (["10 dec 2000"], "Dec 10, 2000"),
+])
+def test_parse_update_date_fast_path(matches: list, expected: str) -> None:
+    with patch("dateutil.parser.parse") as mock_parse:
+        assert parse_update_date(matches) == expected
+    mock_parse.assert_not_called()
+
+def test_parse_update_date_falls_back_to_dateutil() -> None:
+    with patch("dateutil.parser.parse", wraps=__import__("dateutil.parser").parser.parse) as mock_parse:
+        assert parse_update_date(["Sep 1, 2025", ""]) == "Sep 01, 2025"
+        mock_parse.assert_not_called()
+        assert parse_update_date(["2025", "Mar", "1"]) == "Mar 01, 2025"
+        mock_parse.assert_called_once_with("2025 Mar 1")
+
+@pytest.mark.parametrize("parser_backend", ["lxml", "bs4"])
+def test_config_overrides_selectors(parser_backend: str, tmp_path) -> None:
+    config_path = tmp_path / "extraction.json"
+    config_path.write_text(json.dumps({
+        "star_rating": {"css_selector": "span.newRating", "xpath": "//span[@class='newRating']"},
+        "last_updated_time": {"css_selector": "p.updated", "xpath": "//p[@class='updated']"},
+    }))
+    configure_extraction_spec(str(config_path))
+    mock_html = '''
+    <html>
+        <body>
+            <span class="newRating">4.1<i>star</i></span>
+            <p class="updated">Updated on 2 Feb 2024</p>
+        </body>
+    </html>
+    '''
+    assert get_app_info_from_html(mock_html, parser_backend) == ("4.1", "Not Found", "Not Found", "Feb 02, 2024")
+
+@pytest.mark.parametrize("config", [
+    {"unknown_data_point": {"xpath": "//div"}},
+    {"star_rating": {"unknown_field": "value"}},
+    {"star_rating": {"value": "unknown_value"}},
+])
+def test_config_rejects_invalid_spec(config: dict, tmp_path) -> None:
+    config_path = tmp_path / "extraction.json"
+    config_path.write_text(json.dumps(config))
+    with pytest.raises(ValueError):
+        configure_extraction_spec(str(config_path))
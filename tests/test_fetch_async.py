@@ -0,0 +1,119 @@
+# This test focuses on the fetch_playstore_data_async function
+# It starts a small local HTTP server to simulate the Google Play Store and writes the outputs to a temporary folder
+#
+# The test makes sure that:
+# 1. Every package/region pair is requested exactly once
+# 2. Pages returning 200 are saved to the found csv file and pages returning 404 to the missing csv file
+# 3. Every fetched pair is written to the cache file
+# 4. The connections, responses and body bytes are recorded in the configured metrics
+# 5. Idle coroutines sleep until a fetch ends or a retry is ready instead of polling
+# 6. A page whose body does not match the charset of its Content-Type is still saved, with the undecodable bytes replaced
+
+
+
+import asyncio
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from play_store_fetcher import (CACHE_FILE, OUTPUT_FOUND_CSV_FILE, OUTPUT_MISSING_CSV_FILE, CacheIndex, FetchMetrics, RetryQueue, configure_metrics,
+                                fetch_playstore_data_async, init_checks, read_cached_packages)
+
+pytest.importorskip("aiohttp")
+
+class MockPlayStoreHandler(BaseHTTPRequestHandler):
+    requested_paths = []
+
+    def do_GET(self) -> None:
+        self.requested_paths.append(self.path)
+        status = 404 if "missing" in self.path else 200
+        body = b"<html></html>"
+        self.send_response(status)
+        if "mismatched" in self.path:
+            #Latin-1 bytes served as utf-8
+            body = "<html>Café</html>".encode("latin-1")
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+@pytest.fixture
+def mock_server() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockPlayStoreHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def read_rows(path) -> list[list[str]]:
+    with open(path, encoding="utf-8") as file:
+        return [line.strip().split(";") for line in file if line.strip()]
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+def test_fetch_async(mock_get_info, mock_server, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    init_checks(str(input_csv), output_prefix)
+    MockPlayStoreHandler.requested_paths = []
+
+    packages = [f"com.example.app{i}" for i in range(10)] + ["com.example.missing"]
+    with patch("play_store_fetcher.form_playstore_url", side_effect=lambda pkg, language, region: f"{mock_server}/?id={pkg}&gl={region}"):
+        asyncio.run(fetch_playstore_data_async(output_prefix, read_cached_packages(output_prefix), packages, ["US", "FI"], False, 4))
+
+    assert len(MockPlayStoreHandler.requested_paths) == 22
+    assert len(read_rows(tmp_path / OUTPUT_FOUND_CSV_FILE)) == 1 + 20
+    assert len(read_rows(tmp_path / OUTPUT_MISSING_CSV_FILE)) == 1 + 2
+    assert len(read_rows(tmp_path / CACHE_FILE)) == 22
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+def test_fetch_async_metrics(mock_get_info, mock_server, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    init_checks(str(input_csv), output_prefix)
+    metrics = FetchMetrics(progress_interval=0)
+    configure_metrics(metrics)
+    try:
+        packages = ["com.example.app0", "com.example.app1", "com.example.missing"]
+        with patch("play_store_fetcher.form_playstore_url", side_effect=lambda pkg, language, region: f"{mock_server}/?id={pkg}&gl={region}"):
+            asyncio.run(fetch_playstore_data_async(output_prefix, read_cached_packages(output_prefix), packages, ["US"], False, 2))
+    finally:
+        configure_metrics(None)
+    assert metrics.status_codes == {200: 2, 404: 1}
+    assert metrics.body_bytes == 3 * len(b"<html></html>")
+    assert metrics.pairs_done == 3
+    assert metrics.stage_calls["network_connect"] >= 1
+    assert metrics.stage_calls["network_ttfb"] == 3
+
+def test_fetch_async_idle_workers() -> None:
+    attempts = []
+
+    async def slow_fetch(session, output_prefix, cached_packages, package, region, use_cached_html, attempt, throttles):
+        attempts.append(attempt)
+        await asyncio.sleep(0.3)
+        return (0.2, attempt + 1, 0) if attempt == 1 else None
+
+    pop_ready = RetryQueue.pop_ready
+    with patch("play_store_fetcher.fetch_playstore_data_for_region_async", side_effect=slow_fetch), \
+         patch.object(RetryQueue, "pop_ready", autospec=True, side_effect=pop_ready) as mock_pop_ready:
+        asyncio.run(fetch_playstore_data_async("", CacheIndex(), ["com.example.app"], ["US"], False, 8))
+    assert attempts == [1, 2]
+    #Polling every 50 ms would look up ready retries hundreds of times while the pair is fetched and waits
+    assert mock_pop_ready.call_count < 50
+
+def test_fetch_async_mismatched_charset(mock_server, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    init_checks(str(input_csv), output_prefix)
+    with patch("play_store_fetcher.form_playstore_url", side_effect=lambda pkg, language, region: f"{mock_server}/?id={pkg}&gl={region}"), \
+         patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025")) as mock_get_info:
+        asyncio.run(fetch_playstore_data_async(output_prefix, read_cached_packages(output_prefix), ["com.example.mismatched"], ["US"], False, 1))
+    mock_get_info.assert_called_once_with("<html>Caf\ufffd</html>")
+    assert len(read_rows(tmp_path / OUTPUT_FOUND_CSV_FILE)) == 1 + 1
+    assert len(read_rows(tmp_path / CACHE_FILE)) == 1
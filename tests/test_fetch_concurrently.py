@@ -0,0 +1,41 @@
+# This test focuses on the fetch_playstore_data_concurrently function
+# It uses mocks to simulate requests to the Google Play Store and writes the outputs to a temporary folder
+#
+# The test makes sure that:
+# 1. Every package/region pair is fetched exactly once, even if the package is listed several times
+# 2. Every fetched pair is written to the cache file and the found csv file exactly once
+# 3. Already cached pairs are not requested again
+
+
+
+from unittest.mock import patch
+from play_store_fetcher import CACHE_FILE, OUTPUT_FOUND_CSV_FILE, fetch_playstore_data_concurrently, init_checks, read_cached_packages
+
+MOCK_RESPONSE = type("Response", (object,), {"status_code": 200, "text": "mock", "headers": {}})
+
+def read_rows(path) -> list[list[str]]:
+    with open(path, encoding="utf-8") as file:
+        return [line.strip().split(";") for line in file if line.strip()]
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request", return_value=MOCK_RESPONSE)
+def test_fetch_concurrently(mock_request, mock_get_info, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    init_checks(str(input_csv), output_prefix)
+
+    packages = [f"com.example.app{i}" for i in range(20)] + ["com.example.app0"]
+    fetch_playstore_data_concurrently(output_prefix, read_cached_packages(output_prefix), packages, ["US", "FI"], False, 4)
+
+    assert mock_request.call_count == 40
+    cache_rows = read_rows(tmp_path / CACHE_FILE)
+    assert len(cache_rows) == 40
+    assert len(set(map(tuple, cache_rows))) == 40
+    found_rows = read_rows(tmp_path / OUTPUT_FOUND_CSV_FILE)[1:]
+    assert sorted(row[:2] for row in found_rows) == sorted(row[:2] for row in cache_rows)
+
+    #Second run should find everything from the cache
+    mock_request.reset_mock()
+    fetch_playstore_data_concurrently(output_prefix, read_cached_packages(output_prefix), packages, ["US", "FI"], False, 4)
+    mock_request.assert_not_called()
@@ -0,0 +1,141 @@
+# These tests focus on the SQLite fetch state store used with --state_store sqlite
+# They use mocks to simulate requests to the Google Play Store and write the store to a temporary folder
+#
+# The tests make sure that:
+# 1. The status, HTTP status, timestamps and attempts of a pair are recorded
+# 2. The pairs of an existing cache csv file are imported into a new store
+# 3. A pair with several cache csv rows keeps its earliest and latest fetch time
+# 4. States are committed in batches and are readable from another connection after a commit
+# 5. Concurrent workers record every pair, and fetched pairs are skipped on the next run
+# 6. Failed pairs are recorded as retrying and finally as errors
+
+
+
+import os
+import sqlite3
+import threading
+import pytest
+from unittest.mock import patch
+from play_store_fetcher import (CACHE_FILE, STATE_STORE_FILE, FetchStateStore, configure_retries, fetch_playstore_data_concurrently,
+                                fetch_playstore_data_sequentially, init_checks, open_fetch_state_store, package_is_cached)
+from tests.helpers import make_response
+
+@pytest.fixture(autouse=True)
+def fast_retries() -> None:
+    configure_retries(max_attempts=3, backoff_base=0, backoff_cap=0)
+    yield
+    configure_retries()
+
+@pytest.fixture
+def output_prefix(tmp_path) -> str:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    init_checks(str(input_csv), f"{tmp_path}/")
+    return f"{tmp_path}/"
+
+def test_record_state(tmp_path) -> None:
+    with FetchStateStore(str(tmp_path / STATE_STORE_FILE)) as store:
+        assert store.get_state("com.example.app", "US") is None
+        assert not store.is_fetched("com.example.app", "US")
+        store.record("com.example.app", "US", "retrying", 503)
+        first_state = store.get_state("com.example.app", "US")
+        assert not package_is_cached(store, "com.example.app", "US")
+        store.record("com.example.app", "US", "found", 200)
+        state = store.get_state("com.example.app", "US")
+        assert package_is_cached(store, "com.example.app", "US")
+        assert not package_is_cached(store, "com.example.app", "FI")
+    assert state["status"] == "found"
+    assert state["http_status"] == 200
+    assert state["attempts"] == 2
+    assert state["first_fetched"] == first_state["first_fetched"]
+    assert state["last_fetched"] >= state["first_fetched"]
+
+def test_import_cache_csv(output_prefix: str) -> None:
+    with open(f"{output_prefix}{CACHE_FILE}", "w", encoding="utf-8") as file:
+        file.write("com.example.app;US\ncom.example.app;FI\n")
+    with open_fetch_state_store(output_prefix) as store:
+        assert store.status_counts() == {"cached": 2}
+        assert store.is_fetched("com.example.app", "FI")
+        store.record("com.example.other", "US", "error", 500)
+    #The csv file is only imported into a new store
+    with open(f"{output_prefix}{CACHE_FILE}", "a", encoding="utf-8") as file:
+        file.write("com.example.later;US\n")
+    with open_fetch_state_store(output_prefix) as store:
+        assert store.status_counts() == {"cached": 2, "error": 1}
+        assert store.import_cache_csv(f"{output_prefix}{CACHE_FILE}") == 1
+
+def test_import_cache_csv_keeps_latest_fetch(tmp_path) -> None:
+    cache_csv = tmp_path / CACHE_FILE
+    cache_csv.write_text("com.example.app;US;200.0\ncom.example.app;US;300.0\ncom.example.app;US;100.0\ncom.example.app;US\n")
+    with FetchStateStore(str(tmp_path / STATE_STORE_FILE)) as store:
+        assert store.import_cache_csv(str(cache_csv)) == 3
+        state = store.get_state("com.example.app", "US")
+        assert (state["first_fetched"], state["last_fetched"]) == (100.0, 300.0)
+        #The same cache csv file fetched again later
+        cache_csv.write_text("com.example.app;US;250.0\ncom.example.app;US;400.0\n")
+        assert store.import_cache_csv(str(cache_csv)) == 1
+        state = store.get_state("com.example.app", "US")
+    assert (state["status"], state["first_fetched"], state["last_fetched"]) == ("cached", 100.0, 400.0)
+
+def test_batched_commits(tmp_path) -> None:
+    db_path = str(tmp_path / STATE_STORE_FILE)
+    reader = sqlite3.connect(db_path)
+    with FetchStateStore(db_path, commit_every=3, commit_interval=3600) as store:
+        assert reader.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        store.record("com.example.app1", "US", "found", 200)
+        store.record("com.example.app2", "US", "found", 200)
+        assert reader.execute("SELECT COUNT(*) FROM fetch_state").fetchone()[0] == 0
+        store.record("com.example.app3", "US", "found", 200)
+        assert reader.execute("SELECT COUNT(*) FROM fetch_state").fetchone()[0] == 3
+        store.record("com.example.app4", "US", "found", 200)
+    assert reader.execute("SELECT COUNT(*) FROM fetch_state").fetchone()[0] == 4
+    reader.close()
+
+def test_concurrent_records(tmp_path) -> None:
+    with FetchStateStore(str(tmp_path / STATE_STORE_FILE), commit_every=7) as store:
+        def record_pairs(region: str) -> None:
+            for i in range(200):
+                store.record(f"com.example.app{i}", region, "found", 200)
+        threads = [threading.Thread(target=record_pairs, args=(region,)) for region in ["US", "FI", "SE", "DE"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert store.status_counts() == {"found": 800}
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request", return_value=make_response(200))
+def test_fetch_concurrently_with_store(mock_request, mock_get_info, output_prefix: str) -> None:
+    packages = [f"com.example.app{i}" for i in range(20)]
+    with open_fetch_state_store(output_prefix) as store:
+        fetch_playstore_data_concurrently(output_prefix, store, packages, ["US", "FI"], False, 4)
+    assert mock_request.call_count == 40
+    #The csv cache is not used with the store
+    assert not os.path.exists(f"{output_prefix}{CACHE_FILE}")
+
+    mock_request.reset_mock()
+    with open_fetch_state_store(output_prefix) as store:
+        assert store.status_counts() == {"found": 40}
+        fetch_playstore_data_concurrently(output_prefix, store, packages, ["US", "FI"], False, 4)
+    mock_request.assert_not_called()
+
+@patch("play_store_fetcher.save_pkg_data")
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request")
+def test_failures_are_recorded(mock_request, mock_get_info, mock_save, output_prefix: str) -> None:
+    responses = {
+        "com.example.flaky": [make_response(502), make_response(200)],
+        "com.example.missing": [make_response(404)],
+        "com.example.broken": [make_response(500)] * 3,
+        "com.example.forbidden": [make_response(403)],
+    }
+    mock_request.side_effect = lambda url, headers=None: responses[url.split("id=")[1].split("&")[0]].pop(0)
+    with open_fetch_state_store(output_prefix) as store:
+        fetch_playstore_data_sequentially(output_prefix, store, list(responses.keys()), ["US"], False)
+        states = {package: store.get_state(package, "US") for package in responses}
+    assert {package: (state["status"], state["http_status"], state["attempts"]) for package, state in states.items()} == {
+        "com.example.flaky": ("found", 200, 2),
+        "com.example.missing": ("missing", 404, 1),
+        "com.example.broken": ("error", 500, 3),
+        "com.example.forbidden": ("error", 403, 1),
+    }
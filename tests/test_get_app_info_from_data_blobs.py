@@ -0,0 +1,96 @@
+# These tests focus on the get_app_info_from_data_blobs function
+# They cover scenarios such as:
+#
+# 1. When all information is present in the embedded app data
+# 2. When the app data is missing and the rendered html is used instead
+# 3. When only parts of the information are present in the app data
+# 4. Formatting of the counts in the compact form displayed on the store page
+#
+# The tests use mock HTML with an embedded AF_initDataCallback payload to simulate real Google Play Store pages.
+
+import json
+import pytest
+from play_store_fetcher import DEFAULT_EXTRACTION_SPEC, format_compact_count, get_app_info_from_data_blobs, get_app_info_from_html
+
+def make_app_data(values: dict) -> list:
+    app_data = []
+    for data_key, value in values.items():
+        node = app_data
+        path = DEFAULT_EXTRACTION_SPEC[data_key]["data_blob_path"]
+        for depth, index in enumerate(path):
+            while len(node) <= index:
+                node.append(None)
+            if depth == len(path) - 1:
+                node[index] = value
+            else:
+                if node[index] is None:
+                    node[index] = []
+                node = node[index]
+    return app_data
+
+def make_page(app_data: list, body: str = "") -> str:
+    return f'''
+    <html>
+        <head>
+            <script nonce="abc">AF_initDataCallback({{key: 'ds:4', hash: '2', data:[["decoy", 1.0]], sideChannel: {{}}}});</script>
+            <script nonce="abc">AF_initDataCallback({{key: 'ds:5', hash: '7', data:{json.dumps(app_data)}, sideChannel: {{}}}});</script>
+        </head>
+        <body>{body}</body>
+    </html>
+    '''
+
+RENDERED_BODY = '''
+    <div class="l8YSdd">
+        <div class="w7Iutd">
+            <div class="wVqUob">
+                <div class="ClM7O"><div itemprop="starRating"><div class="TT9eCd">3.7<i>star</i></div></div></div>
+                <div class="g1rdde">1.58K reviews</div>
+            </div>
+            <div class="wVqUob">
+                <div class="ClM7O">100K+</div>
+                <div class="g1rdde">Downloads</div>
+            </div>
+        </div>
+    </div>
+    <div class="xg1aie">Jan 1, 2025</div>
+'''
+
+@pytest.mark.parametrize("count, expected", [
+    (0, "0"),
+    (999, "999"),
+    (1000, "1K"),
+    (1150, "1.15K"),
+    (1589, "1.58K"),
+    (100000, "100K"),
+    (1500000, "1.5M"),
+    (2643210, "2.64M"),
+    (5000000000, "5B"),
+])
+def test_format_compact_count(count: int, expected: str) -> None:
+    assert format_compact_count(count) == expected
+
+def test_get_app_info_from_data_blobs() -> None:
+    app_data = make_app_data({
+        "star_rating": 3.8765,
+        "download_count": 5000000000,
+        "review_count": 2643210,
+        "last_updated_time": 1741564800,
+    })
+    expected = ("3.9", "5B+", "2.64M", "Mar 10, 2025")
+    assert get_app_info_from_data_blobs(make_page(app_data)) == expected
+    assert get_app_info_from_html(make_page(app_data), "json") == expected
+
+def test_get_app_info_from_data_blobs_missing_blob() -> None:
+    page = f"<html><body>{RENDERED_BODY}</body></html>"
+    assert get_app_info_from_data_blobs(page) == ("3.7", "100K+", "1.58K", "Jan 01, 2025")
+
+def test_get_app_info_from_data_blobs_partial_blob() -> None:
+    app_data = make_app_data({"star_rating": 4.25, "download_count": 1000000})
+    assert get_app_info_from_data_blobs(make_page(app_data, RENDERED_BODY)) == ("4.2", "1M+", "1.58K", "Jan 01, 2025")
+
+def test_get_app_info_from_data_blobs_invalid_blob() -> None:
+    page = "<script>AF_initDataCallback({key: 'ds:5', hash: '7', data:[[broken, sideChannel: {}});</script>"
+    assert get_app_info_from_data_blobs(page) == ("Not Found", "Not Found", "Not Found", "Not Found")
+
+def test_get_app_info_from_data_blobs_empty() -> None:
+    assert get_app_info_from_data_blobs("") == ("Not Found", "Not Found", "Not Found", "Not Found")
@@ -6,13 +6,22 @@
 # 3. When all information is missing
 # 4. When the HTML is not in a correct format
 # 5. When only parts of the information are available
+# 6. When the page starts with an XML declaration or a doctype
 #
 # The tests use mock HTML to simulate the structure of real Google Play Store pages.
 # The expected output for each test is compared with the actual output returned 
 # by the function and if they match, the test is considered successful
+#
+# Every test is run with each parser backend, as the backends must return the same data points
 
 import pytest
-from play_store_fetcher import get_app_info_from_html
+from play_store_fetcher import DEFAULT_PARSER_BACKEND, PARSER_BACKENDS, configure_parser_backend, get_app_info_from_html
+
+@pytest.fixture(autouse=True, params=PARSER_BACKENDS)
+def parser_backend(request) -> str:
+    configure_parser_backend(request.param)
+    yield request.param
+    configure_parser_backend(DEFAULT_PARSER_BACKEND)
 
 #Tests trough the possible value types for each field
 COMPLETE_VALUE_TEST_BATTERY = [
@@ -565,4 +574,46 @@ def test_get_app_info_from_html_rating_only() -> None:
     '''
     expected = ("4.5", "Not Found", "Not Found", "Not Found")
     result = get_app_info_from_html(mock_html)
-    assert result == expected
\ No newline at end of file
+    assert result == expected
+
+#Pages given as str must be parsed whatever encoding their XML declaration names
+PROLOG_TEST_BATTERY = [
+    ("No prolog", ""),
+    ("HTML5 doctype", "<!DOCTYPE html>"),
+    ("XML declaration utf-8", '<?xml version="1.0" encoding="utf-8"?>'),
+    ("XML declaration latin-1", '<?xml version="1.0" encoding="ISO-8859-1"?>'),
+    ("XML declaration and XHTML doctype", '<?xml version="1.0" encoding="UTF-8"?><!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">'),
+]
+
+@pytest.mark.parametrize("test_purpose, prolog", PROLOG_TEST_BATTERY)
+def test_get_app_info_from_html_prolog(test_purpose: str, prolog: str) -> None:
+    # test when the page starts with a prolog, with non-ascii text on the page
+    mock_html = f'''{prolog}
+    <html>
+        <body>
+            <h1>Café Ñandú</h1>
+            <div class="l8YSdd">
+                <div class="w7Iutd">
+                    <div class="wVqUob">
+                        <div class="ClM7O">
+                            <div itemprop="starRating">
+                                <div class="TT9eCd" aria-label="Rated 4.5 stars out of five stars">4.5
+                                    <i class="google-material-icons notranslate ERwvGb" aria-hidden="true">star</i>
+                                </div>
+                            </div>
+                        </div>
+                        <div class="g1rdde">1.58K reviews</div>
+                    </div>
+                    <div class="wVqUob">
+                        <div class="ClM7O">100K+</div>
+                        <div class="g1rdde">Downloads</div>
+                    </div>
+                </div>
+            </div>
+            <div class="xg1aie">Last Updated: Jan 1, 2025</div>
+        </body>
+    </html>
+    '''
+    expected = ("4.5", "100K+", "1.58K", "Jan 01, 2025")
+    result = get_app_info_from_html(mock_html)
+    assert result == expected
@@ -0,0 +1,109 @@
+# These tests focus on the HtmlArchive storing the fetched html pages compressed in segment files
+#
+# The tests make sure that:
+# 1. Pages are stored and read back by package and region, also after the archive is reopened
+# 2. Identical pages are stored once, and new segments are started when a segment is full
+# 3. save_pkg_data and get_cached_html_file use the configured archive instead of html files
+# 4. Concurrent workers can store pages in the same archive
+
+
+
+import os
+import hashlib
+import threading
+import pytest
+from play_store_fetcher import (OUTPUT_FOUND_CSV_FILE, OUTPUT_HTML_FOLDER, HtmlArchive, configure_html_archive, configure_output_sink,
+                                get_cached_html_file, save_pkg_data)
+
+PAGE_HTML = "<html><body><div class='TT9eCd'>4.5star</div>" + "<p>Lorem ipsum ääö</p>" * 500 + "</body></html>"
+
+@pytest.fixture(autouse=True)
+def no_archive() -> None:
+    yield
+    configure_html_archive(None)
+    configure_output_sink(None)
+
+def test_put_and_get(tmp_path) -> None:
+    with HtmlArchive(str(tmp_path), compression="gzip") as archive:
+        assert archive.put("com.example.app", "US", PAGE_HTML)
+        assert archive.put("com.example.app", "FI", PAGE_HTML.encode("utf-8") + b"FI")
+        assert archive.get("com.example.app", "US") == PAGE_HTML.encode("utf-8")
+        assert archive.get("com.example.app", "FI") == PAGE_HTML.encode("utf-8") + b"FI"
+        assert archive.get("com.example.app", "SE") is None
+        assert archive.get("com.example.other", "US") is None
+        stats = archive.stats()
+    assert stats["pages"] == 2
+    assert stats["unique_pages"] == 2
+    assert stats["stored_size"] < stats["size"] / 10
+
+def test_identical_pages_are_stored_once(tmp_path) -> None:
+    with HtmlArchive(str(tmp_path), compression="gzip") as archive:
+        assert archive.put("com.example.app", "US", PAGE_HTML)
+        assert not archive.put("com.example.app", "FI", PAGE_HTML)
+        assert archive.get("com.example.app", "FI") == PAGE_HTML.encode("utf-8")
+        assert archive.stats()["unique_pages"] == 1
+        content_hash = hashlib.sha256(PAGE_HTML.encode("utf-8")).hexdigest()
+        assert list(archive.iter_pages()) == [("com.example.app", "FI", content_hash), ("com.example.app", "US", content_hash)]
+
+def test_replace_page(tmp_path) -> None:
+    with HtmlArchive(str(tmp_path), compression="gzip") as archive:
+        archive.put("com.example.app", "US", "<html>old</html>")
+        archive.put("com.example.app", "US", "<html>new</html>")
+        assert archive.get("com.example.app", "US") == b"<html>new</html>"
+        assert archive.stats()["pages"] == 1
+
+def test_reopen_archive(tmp_path) -> None:
+    with HtmlArchive(str(tmp_path), compression="gzip") as archive:
+        archive.put("com.example.app", "US", PAGE_HTML)
+    with HtmlArchive(str(tmp_path), compression="gzip") as archive:
+        assert archive.get("com.example.app", "US") == PAGE_HTML.encode("utf-8")
+        archive.put("com.example.other", "US", "<html>other</html>")
+    with HtmlArchive(str(tmp_path), compression="gzip") as archive:
+        assert archive.get("com.example.other", "US") == b"<html>other</html>"
+        assert archive.get("com.example.app", "US") == PAGE_HTML.encode("utf-8")
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith("segment_")) == ["segment_000000.bin"]
+
+def test_segments_roll_over(tmp_path) -> None:
+    with HtmlArchive(str(tmp_path), compression="gzip", segment_size=100) as archive:
+        pages = {f"com.example.app{i}": f"<html>{i} {os.urandom(64).hex()}</html>" for i in range(5)}
+        for package, page in pages.items():
+            archive.put(package, "US", page)
+        for package, page in pages.items():
+            assert archive.get(package, "US") == page.encode("utf-8")
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("segment_")]) == 5
+
+def test_concurrent_puts(tmp_path) -> None:
+    with HtmlArchive(str(tmp_path), compression="gzip", commit_every=7) as archive:
+        def put_pages(region: str) -> None:
+            for i in range(50):
+                archive.put(f"com.example.app{i}", region, f"<html>{i % 10}</html>")
+        threads = [threading.Thread(target=put_pages, args=(region,)) for region in ["US", "FI", "SE", "DE"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert archive.stats()["pages"] == 200
+        assert archive.stats()["unique_pages"] == 10
+        assert archive.get("com.example.app13", "SE") == b"<html>3</html>"
+
+def test_zstd_compression(tmp_path) -> None:
+    pytest.importorskip("zstandard")
+    with HtmlArchive(str(tmp_path), compression="zstd") as archive:
+        archive.put("com.example.app", "US", PAGE_HTML)
+        assert archive.get("com.example.app", "US") == PAGE_HTML.encode("utf-8")
+
+def test_unknown_compression(tmp_path) -> None:
+    with pytest.raises(ValueError):
+        HtmlArchive(str(tmp_path), compression="lz4")
+
+def test_save_and_read_cached_page(tmp_path) -> None:
+    output_prefix = f"{tmp_path}/"
+    os.makedirs(tmp_path / OUTPUT_HTML_FOLDER)
+    configure_html_archive(HtmlArchive(str(tmp_path / "archive")))
+    save_pkg_data("com.example.app", "US", "4.5", "100K+", "1M+", "Jan 01, 2025", PAGE_HTML, output_prefix)
+    assert os.listdir(tmp_path / OUTPUT_HTML_FOLDER) == []
+    assert (tmp_path / OUTPUT_FOUND_CSV_FILE).exists()
+    response = get_cached_html_file(output_prefix, "com.example.app", "US")
+    assert response.status_code == 200
+    assert response.text == PAGE_HTML
+    assert get_cached_html_file(output_prefix, "com.example.app", "FI") is None
@@ -0,0 +1,48 @@
+# These tests focus on the startup of play_store_fetcher
+# They import the module and run its command line in fresh interpreters, and check which modules got loaded
+#
+# The tests make sure that:
+# 1. Importing the module loads none of requests, bs4, lxml, dateutil, asyncio, concurrent.futures and email.utils
+# 2. The help of the command line and of the subcommands does not load them either
+# 3. Each parser backend only loads the parser it uses, and the HTTP session loads requests
+
+
+
+import json
+import os
+import subprocess
+import sys
+import pytest
+from benchmarks.corpus import generate_corpus
+from benchmarks.run_benchmarks import LAZY_MODULES
+
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#A page with every data point in the app data, so the json backend does not fall back to lxml
+PAGE = generate_corpus(1, page_size=2000)[0][1]
+
+def get_loaded_modules(script: str, argv: list[str] = ()) -> list[str]:
+    check_script = f"""
+import atexit, json, sys
+atexit.register(lambda: sys.__stderr__.write(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules])))
+sys.argv = ["play_store_fetcher.py", *{list(argv)!r}]
+{script}
+"""
+    completed = subprocess.run([sys.executable, "-c", check_script], cwd=REPOSITORY_FOLDER, capture_output=True, text=True)
+    return json.loads(completed.stderr.strip().splitlines()[-1])
+
+def test_import() -> None:
+    assert get_loaded_modules("import play_store_fetcher") == []
+
+@pytest.mark.parametrize("argv", [["--help"], ["reparse", "--help"], ["merge", "--help"], ["export", "--help"]])
+def test_help(argv) -> None:
+    assert get_loaded_modules("import runpy; runpy.run_module('play_store_fetcher', run_name='__main__')", argv) == []
+
+@pytest.mark.parametrize("parser_backend, expected_modules", [("json", []), ("lxml", ["lxml"]), ("bs4", ["bs4", "lxml"])])
+def test_parser_backend(parser_backend, expected_modules) -> None:
+    script = f"import play_store_fetcher; play_store_fetcher.get_app_info_from_html({PAGE!r}, {parser_backend!r})"
+    assert get_loaded_modules(script) == expected_modules
+
+def test_session() -> None:
+    loaded_modules = get_loaded_modules("import play_store_fetcher; play_store_fetcher.get_session()")
+    assert "requests" in loaded_modules and "urllib3" in loaded_modules
+    assert "bs4" not in loaded_modules and "lxml" not in loaded_modules and "asyncio" not in loaded_modules
@@ -0,0 +1,140 @@
+# These tests focus on the stage timers and counters of the fetch loop
+# They use mocks to simulate requests to the Google Play Store and write the outputs to a temporary folder
+#
+# The tests make sure that:
+# 1. Stage times, responses, retries, body bytes and done pairs are recorded by the fetch loop
+# 2. Done and skipped pairs are counted by the worker pool
+# 3. The progress line shows the throughput and the ETA
+# 4. The metrics file is written as JSON or in the Prometheus text format
+# 5. The number of pairs of a run is estimated from the package listing
+
+
+
+import gzip
+import json
+import time
+import pytest
+from unittest.mock import patch
+from play_store_fetcher import (CacheIndex, FetchMetrics, configure_metrics, configure_retries, estimate_pair_count,
+                                fetch_playstore_data_concurrently, fetch_playstore_data_sequentially, format_duration, init_checks, time_stage)
+from tests.helpers import make_response
+
+@pytest.fixture(autouse=True)
+def no_metrics() -> None:
+    yield
+    configure_metrics(None)
+    configure_retries()
+
+def test_format_duration() -> None:
+    assert format_duration(45) == "45s"
+    assert format_duration(750) == "12m 30s"
+    assert format_duration(3930) == "1h 05m"
+
+def test_time_stage() -> None:
+    with time_stage("parse"):
+        pass
+    metrics = FetchMetrics(progress_interval=0)
+    configure_metrics(metrics)
+    with time_stage("parse"):
+        pass
+    with time_stage("parse"):
+        pass
+    assert metrics.stage_calls["parse"] == 2
+    assert metrics.stage_seconds["parse"] >= 0
+
+def test_progress_line() -> None:
+    metrics = FetchMetrics(progress_interval=0, total_pairs=100)
+    for _ in range(10):
+        metrics.count_pair()
+    metrics.record_response(200, 0.3)
+    metrics.record_body(2_000_000, 0.1)
+    metrics.add_time("parse", 0.6)
+    progress_line = metrics.progress_line()
+    assert progress_line.startswith("Progress: 10/100 pairs (10.0%), ")
+    assert "pairs/s" in progress_line and "requests/s" in progress_line and "MB/s" in progress_line and ", ETA " in progress_line
+    assert progress_line.endswith("| network_ttfb 30%, network_body 10%, parse 60%")
+    assert "ETA" not in FetchMetrics(progress_interval=0).progress_line()
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.time.sleep")
+def test_fetch_loop_metrics(mock_sleep, mock_get_info, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    init_checks(str(input_csv), output_prefix)
+    responses = {"com.example.a": [make_response(502), make_response(200, "<html>a</html>")], "com.example.b": [make_response(404, "")]}
+    configure_retries(max_attempts=3, backoff_base=0, backoff_cap=0)
+    metrics = FetchMetrics(progress_interval=0)
+    configure_metrics(metrics)
+    with patch("play_store_fetcher.send_request", side_effect=lambda url, headers=None: responses[url.split("id=")[1].split("&")[0]].pop(0)):
+        fetch_playstore_data_sequentially(output_prefix, CacheIndex([("com.example.c", "US")]), ["com.example.a", "com.example.b", "com.example.c"], ["US"], False)
+    assert metrics.status_codes == {502: 1, 200: 1, 404: 1}
+    assert metrics.retries == 1
+    assert metrics.pairs_done == 3 and metrics.pairs_skipped == 1
+    assert metrics.body_bytes == len("mock") + len("<html>a</html>")
+    assert metrics.stage_calls["cache_lookup"] == 4
+    assert metrics.stage_calls["network_ttfb"] == metrics.stage_calls["network_body"] == 3
+    assert metrics.stage_calls["parse"] == 1
+    assert metrics.stage_calls["write"] >= 3
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request", return_value=make_response(200, "<html>a</html>"))
+def test_worker_pool_metrics(mock_request, mock_get_info, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    init_checks(str(input_csv), output_prefix)
+    metrics = FetchMetrics(progress_interval=0)
+    configure_metrics(metrics)
+    cached_packages = CacheIndex([("com.example.c", "US"), ("com.example.d", "US")])
+    fetch_playstore_data_concurrently(output_prefix, cached_packages, ["com.example.a", "com.example.b", "com.example.c", "com.example.d"], ["US"], False, 2)
+    assert mock_request.call_count == 2
+    assert metrics.pairs_done == 4 and metrics.pairs_skipped == 2
+
+def test_metrics_file_json(tmp_path) -> None:
+    metrics_path = tmp_path / "metrics.json"
+    metrics = FetchMetrics(progress_interval=0, metrics_file=str(metrics_path), total_pairs=4)
+    metrics.record_response(200, 0.1)
+    metrics.record_response(-1)
+    metrics.count_pair()
+    metrics.close()
+    written = json.loads(metrics_path.read_text(encoding="utf-8"))
+    assert written["status_codes"] == {"-1": 1, "200": 1}
+    assert written["requests"] == 2 and written["pairs_done"] == 1 and written["pairs_expected"] == 4
+    assert written["stages"]["network_ttfb"] == {"seconds": 0.1, "calls": 1}
+
+def test_metrics_file_prometheus(tmp_path) -> None:
+    metrics_path = tmp_path / "metrics.prom"
+    metrics = FetchMetrics(progress_interval=0, metrics_file=str(metrics_path))
+    metrics.record_response(429, 0.1)
+    metrics.count_retry()
+    metrics.record_body(1024, 0.2)
+    metrics.write()
+    lines = metrics_path.read_text(encoding="utf-8").splitlines()
+    assert 'playstore_fetcher_responses_total{status="429"} 1' in lines
+    assert "playstore_fetcher_retries_total 1" in lines
+    assert "playstore_fetcher_body_bytes_total 1024" in lines
+    assert 'playstore_fetcher_stage_seconds_total{stage="network_body"} 0.200000' in lines
+    assert "# TYPE playstore_fetcher_pairs_done_total counter" in lines
+    assert not any(line.startswith("playstore_fetcher_pairs_expected") for line in lines)
+
+def test_periodic_report(tmp_path, capsys) -> None:
+    metrics_path = tmp_path / "metrics.json"
+    metrics = FetchMetrics(progress_interval=0.01, metrics_file=str(metrics_path))
+    metrics.count_pair()
+    with patch.object(metrics, "write", wraps=metrics.write) as mock_write:
+        deadline = time.monotonic() + 5
+        while mock_write.call_count == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    metrics.close()
+    assert "Progress: 1 pairs" in capsys.readouterr().out
+    assert json.loads(metrics_path.read_text(encoding="utf-8"))["pairs_done"] == 1
+
+def test_estimate_pair_count(tmp_path) -> None:
+    listing = tmp_path / "packages.csv"
+    listing.write_text("com.example.a\n\ncom.example.b\ncom.example.c\ncom.example.d\n", encoding="utf-8")
+    assert estimate_pair_count(str(listing), ["US", "FI", "US"]) == 8
+    assert estimate_pair_count(str(listing), ["US", "FI"], (0, 4)) == 2
+    gzipped_listing = tmp_path / "packages.csv.gz"
+    gzipped_listing.write_bytes(gzip.compress(listing.read_bytes()))
+    assert estimate_pair_count(str(gzipped_listing), ["US"]) == 4
@@ -0,0 +1,121 @@
+# These tests focus on the local Play Store stand-in server and the base url override of the fetcher
+# They run the server on a free port of the loopback address with small pages
+#
+# The tests make sure that:
+# 1. Base urls are parsed and form_playstore_url requests the pages from the configured base url
+# 2. Latency distributions and bandwidths are parsed, and invalid ones are rejected
+# 3. The server answers with the page of the package, 404 for missing packages and 304 for an unchanged page
+# 4. Throttled and failed requests are answered with 429 and 5xx and a Retry-After header, also above the rate limit
+# 5. The bandwidth cap slows down the response bodies
+# 6. The fetcher fetched through the base url writes the data points of the served pages, retrying the throttled requests
+
+
+
+import csv
+import random
+import time
+import pytest
+import requests
+from benchmarks.mock_store import LatencyDistribution, MockPlayStore, parse_bandwidth
+from play_store_fetcher import (DEFAULT_BASE_URL, OUTPUT_FOUND_CSV_FILE, OUTPUT_MISSING_CSV_FILE, CacheIndex,
+                                configure_base_url, configure_rate_limiter, configure_retries, configure_session,
+                                fetch_playstore_data_sequentially, form_playstore_url, get_app_info_from_html,
+                                init_checks, parse_base_url)
+
+PACKAGES = [f"com.example.app{number}" for number in range(30)]
+
+@pytest.fixture(autouse=True)
+def default_base_url() -> None:
+    yield
+    configure_base_url()
+    configure_retries()
+
+def get(store: MockPlayStore, package: str, headers: dict = None) -> requests.Response:
+    return requests.get(f"{store.base_url}/store/apps/details?id={package}&gl=US", headers=headers, timeout=10)
+
+def test_parse_base_url() -> None:
+    assert parse_base_url("http://127.0.0.1:8080/") == "http://127.0.0.1:8080"
+    assert parse_base_url("https://example.com/mirror") == "https://example.com/mirror"
+    for invalid_url in ("127.0.0.1:8080", "ftp://example.com", "http://", "http://example.com/?id=1"):
+        with pytest.raises(ValueError):
+            parse_base_url(invalid_url)
+
+def test_form_playstore_url_base_url() -> None:
+    assert form_playstore_url("com.example.app", "en", "US") == f"{DEFAULT_BASE_URL}/store/apps/details?id=com.example.app&gl=US&hl=en"
+    configure_base_url("http://127.0.0.1:8080/")
+    assert form_playstore_url("com.example.app", "", "FI") == "http://127.0.0.1:8080/store/apps/details?id=com.example.app&gl=FI"
+
+def test_latency_distribution() -> None:
+    rng = random.Random(1)
+    assert LatencyDistribution().sample(rng) == 0
+    assert LatencyDistribution("0.25").sample(rng) == 0.25
+    assert 0.1 <= LatencyDistribution("uniform:0.1,0.2").sample(rng) <= 0.2
+    samples = sorted(LatencyDistribution("lognormal:0.2,0.5").sample(rng) for _ in range(1001))
+    assert 0.17 < samples[500] < 0.23
+    assert LatencyDistribution("exponential:0.1").sample(rng) >= 0
+    for invalid_latency in ("uniform:0.1", "gamma:1,2", "fixed:-1", "slow"):
+        with pytest.raises(ValueError):
+            LatencyDistribution(invalid_latency)
+
+def test_parse_bandwidth() -> None:
+    assert parse_bandwidth("500K") == 500_000
+    assert parse_bandwidth("2M") == 2_000_000
+    assert parse_bandwidth("0") == 0
+    with pytest.raises(ValueError):
+        parse_bandwidth("fast")
+
+def test_pages_and_missing_packages() -> None:
+    with MockPlayStore(pages=4, page_size=20_000, not_found_rate=0.3) as store:
+        missing = [package for package in PACKAGES if store.is_missing(package)]
+        assert 0 < len(missing) < len(PACKAGES)
+        assert get(store, missing[0]).status_code == 404
+        found = next(package for package in PACKAGES if not store.is_missing(package))
+        response = get(store, found)
+        assert response.status_code == 200
+        assert get_app_info_from_html(response.text) == store.get_expected(found)
+        assert get(store, found, {"If-None-Match": response.headers["ETag"]}).status_code == 304
+        assert requests.get(f"{store.base_url}/store/apps/details", timeout=10).status_code == 404
+    assert store.status_counts == {404: 2, 200: 1, 304: 1}
+
+def test_throttled_and_failed_requests() -> None:
+    with MockPlayStore(pages=1, page_size=1000, throttle_rate=1, retry_after=3) as store:
+        response = get(store, "com.example.app")
+        assert response.status_code == 429 and response.headers["Retry-After"] == "3"
+    with MockPlayStore(pages=1, page_size=1000, error_rate=1) as store:
+        status_codes = {get(store, "com.example.app").status_code for _ in range(30)}
+        assert status_codes == {500, 502, 503}
+
+def test_rate_limit() -> None:
+    with MockPlayStore(pages=1, page_size=1000, rate_limit=2) as store:
+        status_codes = [get(store, "com.example.app").status_code for _ in range(4)]
+        assert status_codes[:2] == [200, 200] and 429 in status_codes[2:]
+        response = next(response for response in (get(store, "com.example.app") for _ in range(4)) if response.status_code == 429)
+        assert response.headers["Retry-After"] == "1"
+
+def test_bandwidth() -> None:
+    with MockPlayStore(pages=1, page_size=60_000, bandwidth=300_000) as store:
+        request_start = time.perf_counter()
+        assert len(get(store, "com.example.app").content) >= 60_000
+        assert time.perf_counter() - request_start >= 0.15
+
+def test_fetch_through_base_url(tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    init_checks(str(input_csv), output_prefix)
+    with MockPlayStore(pages=4, page_size=20_000, not_found_rate=0.2, throttle_rate=0.2, error_rate=0.1, retry_after=0) as store:
+        configure_base_url(store.base_url)
+        configure_session()
+        configure_rate_limiter(None)
+        configure_retries(max_attempts=20, backoff_base=0, backoff_cap=0)
+        fetch_playstore_data_sequentially(output_prefix, CacheIndex(), PACKAGES, ["US"], False)
+    assert store.status_counts[429] > 0
+    with open(tmp_path / OUTPUT_FOUND_CSV_FILE, newline='', encoding="utf-8") as found_file:
+        found_rows = list(csv.reader(found_file, delimiter=";"))[1:]
+    with open(tmp_path / OUTPUT_MISSING_CSV_FILE, newline='', encoding="utf-8") as missing_file:
+        missing_packages = [row[0] for row in list(csv.reader(missing_file, delimiter=";"))[1:]]
+    #Retried pairs are written after the pairs fetched in the meantime
+    assert sorted(missing_packages) == sorted(package for package in PACKAGES if store.is_missing(package))
+    assert sorted(row[0] for row in found_rows) == sorted(package for package in PACKAGES if not store.is_missing(package))
+    for package, _, rating, reviews, downloads, last_updated in found_rows:
+        assert (rating, downloads, reviews, last_updated) == store.get_expected(package)
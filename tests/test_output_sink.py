@@ -0,0 +1,97 @@
+# These tests focus on the BufferedCsvSink buffering the rows of the output csv files
+# They use mocks to simulate requests to the Google Play Store and write the outputs to a temporary folder
+#
+# The tests make sure that:
+# 1. Rows are buffered until the row limit or the flush interval is reached, and written on close
+# 2. Data files are written before the cache file, and all files are fsynced at checkpoints
+# 3. append_to_csv writes to the configured sink, and a concurrent fetch writes every row through it
+# 4. The fetch state store writes the buffered rows before committing
+
+
+
+import os
+import time
+import pytest
+from unittest.mock import patch
+from play_store_fetcher import (CACHE_FILE, OUTPUT_FOUND_CSV_FILE, BufferedCsvSink, append_to_csv, configure_output_sink,
+                                fetch_playstore_data_concurrently, init_checks, open_fetch_state_store, read_cached_packages)
+
+@pytest.fixture(autouse=True)
+def no_sink() -> None:
+    yield
+    configure_output_sink(None)
+
+def read_lines(path) -> list[str]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        return file.read().splitlines()
+
+def test_flush_by_rows(tmp_path) -> None:
+    output_path = str(tmp_path / OUTPUT_FOUND_CSV_FILE)
+    sink = BufferedCsvSink(flush_rows=3, flush_interval=3600)
+    sink.write(output_path, ["com.example.app1", "US"])
+    sink.write(output_path, ["com.example.app2", "US"])
+    assert read_lines(output_path) == []
+    sink.write(output_path, ["com.example.app3", "US"])
+    assert read_lines(output_path) == ["com.example.app1;US", "com.example.app2;US", "com.example.app3;US"]
+    sink.write(output_path, ["com.example.app4", "US"])
+    sink.close()
+    assert read_lines(output_path)[-1] == "com.example.app4;US"
+
+def test_flush_by_interval(tmp_path) -> None:
+    output_path = str(tmp_path / OUTPUT_FOUND_CSV_FILE)
+    sink = BufferedCsvSink(flush_rows=1000, flush_interval=0.01)
+    sink.write(output_path, ["com.example.app", "US"])
+    deadline = time.monotonic() + 5
+    while not read_lines(output_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read_lines(output_path) == ["com.example.app;US"]
+    sink.close()
+
+def test_cache_file_is_written_last(tmp_path) -> None:
+    cache_path = str(tmp_path / CACHE_FILE)
+    found_path = str(tmp_path / OUTPUT_FOUND_CSV_FILE)
+    sink = BufferedCsvSink(flush_rows=1000, flush_interval=3600)
+    sink.write(cache_path, ["com.example.app", "US"])
+    sink.write(found_path, ["com.example.app", "US", "4.5"])
+    with patch("builtins.open", wraps=open) as mock_open, patch("play_store_fetcher.os.fsync") as mock_fsync:
+        sink.checkpoint()
+    assert [call.args[0] for call in mock_open.call_args_list] == [found_path, cache_path]
+    assert mock_fsync.call_count == 2
+    sink.close()
+
+def test_append_to_csv_uses_sink(tmp_path) -> None:
+    output_path = str(tmp_path / OUTPUT_FOUND_CSV_FILE)
+    configure_output_sink(BufferedCsvSink(flush_rows=1000, flush_interval=3600))
+    append_to_csv(output_path, ["com.example.app", "US"])
+    assert read_lines(output_path) == []
+    configure_output_sink(None)
+    assert read_lines(output_path) == ["com.example.app;US"]
+    append_to_csv(output_path, ["com.example.other", "US"])
+    assert read_lines(output_path) == ["com.example.app;US", "com.example.other;US"]
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request", return_value=type("Response", (object,), {"status_code": 200, "text": "mock", "headers": {}}))
+def test_fetch_concurrently_with_sink(mock_request, mock_get_info, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    init_checks(str(input_csv), output_prefix)
+    configure_output_sink(BufferedCsvSink(flush_rows=7, flush_interval=3600))
+    packages = [f"com.example.app{i}" for i in range(50)]
+    fetch_playstore_data_concurrently(output_prefix, read_cached_packages(output_prefix), packages, ["US", "FI"], False, 4)
+    configure_output_sink(None)
+    assert len(read_lines(tmp_path / CACHE_FILE)) == 100
+    assert len(read_lines(tmp_path / OUTPUT_FOUND_CSV_FILE)) == 101
+
+def test_store_commit_flushes_sink(tmp_path) -> None:
+    output_prefix = f"{tmp_path}/"
+    output_path = str(tmp_path / OUTPUT_FOUND_CSV_FILE)
+    configure_output_sink(BufferedCsvSink(flush_rows=1000, flush_interval=3600))
+    append_to_csv(output_path, ["com.example.app", "US"])
+    with open_fetch_state_store(output_prefix) as store:
+        store.record("com.example.app", "US", "found", 200)
+        assert read_lines(output_path) == []
+        store.commit()
+        assert read_lines(output_path) == ["com.example.app;US"]
@@ -0,0 +1,83 @@
+# These tests focus on the PackageListReader streaming the unique package names of the input file
+#
+# The tests make sure that:
+# 1. Process suffixes and blank lines are dropped, and the first line only if the file has a header
+# 2. Duplicate packages are dropped in memory in input order, and counted
+# 3. Duplicate packages are dropped with sorted chunks on disk in input order, also when the names span several chunks
+# 4. Gzip compressed input files are read
+# 5. Packages of a reader are fetched once in every unique region
+
+
+
+import gzip
+import pytest
+from play_store_fetcher import PackageListReader, iter_package_region_pairs, read_package_names
+
+LISTING = (
+    "Package Name;Category\n"
+    "com.example.b;games\n"
+    "\n"
+    "com.example.a:remote;tools\n"
+    "com.example.b:service;games\n"
+    "   \n"
+    "com.example.c;tools\n"
+    "com.example.a;tools\n"
+)
+
+@pytest.fixture
+def listing_file(tmp_path) -> str:
+    listing = tmp_path / "packages.csv"
+    listing.write_text(LISTING, encoding="utf-8")
+    return str(listing)
+
+def test_memory_dedup(listing_file: str) -> None:
+    reader = PackageListReader(listing_file, header=True)
+    assert list(reader) == ["com.example.b", "com.example.a", "com.example.c"]
+    assert (reader.lines, reader.packages, reader.duplicates) == (8, 3, 2)
+    #A second pass starts the counts over
+    assert list(reader) == ["com.example.b", "com.example.a", "com.example.c"]
+    assert reader.duplicates == 2
+
+def test_iter_names_keeps_duplicates(listing_file: str) -> None:
+    assert list(PackageListReader(listing_file, header=True).iter_names()) == [
+        "com.example.b", "com.example.a", "com.example.b", "com.example.c", "com.example.a"]
+
+def test_header_is_explicit(tmp_path) -> None:
+    listing = tmp_path / "packages.csv"
+    listing.write_text("package.name;category\ncom.example.app;tools\n", encoding="utf-8")
+    #A header that looks like a package name is still skipped
+    assert read_package_names(str(listing), header=True) == ["com.example.app"]
+    #Without a header, the first line is a package even if it does not look like one
+    listing.write_text("Not a package;x\ncom.example.app;tools\n", encoding="utf-8")
+    assert read_package_names(str(listing)) == ["Not a package", "com.example.app"]
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+def test_disk_dedup(listing_file: str, chunk_size: int) -> None:
+    reader = PackageListReader(listing_file, dedup="disk", chunk_size=chunk_size, header=True)
+    assert list(reader) == ["com.example.b", "com.example.a", "com.example.c"]
+    assert (reader.packages, reader.duplicates) == (3, 2)
+
+def test_disk_dedup_many_chunks(tmp_path) -> None:
+    listing = tmp_path / "packages.csv"
+    names = [f"com.example.app{i * 7919 % 997}" for i in range(5000)]
+    listing.write_text("\n".join(names), encoding="utf-8")
+    reader = PackageListReader(str(listing), dedup="disk", chunk_size=100)
+    assert list(reader) == list(dict.fromkeys(names))
+    assert list(reader) == list(PackageListReader(str(listing)))
+    assert reader.duplicates == 5000 - 997
+
+def test_gzip_input(tmp_path) -> None:
+    listing = tmp_path / "packages.csv"
+    with gzip.open(listing, "wt", encoding="utf-8") as file:
+        file.write(LISTING)
+    assert read_package_names(str(listing), header=True) == ["com.example.b", "com.example.a", "com.example.c"]
+
+def test_unknown_dedup(listing_file: str) -> None:
+    with pytest.raises(ValueError):
+        PackageListReader(listing_file, dedup="bloom")
+
+def test_pairs_of_reader(listing_file: str) -> None:
+    pairs = list(iter_package_region_pairs(PackageListReader(listing_file, header=True), ["US", "FI", "US"]))
+    assert pairs == [("com.example.b", "US"), ("com.example.b", "FI"), ("com.example.a", "US"), ("com.example.a", "FI"),
+                     ("com.example.c", "US"), ("com.example.c", "FI")]
+    assert list(iter_package_region_pairs(["com.example.a", "com.example.a"], ["US"])) == [("com.example.a", "US")]
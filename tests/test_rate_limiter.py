@@ -0,0 +1,73 @@
+# These tests focus on the AdaptiveRateLimiter class and the handling of throttle responses
+#
+# The tests make sure that:
+# 1. A bucket hands out tokens at its configured rate
+# 2. The rate is increased additively after successes and decreased multiplicatively after throttles
+# 3. The Retry-After header is parsed and pauses the bucket
+# 4. A throttled package/region pair is fetched again instead of being recorded as an error
+
+
+
+import time
+import pytest
+from email.utils import formatdate
+from unittest.mock import patch
+from play_store_fetcher import AdaptiveRateLimiter, configure_rate_limiter, fetch_playstore_data_from_regions, parse_retry_after
+from tests.helpers import make_response
+
+def test_reserve_respects_rate() -> None:
+    limiter = AdaptiveRateLimiter(rate=10, burst=1)
+    assert limiter.reserve("US") == 0
+    assert limiter.reserve("US") == pytest.approx(0.1, abs=0.02)
+    #Other regions have their own bucket
+    assert limiter.reserve("FI") == 0
+
+def test_global_scope_shares_bucket() -> None:
+    limiter = AdaptiveRateLimiter(rate=10, burst=1, scope="global")
+    assert limiter.reserve("US") == 0
+    assert limiter.reserve("FI") > 0
+
+def test_aimd() -> None:
+    limiter = AdaptiveRateLimiter(rate=4, max_rate=4.2, increase=0.1, decrease_factor=0.5)
+    limiter.on_success("US")
+    limiter.on_success("US")
+    limiter.on_success("US")
+    assert limiter.rates()["US"] == pytest.approx(4.2)
+    limiter.on_throttle("US", 0)
+    assert limiter.rates()["US"] == pytest.approx(2.1)
+
+def test_throttle_pauses_bucket() -> None:
+    limiter = AdaptiveRateLimiter(rate=100)
+    limiter.on_throttle("US", 30)
+    assert limiter.reserve("US") == pytest.approx(30, abs=0.5)
+    assert limiter.reserve("FI") == 0
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("120", 120),
+    ("not a date", None),
+])
+def test_parse_retry_after(header, expected) -> None:
+    assert parse_retry_after(header) == expected
+
+def test_parse_retry_after_http_date() -> None:
+    assert parse_retry_after(formatdate(time.time() + 60, usegmt=True)) == pytest.approx(60, abs=2)
+
+@patch("play_store_fetcher.append_to_csv")
+@patch("play_store_fetcher.add_package_to_cache")
+@patch("play_store_fetcher.save_pkg_data")
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request")
+def test_throttled_pair_is_requeued(mock_request, mock_get_info, mock_save, mock_cache, mock_append) -> None:
+    mock_request.side_effect = [make_response(429, headers={"Retry-After": "0"}), make_response(503), make_response(200)]
+    limiter = AdaptiveRateLimiter(rate=1000, max_rate=1000, min_rate=100)
+    configure_rate_limiter(limiter)
+    try:
+        fetch_playstore_data_from_regions("", {}, "com.example.app", ["US"], False)
+    finally:
+        configure_rate_limiter(None)
+    assert mock_request.call_count == 3
+    mock_save.assert_called_once()
+    mock_append.assert_not_called()
+    assert limiter.rates()["US"] < 1000
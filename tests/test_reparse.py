@@ -0,0 +1,153 @@
+# These tests focus on the reparse command reprocessing the cached html files
+#
+# The tests make sure that:
+# 1. Package and region are read from the cached file names, also for packages with underscores
+# 2. All cached files are parsed by the worker processes and written to a fresh found csv file in file name order
+# 3. Files that fail to parse are left out, and the previous found csv file is replaced
+# 4. Unchanged files are reused from the manifest, and changed files or a changed extractor are parsed again
+
+
+
+import os
+import csv
+import json
+import hashlib
+import pytest
+from unittest.mock import patch
+from play_store_fetcher import (iter_cached_html_files, reparse_cached_html, reparse_html_file, configure_parser_backend, configure_extraction_spec,
+                                get_extractor_version, DEFAULT_PARSER_BACKEND, OUTPUT_HTML_FOLDER, OUTPUT_FOUND_CSV_FILE, FOUND_CSV_HEADER, REPARSE_MANIFEST_FILE)
+
+PAGE_HTML = """<html><body>
+<div class="l8YSdd"><div class="w7Iutd">
+    <div class="wVqUob">
+        <div class="ClM7O"><div><div class="TT9eCd">4.5<i>star</i></div></div></div>
+        <div class="g1rdde">1.2M reviews</div>
+    </div>
+    <div class="wVqUob">
+        <div class="ClM7O">10M+</div>
+        <div class="g1rdde">Downloads</div>
+    </div>
+</div></div>
+<div class="xg1aie">Last Updated: Jan 1, 2025</div>
+</body></html>"""
+
+@pytest.fixture
+def output_prefix(tmp_path) -> str:
+    prefix = f"{tmp_path}/"
+    html_folder = tmp_path / OUTPUT_HTML_FOLDER
+    html_folder.mkdir()
+    (html_folder / "com.example.app_US.html").write_text(PAGE_HTML, encoding="utf-8")
+    (html_folder / "com.example.my_app_FI.html").write_text(PAGE_HTML, encoding="utf-8")
+    (html_folder / "com.example.empty_US.html").write_text("<html></html>", encoding="utf-8")
+    (html_folder / "notes.txt").write_text("not a cached page", encoding="utf-8")
+    return prefix
+
+@pytest.fixture(autouse=True)
+def default_extractor() -> None:
+    yield
+    configure_parser_backend(DEFAULT_PARSER_BACKEND)
+    configure_extraction_spec()
+
+def read_found_csv(output_prefix: str) -> list:
+    with open(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}", newline='', encoding='utf-8') as file:
+        return list(csv.reader(file, delimiter=";"))
+
+def test_iter_cached_html_files(output_prefix: str) -> None:
+    cached_files = list(iter_cached_html_files(output_prefix))
+    assert [(package, region) for package, region, _ in cached_files] == [
+        ("com.example.app", "US"),
+        ("com.example.empty", "US"),
+        ("com.example.my_app", "FI"),
+    ]
+    assert cached_files[0][2] == f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.app_US.html"
+
+def test_iter_cached_html_files_without_folder(tmp_path) -> None:
+    assert list(iter_cached_html_files(f"{tmp_path}/")) == []
+
+@pytest.mark.parametrize("parser_backend", ["lxml", "bs4"])
+def test_reparse_cached_html(output_prefix: str, parser_backend: str) -> None:
+    with open(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}", "w", encoding="utf-8") as file:
+        file.write("stale;data\n")
+    parsed_files = reparse_cached_html(output_prefix, processes=2, chunksize=1, parser_backend=parser_backend)
+    assert parsed_files == 3
+    assert read_found_csv(output_prefix) == [
+        FOUND_CSV_HEADER,
+        ["com.example.app", "US", "4.5", "1.2M", "10M+", "Jan 01, 2025"],
+        ["com.example.empty", "US", "Not Found", "Not Found", "Not Found", "Not Found"],
+        ["com.example.my_app", "FI", "4.5", "1.2M", "10M+", "Jan 01, 2025"],
+    ]
+
+def test_reparse_cached_html_skips_failed_files(output_prefix: str, capsys) -> None:
+    with open(f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.broken_US.html", "wb") as file:
+        file.write(b"\xff\xfe invalid utf-8")
+    #The bs4 backend decodes the page strictly, lxml would recover from the invalid bytes
+    parsed_files = reparse_cached_html(output_prefix, processes=1, parser_backend="bs4")
+    assert parsed_files == 3
+    assert "com.example.broken" not in [row[0] for row in read_found_csv(output_prefix)]
+    assert "com.example.broken_US.html" in capsys.readouterr().out
+
+def test_reparse_reuses_unchanged_files(output_prefix: str, capsys) -> None:
+    reparse_cached_html(output_prefix, processes=1)
+    first_rows = read_found_csv(output_prefix)
+    capsys.readouterr()
+    with patch("play_store_fetcher.multiprocessing.Pool") as mock_pool:
+        assert reparse_cached_html(output_prefix, processes=1) == 3
+    mock_pool.assert_not_called()
+    assert read_found_csv(output_prefix) == first_rows
+    assert "Reused 3 unchanged files, parsed 0 files" in capsys.readouterr().out
+
+def test_reparse_parses_changed_files(output_prefix: str, capsys) -> None:
+    reparse_cached_html(output_prefix, processes=1)
+    with open(f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.empty_US.html", "w", encoding="utf-8") as file:
+        file.write(PAGE_HTML)
+    capsys.readouterr()
+    reparse_cached_html(output_prefix, processes=1)
+    assert "Reused 2 unchanged files, parsed 1 files" in capsys.readouterr().out
+    assert read_found_csv(output_prefix)[2] == ["com.example.empty", "US", "4.5", "1.2M", "10M+", "Jan 01, 2025"]
+
+@pytest.mark.parametrize("rerun_kwargs", [{"parser_backend": "bs4"}, {"full": True}])
+def test_reparse_parses_all_files_after_extractor_change(output_prefix: str, rerun_kwargs: dict, capsys) -> None:
+    reparse_cached_html(output_prefix, processes=1)
+    capsys.readouterr()
+    reparse_cached_html(output_prefix, processes=1, **rerun_kwargs)
+    assert "Reused 0 unchanged files, parsed 3 files" in capsys.readouterr().out
+
+def test_reparse_parses_all_files_after_extraction_config_change(output_prefix: str, tmp_path, capsys) -> None:
+    reparse_cached_html(output_prefix, processes=1)
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"star_rating": {"filter": r"(\d+\.\d+)"}}), encoding="utf-8")
+    capsys.readouterr()
+    reparse_cached_html(output_prefix, processes=1, extraction_config=str(config_path))
+    assert "Reused 0 unchanged files, parsed 3 files" in capsys.readouterr().out
+
+def test_reparse_manifest(output_prefix: str) -> None:
+    with open(f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.broken_US.html", "wb") as file:
+        file.write(b"\xff\xfe invalid utf-8")
+    reparse_cached_html(output_prefix, processes=1, parser_backend="bs4")
+    with open(f"{output_prefix}{REPARSE_MANIFEST_FILE}", encoding="utf-8") as file:
+        manifest = json.load(file)
+    assert sorted(manifest) == ["com.example.app_US.html", "com.example.empty_US.html", "com.example.my_app_FI.html"]
+    html_path = f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.app_US.html"
+    assert manifest["com.example.app_US.html"] == {
+        "size": os.stat(html_path).st_size,
+        "mtime_ns": os.stat(html_path).st_mtime_ns,
+        "sha256": hashlib.sha256(PAGE_HTML.encode("utf-8")).hexdigest(),
+        "extractor_version": get_extractor_version(),
+        "row": ["com.example.app", "US", "4.5", "1.2M", "10M+", "Jan 01, 2025"],
+    }
+
+def test_reparse_html_file_reuses_row_of_same_content(output_prefix: str) -> None:
+    html_path = f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.app_US.html"
+    previous_entry = {"sha256": hashlib.sha256(PAGE_HTML.encode("utf-8")).hexdigest(), "row": ["previous", "row"]}
+    with patch("play_store_fetcher.get_app_info_from_html") as mock_parse:
+        row, error_msg, manifest_entry = reparse_html_file(("com.example.app", "US", html_path, previous_entry))
+    mock_parse.assert_not_called()
+    assert row == ["previous", "row"]
+    assert error_msg == ""
+    assert manifest_entry["row"] == ["previous", "row"]
+
+def test_reparse_html_file_parses_changed_content(output_prefix: str) -> None:
+    html_path = f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.app_US.html"
+    previous_entry = {"sha256": "0" * 64, "row": ["previous", "row"]}
+    row, _, _ = reparse_html_file(("com.example.app", "US", html_path, previous_entry))
+    assert row == ["com.example.app", "US", "4.5", "1.2M", "10M+", "Jan 01, 2025"]
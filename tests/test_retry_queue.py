@@ -0,0 +1,99 @@
+# These tests focus on retrying package/region pairs that failed with a transient error
+# They use mocks to simulate failing requests to the Google Play Store
+#
+# The tests make sure that:
+# 1. The retry queue returns pairs in the order they become ready
+# 2. The retry backoff grows exponentially and is capped
+# 3. Pairs failing with a transient error are retried and only recorded as errors after the last attempt
+# 4. Non transient errors are recorded without retrying
+# 5. Throttled requests do not count against the attempts, only against the separate throttle budget
+
+
+
+import time
+import pytest
+from unittest.mock import patch
+from requests.exceptions import ConnectionError
+from play_store_fetcher import (OUTPUT_ERROR_CSV_FILE, RetryQueue, configure_retries, fetch_playstore_data_concurrently,
+                                fetch_playstore_data_sequentially, get_retry_delay)
+from tests.helpers import make_response
+
+@pytest.fixture(autouse=True)
+def fast_retries() -> None:
+    configure_retries(max_attempts=3, backoff_base=0, backoff_cap=0)
+    yield
+    configure_retries()
+
+def test_retry_queue_order() -> None:
+    retry_queue = RetryQueue()
+    retry_queue.push("com.example.later", "US", 2, 60)
+    retry_queue.push("com.example.first", "US", 2, 0)
+    retry_queue.push("com.example.second", "FI", 3, 0, throttles=4)
+    assert retry_queue.pop_ready() == [("com.example.first", "US", 2, 0), ("com.example.second", "FI", 3, 4)]
+    assert len(retry_queue) == 1
+    assert retry_queue.next_ready_in() == pytest.approx(60, abs=1)
+
+def test_retry_delay_is_capped() -> None:
+    configure_retries(max_attempts=3, backoff_base=1, backoff_cap=5)
+    for attempt in range(1, 10):
+        assert 0 <= get_retry_delay(attempt) <= min(5, 2 ** (attempt - 1))
+
+@pytest.mark.parametrize("fetch_engine", [
+    lambda packages: fetch_playstore_data_sequentially("", {}, packages, ["US"], False),
+    lambda packages: fetch_playstore_data_concurrently("", {}, packages, ["US"], False, 4),
+])
+@patch("play_store_fetcher.append_to_csv")
+@patch("play_store_fetcher.add_package_to_cache")
+@patch("play_store_fetcher.save_pkg_data")
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request")
+def test_transient_errors_are_retried(mock_request, mock_get_info, mock_save, mock_cache, mock_append, fetch_engine) -> None:
+    responses = {
+        "com.example.flaky": [ConnectionError("reset"), make_response(502), make_response(200)],
+        "com.example.broken": [make_response(500)] * 3,
+        "com.example.forbidden": [make_response(403)],
+    }
+    def send(url: str, headers: dict = None) -> object:
+        package = url.split("id=")[1].split("&")[0]
+        response = responses[package].pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    mock_request.side_effect = send
+
+    fetch_engine(list(responses.keys()))
+
+    assert mock_request.call_count == 3 + 3 + 1
+    assert all(not remaining for remaining in responses.values())
+    mock_save.assert_called_once()
+    error_rows = [call.args[1] for call in mock_append.call_args_list if call.args[0].endswith(OUTPUT_ERROR_CSV_FILE)]
+    assert sorted(row[0] for row in error_rows) == ["com.example.broken", "com.example.forbidden"]
+
+@pytest.mark.parametrize("fetch_engine", [
+    lambda packages: fetch_playstore_data_sequentially("", {}, packages, ["US"], False),
+    lambda packages: fetch_playstore_data_concurrently("", {}, packages, ["US"], False, 4),
+])
+@patch("play_store_fetcher.append_to_csv")
+@patch("play_store_fetcher.add_package_to_cache")
+@patch("play_store_fetcher.save_pkg_data")
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request")
+def test_throttled_requests_have_own_budget(mock_request, mock_get_info, mock_save, mock_cache, mock_append, fetch_engine) -> None:
+    configure_retries(max_attempts=3, backoff_base=0, backoff_cap=0, max_throttled_attempts=6)
+    throttled = make_response(429, headers={"Retry-After": "0"})
+    responses = {
+        #More throttled requests than attempts, and a failure between them
+        "com.example.busy": [throttled] * 4 + [make_response(502)] + [throttled] + [make_response(200)],
+        "com.example.blocked": [throttled] * 6,
+    }
+    def send(url: str, headers: dict = None) -> object:
+        package = url.split("id=")[1].split("&")[0]
+        return responses[package].pop(0)
+    mock_request.side_effect = send
+
+    fetch_engine(list(responses.keys()))
+
+    assert all(not remaining for remaining in responses.values())
+    mock_save.assert_called_once()
+    error_rows = [call.args[1] for call in mock_append.call_args_list if call.args[0].endswith(OUTPUT_ERROR_CSV_FILE)]
+    assert [(row[0], row[2]) for row in error_rows] == [("com.example.blocked", 429)]
@@ -0,0 +1,175 @@
+# These tests focus on revalidating cached pages with conditional requests in refresh runs
+# They start a small local HTTP server that answers conditional requests and write the outputs to a temporary folder
+#
+# The tests make sure that:
+# 1. The lifetime of a page is parsed from the Cache-Control and Expires header fields
+# 2. The ETag and Last-Modified of a page are read from its response and sent back in conditional requests
+# 3. A refresh run sends the stored validators, and a 304 response reuses and re-extracts the cached html
+# 4. Pages that are still fresh are skipped without a request or a new found row, and cached pairs are skipped outside refresh runs
+# 5. The validators are kept in the validators csv file or in the fetch state store, also in stores created without them
+
+
+
+import csv
+import sqlite3
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from play_store_fetcher import (CACHE_FILE, OUTPUT_FOUND_CSV_FILE, OUTPUT_HTML_FOLDER, OUTPUT_VALIDATORS_CSV_FILE, STATE_STORE_FILE, FetchStateStore,
+                                configure_revalidation, configure_session, fetch_playstore_data_sequentially, get_conditional_headers, init_checks,
+                                open_fetch_state_store, parse_cache_lifetime, parse_page_validators, read_cached_packages, read_page_validators)
+
+class MockPlayStoreHandler(BaseHTTPRequestHandler):
+    requests = []
+    cache_control = None
+
+    def do_GET(self) -> None:
+        MockPlayStoreHandler.requests.append((self.path, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")))
+        etag = f'"{self.path.split("id=")[1].split("&")[0]}-v1"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = f"<html>{self.path}</html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Wed, 01 Jan 2025 00:00:00 GMT")
+        if self.cache_control:
+            self.send_header("Cache-Control", self.cache_control)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+@pytest.fixture
+def mock_server() -> str:
+    MockPlayStoreHandler.requests = []
+    MockPlayStoreHandler.cache_control = None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockPlayStoreHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    configure_session()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    with patch("play_store_fetcher.form_playstore_url", side_effect=lambda pkg, language, region: f"{url}/?id={pkg}&gl={region}"):
+        yield url
+    server.shutdown()
+    server.server_close()
+    configure_revalidation(False)
+
+@pytest.fixture
+def output_prefix(tmp_path) -> str:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    init_checks(str(input_csv), f"{tmp_path}/")
+    return f"{tmp_path}/"
+
+def read_found_rows(output_prefix: str) -> list[list[str]]:
+    with open(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}", newline='', encoding='utf-8') as file:
+        return list(csv.reader(file, delimiter=";"))[1:]
+
+def fetch_run(output_prefix: str, refresh: bool, state_store: str = "csv") -> None:
+    cached_packages = open_fetch_state_store(output_prefix) if state_store == "sqlite" else read_cached_packages(output_prefix)
+    configure_revalidation(refresh, read_page_validators(output_prefix) if refresh and state_store == "csv" else None)
+    try:
+        fetch_playstore_data_sequentially(output_prefix, cached_packages, ["com.example.app", "com.example.other"], ["US"], False)
+    finally:
+        configure_revalidation(False)
+        if state_store == "sqlite":
+            cached_packages.close()
+
+def test_parse_cache_lifetime() -> None:
+    assert parse_cache_lifetime({"Cache-Control": "private, max-age=600"}) == 600
+    assert parse_cache_lifetime({"Cache-Control": "no-cache, max-age=600"}) is None
+    assert parse_cache_lifetime({"Cache-Control": "no-store"}) is None
+    assert parse_cache_lifetime({"Expires": "Wed, 01 Jan 2020 00:00:00 GMT"}) == 0
+    assert 3500 < parse_cache_lifetime({"Expires": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 3600))}) <= 3600
+    assert parse_cache_lifetime({}) is None
+
+def test_parse_page_validators() -> None:
+    assert parse_page_validators({}) is None
+    assert parse_page_validators({"ETag": '"v1"'}) == ('"v1"', "", None)
+    etag, last_modified, fresh_until = parse_page_validators({"Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT", "Cache-Control": "max-age=60"}, ('"v1"', "", None))
+    assert (etag, last_modified) == ('"v1"', "Wed, 01 Jan 2025 00:00:00 GMT")
+    assert time.time() < fresh_until <= time.time() + 60
+
+def test_get_conditional_headers() -> None:
+    assert get_conditional_headers(None) == {}
+    assert get_conditional_headers(('"v1"', "", None)) == {"If-None-Match": '"v1"'}
+    assert get_conditional_headers(('"v1"', "Wed, 01 Jan 2025 00:00:00 GMT", None)) == {
+        "If-None-Match": '"v1"', "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT"}
+
+@pytest.mark.parametrize("state_store", ["csv", "sqlite"])
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+def test_refresh_revalidates_cached_pages(mock_get_info, mock_server, output_prefix: str, state_store: str) -> None:
+    fetch_run(output_prefix, False, state_store)
+    assert [request[1:] for request in MockPlayStoreHandler.requests] == [(None, None), (None, None)]
+    if state_store == "csv":
+        assert read_page_validators(output_prefix)[("com.example.app", "US")] == ('"com.example.app-v1"', "Wed, 01 Jan 2025 00:00:00 GMT", None)
+
+    MockPlayStoreHandler.requests = []
+    fetch_run(output_prefix, False, state_store)
+    assert MockPlayStoreHandler.requests == []
+
+    fetch_run(output_prefix, True, state_store)
+    assert [request[1:] for request in MockPlayStoreHandler.requests] == [
+        ('"com.example.app-v1"', "Wed, 01 Jan 2025 00:00:00 GMT"),
+        ('"com.example.other-v1"', "Wed, 01 Jan 2025 00:00:00 GMT"),
+    ]
+    #The cached html is extracted again
+    assert len(read_found_rows(output_prefix)) == 4
+    assert mock_get_info.call_args.args[0] == "<html>/?id=com.example.other&gl=US</html>"
+    with open(f"{output_prefix}{OUTPUT_HTML_FOLDER}/com.example.app_US.html", encoding="utf-8") as file:
+        assert file.read() == "<html>/?id=com.example.app&gl=US</html>"
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+def test_refresh_reuses_fresh_pages(mock_get_info, mock_server, output_prefix: str) -> None:
+    MockPlayStoreHandler.cache_control = "max-age=3600"
+    fetch_run(output_prefix, False)
+    MockPlayStoreHandler.requests = []
+    fetch_run(output_prefix, True)
+    fetch_run(output_prefix, True)
+    assert MockPlayStoreHandler.requests == []
+    #Fresh pages are not extracted again, only their fetch time is recorded
+    assert [row[0] for row in read_found_rows(output_prefix)] == ["com.example.app", "com.example.other"]
+    with open(f"{output_prefix}{CACHE_FILE}", newline='', encoding='utf-8') as file:
+        assert len(list(csv.reader(file, delimiter=";"))) == 6
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+def test_refresh_downloads_pages_without_cached_html(mock_get_info, mock_server, output_prefix: str, tmp_path) -> None:
+    fetch_run(output_prefix, False)
+    (tmp_path / OUTPUT_HTML_FOLDER / "com.example.app_US.html").unlink()
+    MockPlayStoreHandler.requests = []
+    fetch_run(output_prefix, True)
+    assert [request[1] for request in MockPlayStoreHandler.requests] == [None, '"com.example.other-v1"']
+    assert (tmp_path / OUTPUT_HTML_FOLDER / "com.example.app_US.html").exists()
+
+def test_store_validators(tmp_path) -> None:
+    with FetchStateStore(str(tmp_path / STATE_STORE_FILE)) as store:
+        store.record("com.example.app", "US", "found", 200)
+        assert store.get_validators("com.example.app", "US") is None
+        store.record_validators("com.example.app", "US", '"v1"', "", 1234.5)
+        assert store.get_validators("com.example.app", "US") == ('"v1"', "", 1234.5)
+        assert store.get_validators("com.example.other", "US") is None
+
+def test_store_without_validator_columns(tmp_path) -> None:
+    connection = sqlite3.connect(tmp_path / STATE_STORE_FILE)
+    connection.execute(
+        "CREATE TABLE fetch_state (package TEXT NOT NULL, region TEXT NOT NULL, status TEXT NOT NULL, http_status INTEGER, "
+        "first_fetched REAL, last_fetched REAL, attempts INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (package, region)) WITHOUT ROWID")
+    connection.execute("INSERT INTO fetch_state (package, region, status) VALUES ('com.example.app', 'US', 'found')")
+    connection.commit()
+    connection.close()
+    with FetchStateStore(str(tmp_path / STATE_STORE_FILE)) as store:
+        assert store.is_fetched("com.example.app", "US")
+        store.record_validators("com.example.app", "US", "", "Wed, 01 Jan 2025 00:00:00 GMT", None)
+        assert store.get_validators("com.example.app", "US") == ("", "Wed, 01 Jan 2025 00:00:00 GMT", None)
+
+def test_read_page_validators(tmp_path) -> None:
+    (tmp_path / OUTPUT_VALIDATORS_CSV_FILE).write_text('com.example.app;US;"""v1""";;\ncom.example.app;US;"""v2""";;99.5\n', encoding="utf-8")
+    assert read_page_validators(f"{tmp_path}/") == {("com.example.app", "US"): ('"v2"', "", 99.5)}
+    assert read_page_validators(f"{tmp_path}/missing_") == {}
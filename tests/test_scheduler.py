@@ -0,0 +1,94 @@
+# These tests focus on the FetchScheduler building the work set of package/region pairs and dispatching it
+# They use mocks to simulate requests to the Google Play Store and write the outputs to a temporary folder
+#
+# The tests make sure that:
+# 1. Cached pairs are dropped before dispatching, unless they need a refresh or the cached html is reused
+# 2. The regions are interleaved, so consecutive pairs are not the same package
+# 3. The pairs are ordered by input order, staleness, download count or a custom priority
+# 4. The fetch backends take their pairs from the configured scheduler
+
+
+
+import pytest
+from unittest.mock import patch
+from play_store_fetcher import (OUTPUT_FOUND_CSV_FILE, CacheIndex, FetchScheduler, configure_revalidation, configure_scheduler,
+                                fetch_playstore_data_sequentially, init_checks, read_download_counts)
+from tests.helpers import make_response
+
+PACKAGES = ["com.example.a", "com.example.b", "com.example.c"]
+
+@pytest.fixture(autouse=True)
+def no_scheduler() -> None:
+    yield
+    configure_scheduler(None)
+    configure_revalidation(False)
+
+def test_regions_are_interleaved() -> None:
+    scheduler = FetchScheduler()
+    assert scheduler.build(PACKAGES, ["US", "FI", "JP"], CacheIndex(), False) == 9
+    pairs = list(scheduler)
+    assert pairs == [
+        ("com.example.a", "US"),
+        ("com.example.b", "US"), ("com.example.a", "FI"),
+        ("com.example.c", "US"), ("com.example.b", "FI"), ("com.example.a", "JP"),
+        ("com.example.c", "FI"), ("com.example.b", "JP"),
+        ("com.example.c", "JP"),
+    ]
+    assert all(first[0] != second[0] for first, second in zip(pairs, pairs[1:]))
+
+def test_cached_pairs_are_dropped() -> None:
+    cache = CacheIndex([("com.example.a", "US"), ("com.example.b", "FI")])
+    scheduler = FetchScheduler()
+    assert scheduler.build(PACKAGES + ["com.example.a"], ["US", "FI"], cache, False) == 4
+    assert scheduler.skipped == 2
+    assert sorted(scheduler) == [("com.example.a", "FI"), ("com.example.b", "US"), ("com.example.c", "FI"), ("com.example.c", "US")]
+    assert scheduler.build(PACKAGES, ["US", "FI"], cache, True) == 6
+
+def test_staleness_priority() -> None:
+    cache = CacheIndex()
+    cache.add("com.example.a", "US")
+    cache.add("com.example.c", "US", stale=True)
+    scheduler = FetchScheduler("staleness")
+    scheduler.build(PACKAGES, ["US"], cache, False)
+    assert list(scheduler) == [("com.example.c", "US"), ("com.example.b", "US")]
+
+def test_refresh_run_keeps_cached_pairs() -> None:
+    configure_revalidation(True)
+    scheduler = FetchScheduler("staleness")
+    assert scheduler.build(PACKAGES, ["US"], CacheIndex([("com.example.b", "US")]), False) == 3
+    assert list(scheduler)[0] == ("com.example.b", "US")
+
+def test_downloads_priority(tmp_path) -> None:
+    found_csv = tmp_path / OUTPUT_FOUND_CSV_FILE
+    found_csv.write_text(
+        "Package Name;Data Region;Rating;Reviews;Downloads;Last Updated\n"
+        "com.example.b;US;4.5;2.1M;500M+;Jan 01, 2025\n"
+        "com.example.c;US;4.5;10;1K+;Jan 01, 2025\n"
+        "com.example.c;FI;4.5;2.1M;1B+;Jan 01, 2025\n"
+        "com.example.a;US;4.5;10;Not Found;Jan 01, 2025\n", encoding="utf-8")
+    assert read_download_counts(str(found_csv)) == {"com.example.b": 5 * 10 ** 8, "com.example.c": 10 ** 9}
+    scheduler = FetchScheduler("downloads", str(found_csv))
+    scheduler.build(PACKAGES, ["US"], CacheIndex(), False)
+    assert list(scheduler) == [("com.example.c", "US"), ("com.example.b", "US"), ("com.example.a", "US")]
+
+def test_custom_priority() -> None:
+    scheduler = FetchScheduler(lambda package, region: package != "com.example.c")
+    scheduler.build(PACKAGES, ["US", "FI"], CacheIndex(), False)
+    assert list(scheduler) == [("com.example.c", "US"), ("com.example.a", "US"), ("com.example.c", "FI"),
+                               ("com.example.b", "US"), ("com.example.a", "FI"), ("com.example.b", "FI")]
+
+def test_unknown_priority() -> None:
+    with pytest.raises(ValueError):
+        FetchScheduler("popularity")
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request", return_value=make_response(200))
+def test_fetch_from_scheduler(mock_request, mock_get_info, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    init_checks(str(input_csv), f"{tmp_path}/")
+    configure_scheduler(FetchScheduler())
+    fetch_playstore_data_sequentially(f"{tmp_path}/", CacheIndex([("com.example.a", "US")]), PACKAGES, ["US", "FI"], False)
+    requested = [call.args[0].split("id=")[1] for call in mock_request.call_args_list]
+    assert requested == ["com.example.b&gl=US&hl=en", "com.example.c&gl=US&hl=en", "com.example.a&gl=FI&hl=en",
+                         "com.example.b&gl=FI&hl=en", "com.example.c&gl=FI&hl=en"]
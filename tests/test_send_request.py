@@ -7,17 +7,22 @@
 #
 # The tests use mock responses to simulate different status codes and ensure the function behaves as expected
 # without actually making network requests.
+#
+# The tests also make sure that requests are sent through the shared session with the configured timeouts
+# and that connections to the same host are reused.
 
 
 
+import threading
 import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
-from play_store_fetcher import send_request
+from play_store_fetcher import configure_session, get_session_pool_stats, send_request
 
 # simulate a successful response
 @pytest.fixture
 def mock_successful_request() -> MagicMock:
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         mock_get.return_value.status_code = 200
         mock_get.return_value.text = "<html></html>"
         yield mock_get
@@ -25,7 +30,7 @@ def mock_successful_request() -> MagicMock:
 # simulate a 404 error response
 @pytest.fixture
 def mock_404_request() -> MagicMock:
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         mock_get.return_value.status_code = 404
         yield mock_get
 
@@ -38,3 +43,35 @@ def test_send_request_404(mock_404_request) -> None:
     url = "https://play.google.com/store/apps/details?id=com.example.notapp"
     response = send_request(url)
     assert response.status_code == 404
+
+def test_send_request_uses_configured_timeout(mock_successful_request) -> None:
+    configure_session(pool_size=4, connect_timeout=1.5, read_timeout=7)
+    send_request("https://play.google.com/store/apps/details?id=com.example.app")
+    mock_successful_request.assert_called_once_with("https://play.google.com/store/apps/details?id=com.example.app", headers=None, timeout=(1.5, 7))
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        body = b"<html></html>"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+def test_send_request_reuses_connections() -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        configure_session(pool_size=2)
+        url = f"http://127.0.0.1:{server.server_address[1]}/store/apps/details?id=com.example.app"
+        for _ in range(5):
+            assert send_request(url).status_code == 200
+        host_stats = get_session_pool_stats()[f"http://127.0.0.1:{server.server_address[1]}"]
+        assert host_stats == {"requests": 5, "connections": 1, "reused": 4}
+    finally:
+        server.shutdown()
+        server.server_close()
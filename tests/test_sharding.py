@@ -0,0 +1,169 @@
+# These tests focus on splitting the package/region pairs into shards and merging the outputs of the shards
+# They use mocks to simulate requests to the Google Play Store and write the outputs to a temporary folder
+#
+# The tests make sure that:
+# 1. Shards are parsed from i/N and invalid shards are rejected
+# 2. Every pair belongs to exactly one shard, the same one in every process
+# 3. A sharded run only fetches the pairs of its shard and writes its outputs to the shard folder
+# 4. Merging the shards gives one dataset with a single row per pair, the latest one, also when merged again
+# 5. The output row merger keeps the latest row of each pair on disk and removes its database when closed
+
+
+
+import csv
+import sqlite3
+import subprocess
+import sys
+import pytest
+from unittest.mock import patch
+from play_store_fetcher import (CACHE_FILE, OUTPUT_ERROR_CSV_FILE, OUTPUT_FOUND_CSV_FILE, OUTPUT_HTML_FOLDER, OUTPUT_MISSING_CSV_FILE,
+                                STATE_STORE_FILE, CacheIndex, FetchStateStore, OutputRowMerger, configure_shard, fetch_playstore_data_sequentially,
+                                find_shard_prefixes, get_pair_shard, get_shard_prefix, init_checks, iter_package_region_pairs,
+                                merge_shards, parse_shard)
+from tests.helpers import make_response
+
+PACKAGES = [f"com.example.app{number}" for number in range(20)]
+REGIONS = ["US", "FI", "JP"]
+
+@pytest.fixture(autouse=True)
+def no_shard() -> None:
+    yield
+    configure_shard(None)
+
+def read_rows(csv_path) -> list[list[str]]:
+    with open(csv_path, newline='', encoding='utf-8') as csv_file:
+        return list(csv.reader(csv_file, delimiter=";"))
+
+def test_parse_shard() -> None:
+    assert parse_shard("0/4") == (0, 4)
+    assert parse_shard("3/4") == (3, 4)
+    for value in ("4/4", "-1/4", "0/0", "1", "a/4"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+def test_shards_partition_the_pairs() -> None:
+    all_pairs = list(iter_package_region_pairs(PACKAGES, REGIONS))
+    shard_pairs = []
+    for index in range(4):
+        configure_shard((index, 4))
+        shard_pairs.append(list(iter_package_region_pairs(PACKAGES, REGIONS)))
+    assert sorted(pair for pairs in shard_pairs for pair in pairs) == sorted(all_pairs)
+    assert all(pairs for pairs in shard_pairs)
+    assert all(get_pair_shard(package, region, 4) == index for index, pairs in enumerate(shard_pairs) for package, region in pairs)
+
+def test_shard_is_same_in_every_process() -> None:
+    #Python's hash of a string changes between processes, the shard must not
+    script = "from play_store_fetcher import get_pair_shard; print(get_pair_shard('com.example.app', 'FI', 7))"
+    shards = {subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout for _ in range(2)}
+    assert shards == {f"{get_pair_shard('com.example.app', 'FI', 7)}\n"}
+
+def test_shard_prefixes(tmp_path) -> None:
+    for shard in ((1, 2), (0, 2), (10, 12)):
+        (tmp_path / get_shard_prefix("FIN_", shard)).mkdir()
+    (tmp_path / "FIN_shard_x_of_2").mkdir()
+    assert get_shard_prefix(f"{tmp_path}/FIN_", (1, 2)) == f"{tmp_path}/FIN_shard_1_of_2/"
+    assert find_shard_prefixes(f"{tmp_path}/FIN_") == [f"{tmp_path}/FIN_shard_0_of_2/", f"{tmp_path}/FIN_shard_1_of_2/", f"{tmp_path}/FIN_shard_10_of_12/"]
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request", return_value=make_response(200))
+def test_sharded_runs_merge(mock_request, mock_get_info, tmp_path) -> None:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    output_prefix = f"{tmp_path}/"
+    for index in range(3):
+        shard_prefix = get_shard_prefix(output_prefix, (index, 3))
+        init_checks(str(input_csv), shard_prefix)
+        configure_shard((index, 3))
+        fetch_playstore_data_sequentially(shard_prefix, CacheIndex(), PACKAGES, REGIONS, False)
+    configure_shard(None)
+    assert mock_request.call_count == len(PACKAGES) * len(REGIONS)
+    assert all(len(read_rows(f"{get_shard_prefix(output_prefix, (index, 3))}{OUTPUT_FOUND_CSV_FILE}")) > 1 for index in range(3))
+
+    merge_counts = merge_shards(output_prefix)
+    assert merge_counts["shards"] == 3
+    assert merge_counts["found"] == merge_counts["cached"] == merge_counts["html_files"] == len(PACKAGES) * len(REGIONS)
+    found_rows = read_rows(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}")
+    assert found_rows[0][0] == "Package Name"
+    assert sorted((row[0], row[1]) for row in found_rows[1:]) == sorted(iter_package_region_pairs(PACKAGES, REGIONS))
+    assert (tmp_path / OUTPUT_HTML_FOLDER / "com.example.app0_FI.html").read_text(encoding="utf-8") == "mock"
+    #Merging again keeps a single row per pair
+    assert merge_shards(output_prefix)["found"] == len(PACKAGES) * len(REGIONS)
+    assert len(read_rows(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}")) == len(found_rows)
+
+def test_merge_keeps_latest_row(tmp_path) -> None:
+    output_prefix = f"{tmp_path}/"
+    (tmp_path / "shard_0_of_2").mkdir()
+    (tmp_path / "shard_1_of_2").mkdir()
+    (tmp_path / OUTPUT_FOUND_CSV_FILE).write_text(
+        "Package Name;Data Region;Rating;Reviews;Downloads;Last Updated\n"
+        "com.example.a;US;4.0;10;1K+;Jan 01, 2024\n", encoding="utf-8")
+    (tmp_path / "shard_0_of_2" / OUTPUT_FOUND_CSV_FILE).write_text(
+        "Package Name;Data Region;Rating;Reviews;Downloads;Last Updated\n"
+        "com.example.a;US;4.5;20;1K+;Jan 01, 2025\n"
+        "com.example.a;US;4.6;30;1K+;Feb 01, 2025\n", encoding="utf-8")
+    (tmp_path / "shard_0_of_2" / OUTPUT_MISSING_CSV_FILE).write_text(
+        "Package Name;Data Region;Http Status;Url\ncom.example.b;US;404;url\n", encoding="utf-8")
+    #Older errors of the merged output and errors written before the other rows of the same folder are replaced
+    (tmp_path / OUTPUT_ERROR_CSV_FILE).write_text(
+        "Package Name;Data Region;Http Status;Url;Exception Message\ncom.example.b;US;-1;url;timeout\n", encoding="utf-8")
+    (tmp_path / "shard_0_of_2" / OUTPUT_ERROR_CSV_FILE).write_text(
+        "Package Name;Data Region;Http Status;Url;Exception Message\ncom.example.a;US;-1;url;timeout\n", encoding="utf-8")
+    (tmp_path / "shard_1_of_2" / OUTPUT_ERROR_CSV_FILE).write_text(
+        "Package Name;Data Region;Http Status;Url;Exception Message\ncom.example.c;US;-1;url;timeout\n", encoding="utf-8")
+    (tmp_path / "shard_0_of_2" / CACHE_FILE).write_text("com.example.a;US;100\ncom.example.b;US;100\ncom.example.a;US;200\n", encoding="utf-8")
+
+    merge_counts = merge_shards(output_prefix)
+    assert merge_counts == {"shards": 2, "found": 1, "missing": 1, "errors": 1, "cached": 2, "html_files": 0, "states": 0}
+    assert read_rows(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}")[1:] == [["com.example.a", "US", "4.6", "30", "1K+", "Feb 01, 2025"]]
+    assert read_rows(f"{output_prefix}{OUTPUT_MISSING_CSV_FILE}")[1:] == [["com.example.b", "US", "404", "url"]]
+    assert read_rows(f"{output_prefix}{OUTPUT_ERROR_CSV_FILE}")[1:] == [["com.example.c", "US", "-1", "url", "timeout"]]
+    assert read_rows(f"{output_prefix}{CACHE_FILE}") == [["com.example.b", "US", "100"], ["com.example.a", "US", "200"]]
+
+def test_merge_newer_missing_replaces_found(tmp_path) -> None:
+    output_prefix = f"{tmp_path}/"
+    (tmp_path / "shard_0_of_2").mkdir()
+    (tmp_path / OUTPUT_FOUND_CSV_FILE).write_text(
+        "Package Name;Data Region;Rating;Reviews;Downloads;Last Updated\n"
+        "com.example.a;US;4.0;10;1K+;Jan 01, 2024\ncom.example.b;US;4.0;10;1K+;Jan 01, 2024\n", encoding="utf-8")
+    (tmp_path / "shard_0_of_2" / OUTPUT_MISSING_CSV_FILE).write_text(
+        "Package Name;Data Region;Http Status;Url\ncom.example.a;US;404;url\n", encoding="utf-8")
+
+    merge_counts = merge_shards(output_prefix)
+    assert (merge_counts["found"], merge_counts["missing"]) == (1, 1)
+    assert [row[0] for row in read_rows(f"{output_prefix}{OUTPUT_FOUND_CSV_FILE}")[1:]] == ["com.example.b"]
+    assert read_rows(f"{output_prefix}{OUTPUT_MISSING_CSV_FILE}")[1:] == [["com.example.a", "US", "404", "url"]]
+    #Merging again keeps the missing row
+    assert merge_shards(output_prefix)["missing"] == 1
+
+def test_merge_state_stores(tmp_path) -> None:
+    output_prefix = f"{tmp_path}/"
+    for index in range(2):
+        (tmp_path / f"shard_{index}_of_2").mkdir()
+        with FetchStateStore(f"{get_shard_prefix(output_prefix, (index, 2))}{STATE_STORE_FILE}") as store:
+            store.record(f"com.example.app{index}", "US", "found", 200)
+            store.record_validators(f"com.example.app{index}", "US", '"etag"', None, None)
+            store.commit()
+    #A store created before the validators were kept
+    (tmp_path / "shard_0_of_3").mkdir()
+    with sqlite3.connect(tmp_path / "shard_0_of_3" / STATE_STORE_FILE) as connection:
+        connection.execute("CREATE TABLE fetch_state (package TEXT NOT NULL, region TEXT NOT NULL, status TEXT NOT NULL, http_status INTEGER, "
+                           "first_fetched REAL, last_fetched REAL, attempts INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (package, region)) WITHOUT ROWID")
+        connection.execute("INSERT INTO fetch_state VALUES ('com.example.app9', 'FI', 'missing', 404, 1, 1, 1)")
+    assert merge_shards(output_prefix)["states"] == 3
+    with FetchStateStore(f"{output_prefix}{STATE_STORE_FILE}") as store:
+        assert store.get_state("com.example.app1", "US")["status"] == "found"
+        assert store.get_validators("com.example.app0", "US")[0] == '"etag"'
+        assert store.get_state("com.example.app9", "FI")["status"] == "missing"
+
+def test_output_row_merger(tmp_path) -> None:
+    first_csv = tmp_path / "first.csv"
+    first_csv.write_text('com.example.a;US;"x;y"\ncom.example.b;US;1\n', encoding="utf-8")
+    second_csv = tmp_path / "second.csv"
+    second_csv.write_text('com.example.a;US;2\ncom.example.c;FI;"quoted ""text"""\n', encoding="utf-8")
+    with OutputRowMerger(str(tmp_path)) as merger:
+        merger.add_rows("missing", [str(first_csv)])
+        merger.add_rows("cached", [str(first_csv), str(second_csv)])
+        merger.keep_latest_of(["missing", "cached"])
+        assert list(merger.iter_rows("cached")) == [["com.example.b", "US", "1"], ["com.example.a", "US", "2"], ["com.example.c", "FI", 'quoted "text"']]
+        assert merger.count("cached") == 3 and merger.count("missing") == 0
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["first.csv", "second.csv"]
@@ -0,0 +1,131 @@
+# These tests focus on the time-based staleness policy picking the fetched pairs that are fetched again
+# They use mocks to simulate requests to the Google Play Store and write the outputs to a temporary folder
+#
+# The tests make sure that:
+# 1. Durations, displayed counts and max age tiers are parsed from their console formats
+# 2. Pairs are stale once their max age has passed, and tiers lower the max age of matching pairs
+# 3. The fetch time is read from the cache file, and pairs without one are stale
+# 4. Only the stale pairs are fetched again, with the csv cache and with the fetch state store
+
+
+
+import time
+import pytest
+from unittest.mock import patch
+from play_store_fetcher import (CACHE_FILE, OUTPUT_FOUND_CSV_FILE, CacheIndex, StalenessPolicy, configure_staleness, fetch_playstore_data_sequentially,
+                                init_checks, open_fetch_state_store, package_needs_refresh, parse_compact_count, parse_duration, parse_max_age_tier,
+                                read_cached_packages)
+from tests.helpers import make_response
+
+NOW = 1735689600.0
+DAY = 86400
+
+@pytest.fixture
+def output_prefix(tmp_path) -> str:
+    input_csv = tmp_path / "input.csv"
+    input_csv.write_text("")
+    init_checks(str(input_csv), f"{tmp_path}/")
+    return f"{tmp_path}/"
+
+def test_parse_duration() -> None:
+    assert parse_duration("90") == 90
+    assert parse_duration("30m") == 1800
+    assert parse_duration("12h") == 12 * 3600
+    assert parse_duration("1.5d") == 1.5 * DAY
+    assert parse_duration("2W") == 14 * DAY
+    with pytest.raises(ValueError):
+        parse_duration("soon")
+
+def test_parse_compact_count() -> None:
+    assert parse_compact_count("10M+") == 10 ** 7
+    assert parse_compact_count("2.64M") == 2.64 * 10 ** 6
+    assert parse_compact_count("1,234") == 1234
+    assert parse_compact_count("5B+") == 5 * 10 ** 9
+    assert parse_compact_count("4.5") == 4.5
+    assert parse_compact_count("Not Found") is None
+
+def test_parse_max_age_tier() -> None:
+    assert parse_max_age_tier("downloads:100M:1d") == ("downloads", 10 ** 8, DAY)
+    assert parse_max_age_tier("last_updated:30d:2d") == ("last_updated", 30 * DAY, 2 * DAY)
+    for invalid_tier in ("popularity:100M:1d", "downloads:many:1d", "downloads:100M"):
+        with pytest.raises(ValueError):
+            parse_max_age_tier(invalid_tier)
+
+def test_is_stale() -> None:
+    policy = StalenessPolicy(7 * DAY)
+    assert policy.is_stale("com.example.app", "US", None, NOW)
+    assert not policy.is_stale("com.example.app", "US", NOW - 6 * DAY, NOW)
+    assert policy.is_stale("com.example.app", "US", NOW - 8 * DAY, NOW)
+
+def test_tiers(tmp_path) -> None:
+    recent_update = time.strftime("%b %d, %Y", time.gmtime(time.time() - 5 * DAY))
+    found_csv = tmp_path / OUTPUT_FOUND_CSV_FILE
+    found_csv.write_text(
+        "Package Name;Data Region;Rating;Reviews;Downloads;Last Updated\n"
+        "com.example.popular;US;4.5;2.1M;500M+;Jan 01, 2020\n"
+        "com.example.quiet;US;4.0;12;100+;Jan 01, 2020\n"
+        f"com.example.active;US;4.0;12;100+;{recent_update}\n"
+        "com.example.fallen;US;4.5;2.1M;500M+;Jan 01, 2020\n"
+        "com.example.fallen;US;4.5;2.1M;1M+;Jan 01, 2020\n", encoding="utf-8")
+    policy = StalenessPolicy(7 * DAY, [parse_max_age_tier("downloads:100M:1d"), parse_max_age_tier("last_updated:30d:2d")])
+    assert policy.load_found_csv(str(found_csv)) == 2
+    assert policy.max_age_for("com.example.popular", "US") == DAY
+    assert policy.max_age_for("com.example.active", "US") == 2 * DAY
+    assert policy.max_age_for("com.example.quiet", "US") == 7 * DAY
+    assert policy.max_age_for("com.example.fallen", "US") == 7 * DAY
+    assert policy.max_age_for("com.example.popular", "FI") == 7 * DAY
+    assert policy.is_stale("com.example.popular", "US", NOW - 2 * DAY, NOW)
+    assert not policy.is_stale("com.example.quiet", "US", NOW - 2 * DAY, NOW)
+
+def test_cache_index_stale_pairs(tmp_path) -> None:
+    (tmp_path / CACHE_FILE).write_text(
+        f"com.example.app;US\n"
+        f"com.example.app;FI;{NOW - 8 * DAY:.0f}\n"
+        f"com.example.app;JP;{NOW - 8 * DAY:.0f}\n"
+        f"com.example.app;JP;{NOW - DAY:.0f}\n"
+        f"com.example.other;US;{NOW - DAY:.0f}\n")
+    with patch("play_store_fetcher.time.time", return_value=NOW):
+        cache = read_cached_packages(f"{tmp_path}/", StalenessPolicy(7 * DAY))
+    assert len(cache) == 4
+    assert cache.stale_count() == 2
+    assert cache.is_stale("com.example.app", "US")
+    assert cache.is_stale("com.example.app", "FI")
+    assert not cache.is_stale("com.example.app", "JP")
+    assert not cache.is_stale("com.example.other", "US")
+    assert not cache.is_stale("com.example.missing", "US")
+    cache.add("com.example.app", "FI")
+    assert not cache.is_stale("com.example.app", "FI")
+    assert cache.stale_count() == 1
+    assert read_cached_packages(f"{tmp_path}/").stale_count() == 0
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request", return_value=make_response(200))
+def test_only_stale_pairs_are_fetched(mock_request, mock_get_info, output_prefix: str, tmp_path) -> None:
+    now = time.time()
+    (tmp_path / CACHE_FILE).write_text(f"com.example.old;US;{now - 8 * DAY:.0f}\ncom.example.new;US;{now - DAY:.0f}\n")
+    cache = read_cached_packages(output_prefix, StalenessPolicy(7 * DAY))
+    fetch_playstore_data_sequentially(output_prefix, cache, ["com.example.old", "com.example.new", "com.example.unseen"], ["US"], False)
+    assert [call.args[0].split("id=")[1].split("&")[0] for call in mock_request.call_args_list] == ["com.example.old", "com.example.unseen"]
+    cache_rows = (tmp_path / CACHE_FILE).read_text().splitlines()
+    assert [row.split(";")[0] for row in cache_rows] == ["com.example.old", "com.example.new", "com.example.old", "com.example.unseen"]
+    assert read_cached_packages(output_prefix, StalenessPolicy(7 * DAY)).stale_count() == 0
+
+@patch("play_store_fetcher.get_app_info_from_html", return_value=("4.5", "1M+", "100K+", "Jan 01, 2025"))
+@patch("play_store_fetcher.send_request", return_value=make_response(200))
+def test_stale_pairs_in_state_store(mock_request, mock_get_info, output_prefix: str, tmp_path) -> None:
+    now = time.time()
+    (tmp_path / CACHE_FILE).write_text(f"com.example.old;US;{now - 8 * DAY:.0f}\ncom.example.new;US;{now - DAY:.0f}\ncom.example.unknown;US\n")
+    configure_staleness(StalenessPolicy(7 * DAY))
+    try:
+        with open_fetch_state_store(output_prefix) as store:
+            assert package_needs_refresh(store, "com.example.old", "US")
+            assert not package_needs_refresh(store, "com.example.new", "US")
+            assert package_needs_refresh(store, "com.example.unknown", "US")
+            fetch_playstore_data_sequentially(output_prefix, store, ["com.example.old", "com.example.new", "com.example.unknown"], ["US"], False)
+            assert not package_needs_refresh(store, "com.example.old", "US")
+    finally:
+        configure_staleness(None)
+    assert mock_request.call_count == 2
+    with open_fetch_state_store(output_prefix) as store:
+        assert not package_needs_refresh(store, "com.example.old", "US")
+    assert not package_needs_refresh(CacheIndex([("com.example.old", "US")]), "com.example.old", "US")